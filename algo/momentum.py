@@ -1,4 +1,6 @@
 from cdefs.defines import TradeType_t, OrderType_t
+from cdefs.timer_queue import INFINITE_TIME
+from common_data_structures.rolling_window import RollingWindow
 
 
 class Momentum:
@@ -7,6 +9,8 @@ class Momentum:
     Similar momentum behaviour for prices going down.
     '''
 
+    supports_batch_updates = True  # See get_batch_end_timestamp
+
     def __init__(self,
                  watch,
                  secid,
@@ -15,7 +19,9 @@ class Momentum:
                  int_order_to_place,
                  start_midnight_seconds,
                  order_manager,
-                 execution_window=2600):
+                 execution_window=7200,
+                 threshold=0.005,
+                 lookback=2):
         self.secid = secid
         self.trade_type = trade_type
         self.order_type = order_type
@@ -24,51 +30,74 @@ class Momentum:
         self.watch = watch
         self.start_midnight_seconds = start_midnight_seconds
         self.execution_window = execution_window
-        self.hist_minute_bars = []
         self.arrival_price = -1
-        self.execution_window = 7200
         self.order_sent = False
-        # we keep last 10 minute bars
-        self.hist_minute_bar_size = 2
+        # Price changes within threshold are not a movement, see minute_bar_movement
+        self.threshold = threshold
+
+        # the signal needs the last lookback minute bars all moving the same way
+        self.hist_minute_bar_size = lookback
+        # Movement of each of the latest minute bars, computed once per bar
+        self.hist_movements = RollingWindow(lookback)
 
-    def _set_arrival_price(self):
+    def _set_arrival_price(self, minute_bar):
         '''
         We compare the performance of execution algorithm against the market price when execution algorithm starts.
         '''
-        op = self.hist_minute_bars[-1].open
-        self.arrival_price = (op.bid_price + op.ask_price) / 2
+        self.arrival_price = minute_bar.open_mid_price
+
+    def get_batch_end_timestamp(self, secid, market_info):
+        '''
+        Before the start time the minute bars only go to the history, they can come in blocks ( see
+        MarketEventListener ). Once the order is sent they are not looked at anymore
+        '''
+        if self.order_sent:
+            return INFINITE_TIME
+        if self.watch.secs_since_midnight < self.start_midnight_seconds:
+            return self.watch.last_ref_timestamp + self.start_midnight_seconds
+        return 0
+
+    def on_market_update_batch(self, secid, market_info, periodic_bars, begin, end):
+        '''
+        Gets called with blocks of minute bars before the start time, only the movements of the latest ones are kept
+        '''
+        assert (secid == self.secid)
+        if self.order_sent:
+            return
+        movements = periodic_bars.annotate_derived_columns().derived.get_movements(self.threshold)
+        for index in range(max(begin, end - self.hist_minute_bar_size), end):
+            self.hist_movements.push(movements.item(index))
 
     def on_market_update(self, secid, market_info):
         '''
         Gets called on every minute bar
         '''
         assert (secid == self.secid)
-        self.hist_minute_bars.append(market_info.get_latest_one_minute_bar())
+        minute_bar = market_info.get_latest_one_minute_bar()
 
-        # maintain the latest 2 one minute bars.
-        while (len(self.hist_minute_bars) > self.hist_minute_bar_size):
-            del self.hist_minute_bars[0]
+        # maintain the movements of the latest hist_minute_bar_size one minute bars.
+        self.hist_movements.push(self.minute_bar_movement(minute_bar))
 
         if self.watch.secs_since_midnight < self.start_midnight_seconds or self.order_sent:
             return
 
         if self.arrival_price == -1:
-            self._set_arrival_price()
+            self._set_arrival_price(minute_bar)
 
         self.trading_logic()
 
     def signal(self):
         '''
-        If last 2 minute bars were positive, we assume that there is up trend. We buy then. Similarly for sell.
+        If last hist_minute_bar_size ( lookback, 2 by default ) minute bars were positive, we assume that there is up
+        trend. We buy then. Similarly for sell.
         '''
-        if len(self.hist_minute_bars) < self.hist_minute_bar_size:
+        if not self.hist_movements.is_full():
             return False
 
-        signal = self.minute_bar_movement(self.hist_minute_bars[-1]) + self.minute_bar_movement(self.hist_minute_bars[
-            -2])
-        if self.trade_type == TradeType_t.Buy and signal == 2:
+        signal = self.hist_movements.sum
+        if self.trade_type == TradeType_t.Buy and signal == self.hist_minute_bar_size:
             return True
-        elif self.trade_type == TradeType_t.Sell and signal == -2:
+        elif self.trade_type == TradeType_t.Sell and signal == -self.hist_minute_bar_size:
             return True
         return False
 
@@ -89,18 +118,6 @@ class Momentum:
     def minute_bar_movement(self, minute_bar):
         '''
         It returns whether the price has increased or decreased. It uses market weighted price as a measure of price.
+        The bar provides it ( computed once for all the bars when they are loaded, see DerivedBarColumns ).
         '''
-        op = minute_bar.open
-        cl = minute_bar.close
-        open_price = (op.bid_price * op.ask_size + op.ask_price * op.bid_size) / (op.bid_size + op.ask_size)
-        close_price = (cl.bid_price * cl.ask_size + cl.ask_price * cl.bid_size) / (cl.bid_size + cl.ask_size)
-        diff = close_price - open_price
-
-        if diff > 0.005:
-            signal = 1
-        elif diff < -0.005:
-            signal = -1
-        else:
-            signal = 0
-
-        return signal
+        return minute_bar.get_movement(self.threshold)
@@ -1,12 +1,14 @@
 def enum(*sequential, **named):
     enums = dict(zip(sequential, range(len(sequential))), **named)
-    forward_dict = dict((key, value) for key, value in enums.iteritems())
-    reverse_dict = dict((value, key) for key, value in enums.iteritems())
+    forward_dict = dict((key, value) for key, value in enums.items())
+    reverse_dict = dict((value, key) for key, value in enums.items())
     enums['forward'] = forward_dict
     enums['reverse'] = reverse_dict
     return type('Enum', (), enums)
 
 
+MAX_NUM_SECURITIES = 1024  # Size of the arrays indexed on secid ( market books, orders )
+
 MarketEvent_t = enum('Invalid', 'OneMinuteBar')
 
 TradingStatus_t = enum('Invalid', 'PreOpen', 'Trading', 'PostClose')
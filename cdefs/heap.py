@@ -1,26 +1,41 @@
 import heapq
+import itertools
 
 # Wrapper class around heapq so that we can directly pass the key and dont have to make tuples
+# Items with equal keys come out in the order they were pushed, and are never compared themselves
 class Heap( object ):
     def __init__( self, initial = None, key = lambda x : x ):
         self.key = key
+        self._sequence = itertools.count( )
         if initial:
-            self._data = [ ( key( item ), item ) for item in initial ]
+            self._data = [ ( key( item ), next( self._sequence ), item ) for item in initial ]
             heapq.heapify( self._data )
         else:
             self._data = [ ]
 
     def push( self, item ):
-        heapq.heappush( self._data, ( self.key( item ), item ) )
+        heapq.heappush( self._data, ( self.key( item ), next( self._sequence ), item ) )
 
     def pop( self ):
         if len( self._data ) > 0:
-            return heapq.heappop( self._data )[ 1 ]    
+            return heapq.heappop( self._data )[ 2 ]    
         else:
             return None
 
     def top( self ):
-        return self._data[ 0 ][ 1 ]
+        return self._data[ 0 ][ 2 ]
+
+    # The item which would be on top once the top is popped, None if there is none. Does not modify the heap
+    def second( self ):
+        data = self._data
+        if len( data ) > 2:
+            # The tuples compare on the keys then the sequence numbers, never on the items
+            return ( data[ 1 ] if data[ 1 ] < data[ 2 ] else data[ 2 ] )[ 2 ]
+        return data[ 1 ][ 2 ] if len( data ) == 2 else None
+
+    # Pops the top and pushes item in a single sift ( heapq.heapreplace ), returns the popped item
+    def replace_top( self, item ):
+        return heapq.heapreplace( self._data, ( self.key( item ), next( self._sequence ), item ) )[ 2 ]
       
     def size( self ):
         return len( self._data )
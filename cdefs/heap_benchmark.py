@@ -0,0 +1,64 @@
+#/usr/bin/env python
+'''
+Micro-benchmark of the dispatcher step with Heap, pop + push against replace_top as in HistoricalDispatcher.run.
+
+Each fake source emits one event per minute with a random offset, like minute bar file sources interleaved minute by
+minute. A step processes the earliest source till the next source's timestamp and re-keys it, as in
+HistoricalDispatcher.run.
+'''
+
+from cdefs.heap import Heap
+
+import argparse
+import random
+import timeit
+
+
+class FakeSource(object):
+    def __init__(self, offset):
+        self.next_event_timestamp = offset
+
+    def process_events_till(self, end_time):
+        while self.next_event_timestamp <= end_time:
+            self.next_event_timestamp += 60
+
+
+def make_sources(num_sources):
+    random.seed(num_sources)
+    return [FakeSource(random.randint(0, 59)) for i in range(num_sources)]
+
+
+def run_heap(num_sources, num_steps):
+    heap = Heap(make_sources(num_sources), lambda x: x.next_event_timestamp)
+    for step in range(num_steps):
+        top = heap.pop()
+        top.process_events_till(heap.top().next_event_timestamp)
+        heap.push(top)
+
+
+def run_heap_replace_top(num_sources, num_steps):
+    heap = Heap(make_sources(num_sources), lambda x: x.next_event_timestamp)
+    for step in range(num_steps):
+        top = heap.top()
+        top.process_events_till(heap.second().next_event_timestamp)
+        heap.replace_top(top)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the dispatcher step with Heap pop + push and replace_top')
+    parser.add_argument('--num_sources', type=int, nargs='+', default=[10, 100, 10000])
+    parser.add_argument('--num_steps', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print('{:>12} {:>18} {:>18}'.format('sources', 'pop+push us', 'replace_top us'))
+    for num_sources in args.num_sources:
+        times = [
+            min(timeit.repeat(lambda: run(num_sources, args.num_steps), number=1, repeat=args.repeat))
+            for run in (run_heap, run_heap_replace_top)
+        ]
+        print('{:>12} {:>18.3f} {:>18.3f}'.format(num_sources, *[x / args.num_steps * 1e6 for x in times]))
+
+
+if __name__ == '__main__':
+    main()
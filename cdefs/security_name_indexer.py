@@ -1,3 +1,6 @@
+from cdefs.defines import MAX_NUM_SECURITIES
+
+
 ## @brief Singleton class to map/convert a security's shortcode and exchange symbol to an id and vice versa.
 #  Once we have mapped the symbol to an id, we can work just with id's for all securities, and get
 #  the symbols using this class whenever required
@@ -8,6 +11,7 @@ class SecurityNameIndexer():
 
     def __init__(self):
         self.secname_dict = {}
+        self.shortcode_to_id = {}
         self.secname_list = []
         self.shortcode_list = []
         self.tradable_shortcode_list = []
@@ -26,10 +30,21 @@ class SecurityNameIndexer():
             SecurityNameIndexer.unique_instance = None
         return SecurityNameIndexer.unique_instance
 
+    ## @brief Adds a security, returns its id ( the existing id if the shortcode has already been added )
     def add_symbol(self, shortcode):
+        if shortcode in self.shortcode_to_id:
+            return self.shortcode_to_id[shortcode]
+        if len(self.shortcode_list) >= MAX_NUM_SECURITIES:
+            raise ValueError('SecurityNameIndexer : cannot add more than {} securities'.format(MAX_NUM_SECURITIES))
+        self.shortcode_to_id[shortcode] = len(self.shortcode_list)
         self.secname_list.append(None)
         self.shortcode_list.append(shortcode)
         self.tradable_shortcode_list.append(shortcode)
+        return self.shortcode_to_id[shortcode]
+
+    ## @brief Returns the id of a shortcode, None if it has not been added
+    def get_id_from_shortcode(self, shortcode):
+        return self.shortcode_to_id.get(shortcode)
 
     def get_shortcode_from_id(self, id):
         if id >= len(self.shortcode_list):
@@ -0,0 +1,78 @@
+import heapq
+import itertools
+
+INFINITE_TIME = float('inf')
+
+
+## @brief Handle on a timer of the watch ( see Watch.add_timer ), to pass to Watch.cancel_timer
+#
+#  fire_time is in unix seconds. period is None for one-shot timers, in seconds for periodic timers.
+#  Daily timers have daily_secs_since_midnight set instead and are kept with the daily watch listeners.
+#
+class Timer(object):
+    __slots__ = ('fire_time', 'period', 'daily_secs_since_midnight', 'listener', 'cancelled', 'queued')
+
+    def __init__(self, fire_time, listener, period=None, daily_secs_since_midnight=None):
+        self.fire_time = fire_time
+        self.period = period
+        self.daily_secs_since_midnight = daily_secs_since_midnight
+        self.listener = listener
+        self.cancelled = False
+        self.queued = False  # In a TimerQueue, one-shot timers leave it once they fire
+
+    ## @brief Daily timers sit in the list of daily watch listeners of the watch
+    def on_daily_time_update(self, current_time):
+        if not self.cancelled:
+            self.listener.on_timer_update(self, current_time)
+
+
+##
+# Min heap of timers on their fire time
+#
+# Insertion is O( log n ). Cancellation is O( 1 ) : the timer is only flagged, and skipped when it reaches the top.
+# Cancelling a timer which is not in the heap anymore ( a one-shot timer which fired ) only flags it.
+# The heap is rebuilt once more than half of its entries are cancelled, so cancelled timers do not pile up.
+# Timers with the same fire time come out in the order they were pushed.
+#
+class TimerQueue(object):
+    def __init__(self):
+        self._data = []  # ( fire_time, sequence number, timer )
+        self._sequence = itertools.count()
+        self.num_cancelled = 0
+
+    def __len__(self):
+        return len(self._data) - self.num_cancelled
+
+    def push(self, timer):
+        timer.queued = True
+        heapq.heappush(self._data, (timer.fire_time, next(self._sequence), timer))
+
+    def cancel(self, timer):
+        if timer.cancelled:
+            return
+        timer.cancelled = True
+        if not timer.queued:  # Already fired, nothing left in the heap
+            return
+        self.num_cancelled += 1
+        if self.num_cancelled > len(self._data) // 2:
+            self._data = [entry for entry in self._data if not entry[2].cancelled]
+            heapq.heapify(self._data)
+            self.num_cancelled = 0
+
+    def _drop_cancelled_top(self):
+        while self._data and self._data[0][2].cancelled:
+            heapq.heappop(self._data)
+            self.num_cancelled -= 1
+
+    ## @brief Fire time of the next timer, INFINITE_TIME if there is none
+    def top_time(self):
+        self._drop_cancelled_top()
+        return self._data[0][0] if self._data else INFINITE_TIME
+
+    def pop(self):
+        self._drop_cancelled_top()
+        if not self._data:
+            return None
+        timer = heapq.heappop(self._data)[2]
+        timer.queued = False
+        return timer
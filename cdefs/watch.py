@@ -1,26 +1,38 @@
+import bisect
 import pytz
 import logging
 import datetime
+from cdefs.timer_queue import INFINITE_TIME, Timer, TimerQueue
 from cdefs.watch_listener import DailyWatchListenerPair, DateChangeListener, YearChangeListener, TimePeriodWatchListener
 from utils.datetime_convertor import get_unix_timestamp_from_hhmm_tz, get_custom_est_midnight_time_from_date, get_custom_est_ref_time_from_unix_timestamp, get_custom_est_date_from_unix_timestamp
+from utils.datetime_convertor import (get_custom_est_date_end_unix_seconds, get_custom_est_date_from_unix_seconds,
+                                      get_custom_est_ref_unix_seconds_from_unix_seconds, get_unix_seconds,
+                                      get_unix_seconds_from_datetime, get_utc_datetime_from_unix_seconds)
 
 USING_EST_CUSTOM_TRADING_DATE = 1
 
+INITIAL_DATE = datetime.date(1900, 1, 1)  # current_date of the watch before the first market event
+
 
 class Watch(object):
     unique_instance = None
+    integer_clock = False  # If True, market events are timestamped with integer unix seconds, see IntegerClockWatch
 
     def __init__(self, start_date, end_date):
         self.current_time = datetime.datetime.fromtimestamp(0).replace(tzinfo=pytz.UTC)
         self.last_ref_time = datetime.datetime.fromtimestamp(0).replace(tzinfo=pytz.UTC)
-        self.current_date = datetime.date(1900, 1, 1)
+        self.last_ref_timestamp = get_unix_seconds_from_datetime(self.last_ref_time)  # Unix seconds of last_ref_time
+        self.current_date = INITIAL_DATE
         self.secs_since_midnight = 0
         self.short_duration = 300  # 5 minutes
         self.long_duration = 3600  # 1 hour
         self.secs_since_midnight_short_duration_updated = 0
         self.secs_since_midnight_long_duration_updated = 0
         self.current_idx = 0
-        self.daily_watch_listeners = []
+        self.daily_watch_listeners = []  # ( secs_since_midnight, listener ) sorted on secs_since_midnight
+        self.daily_watch_listener_secs = []  # The secs_since_midnight of daily_watch_listeners, for bisect
+        self.timer_queue = TimerQueue()  # One-shot and periodic timers
+        self.next_timer_timestamp = INFINITE_TIME  # Unix seconds of the next timer
         self.inactive_daily_watch_listeners = []
         self.date_change_watch_listeners = []
         self.year_change_watch_listeners = []
@@ -34,10 +46,17 @@ class Watch(object):
             self.start_time = get_unix_timestamp_from_hhmm_tz(start_date, 0, pytz.timezone('UTC'))
             self.end_time = get_unix_timestamp_from_hhmm_tz(end_date, 2359, pytz.timezone('UTC'))
 
+    ## @brief Builds a new watch, an IntegerClockWatch if integer_clock ( not registered as the unique instance )
+    @staticmethod
+    def Create(start_date, end_date, integer_clock=False):
+        if integer_clock:
+            return IntegerClockWatch(start_date, end_date)
+        return Watch(start_date, end_date)
+
     @staticmethod
-    def SetUniqueInstance(start_date, end_date):
+    def SetUniqueInstance(start_date, end_date, integer_clock=False):
         if Watch.unique_instance is None:
-            Watch.unique_instance = Watch(start_date, end_date)
+            Watch.unique_instance = Watch.Create(start_date, end_date, integer_clock)
         return Watch.unique_instance
 
     @staticmethod
@@ -54,14 +73,98 @@ class Watch(object):
     #  @param hhmmss The time at which the listener wants to be notified
     #  @param listener The pointer to the listener object
     #
+    #  Listeners added for the same time are notified in the order they were added. A listener added during a date,
+    #  after its time, is only notified from the next date on, and so are all the listeners added before the first
+    #  market event.
+    #
     def add_daily_watch_listener(self, hhmmss, listener):
-        secs_since_midnight = (hhmmss % 100) + (((hhmmss / 100) % 100) + (((hhmmss / 10000) % 100) * 60)) * 60
-        i = 0
-        for i in range(len(self.daily_watch_listeners)):
-            if self.daily_watch_listeners[i][0] >= secs_since_midnight:
-                break
+        secs_since_midnight = (hhmmss % 100) + (((hhmmss // 100) % 100) + (((hhmmss // 10000) % 100) * 60)) * 60
+        i = bisect.bisect_right(self.daily_watch_listener_secs, secs_since_midnight)
+        self.daily_watch_listener_secs.insert(i, secs_since_midnight)
         self.daily_watch_listeners.insert(i, (secs_since_midnight, listener))  # insert at correct place
-        self.current_idx += 1
+        if secs_since_midnight < self.secs_since_midnight or self.current_date == INITIAL_DATE:
+            self.current_idx += 1  # Already past, i <= current_idx
+
+    ## @brief Adds a one-shot timer, listener.on_timer_update( timer, current_time ) is called once the time of the
+    #  market events reaches fire_time, before the event itself is processed
+    #
+    #  @param fire_time tz aware datetime or unix seconds
+    #  @param listener TimerListener
+    #  @return The Timer, which can be passed to cancel_timer
+    #
+    def add_timer(self, fire_time, listener):
+        timer = Timer(get_unix_seconds(fire_time), listener)
+        self._push_timer(timer)
+        return timer
+
+    ## @brief Adds a timer which fires every period seconds, from first_fire_time ( default current time + period )
+    def add_periodic_timer(self, period, listener, first_fire_time=None):
+        if period <= 0:
+            raise ValueError('Watch : period of a periodic timer should be positive')
+        if first_fire_time is None:
+            first_fire_time = self._get_current_timestamp() + period
+        timer = Timer(get_unix_seconds(first_fire_time), listener, period=period)
+        self._push_timer(timer)
+        return timer
+
+    ## @brief Adds a timer which fires at hhmmss ( since midnight ) on every date, like a daily watch listener
+    def add_daily_timer(self, hhmmss, listener):
+        secs_since_midnight = (hhmmss % 100) + (((hhmmss // 100) % 100) + (((hhmmss // 10000) % 100) * 60)) * 60
+        timer = Timer(None, listener, daily_secs_since_midnight=secs_since_midnight)
+        self.add_daily_watch_listener(hhmmss, timer)
+        return timer
+
+    ## @brief Cancels a timer returned by add_timer, add_periodic_timer or add_daily_timer, in O( 1 )
+    def cancel_timer(self, timer):
+        if timer.daily_secs_since_midnight is not None:
+            timer.cancelled = True  # Stays in the daily listeners, which skip it
+        else:
+            self.timer_queue.cancel(timer)
+            self.next_timer_timestamp = self.timer_queue.top_time()
+
+    def _push_timer(self, timer):
+        self.timer_queue.push(timer)
+        self.next_timer_timestamp = min(self.next_timer_timestamp, timer.fire_time)
+
+    def _get_current_timestamp(self):
+        return get_unix_seconds_from_datetime(self.current_time)
+
+    ## @brief Sets the time to secs_since_midnight of the current date, to notify listeners at the time they asked for
+    def _set_fake_time(self, secs_since_midnight):
+        self.current_time = self.last_ref_time + datetime.timedelta(0, secs_since_midnight)
+        self.secs_since_midnight = secs_since_midnight
+
+    ## @brief Notifies, in time order, the daily listeners due before end_secs_since_midnight ( all the pending ones if
+    #  None ) and the timers due at or before timer_end_secs_since_midnight ( none if None ), with fake timing
+    #  Daily listeners are notified before timers of the same time.
+    #
+    def _notify_daily_watch_listeners_and_timers(self, end_secs_since_midnight, timer_end_secs_since_midnight):
+        daily_watch_listeners = self.daily_watch_listeners
+        if timer_end_secs_since_midnight is None:
+            timer_end_secs_since_midnight = -INFINITE_TIME
+        while True:
+            timer_secs = self.next_timer_timestamp - self.last_ref_timestamp
+            if timer_secs > timer_end_secs_since_midnight:
+                timer_secs = INFINITE_TIME
+            daily_secs = INFINITE_TIME
+            if self.current_idx < len(daily_watch_listeners):
+                daily_secs = daily_watch_listeners[self.current_idx][0]
+                if end_secs_since_midnight is not None and daily_secs >= end_secs_since_midnight:
+                    daily_secs = INFINITE_TIME
+            if daily_secs == INFINITE_TIME and timer_secs == INFINITE_TIME:
+                return
+            if daily_secs <= timer_secs:
+                self._set_fake_time(daily_secs)
+                daily_watch_listeners[self.current_idx][1].on_daily_time_update(self.current_time)
+                self.current_idx += 1
+            else:
+                timer = self.timer_queue.pop()
+                self._set_fake_time(timer_secs)
+                if timer.period is not None:
+                    timer.fire_time += timer.period
+                    self.timer_queue.push(timer)
+                self.next_timer_timestamp = self.timer_queue.top_time()
+                timer.listener.on_timer_update(timer, self.current_time)
 
     ## @brief Function to be called to add as a listener of the watch, to be notified on every date change
     #  @param listener The pointer to the listener object
@@ -77,14 +180,41 @@ class Watch(object):
     ## @brief If the date changes or the simulation ends, we need to clear the list of daily listeners
     #  by calling each one of them in order
     #
-    def clear_pending_daily_watch_listeners(self):
-        while self.current_idx < len(self.daily_watch_listeners):
-            top_dwlp = self.daily_watch_listeners[self.current_idx]
-            self.current_time = self.last_ref_time + datetime.timedelta(0, top_dwlp[0]
-                                                                        )  # These are fake, not based on market data
-            self.secs_since_midnight = datetime.timedelta(0, top_dwlp[0])
-            top_dwlp[1].on_daily_time_update(self.current_time)
-            self.current_idx += 1
+    #  Timers due before end_time ( the start of the new date ) are called in time order with them. At the end of
+    #  the simulation ( end_time None ), timers are called up to the time of the last pending daily listener.
+    #
+    def clear_pending_daily_watch_listeners(self, end_time=None):
+        if end_time is not None:
+            timer_end_secs_since_midnight = get_unix_seconds(end_time) - self.last_ref_timestamp
+        elif self.current_idx < len(self.daily_watch_listeners):
+            timer_end_secs_since_midnight = self.daily_watch_listeners[-1][0]
+        else:
+            timer_end_secs_since_midnight = None
+        self._notify_daily_watch_listeners_and_timers(None, timer_end_secs_since_midnight)  # Fake, not market data
+
+    ## @brief Unix seconds of the first market event time at which the watch does more than moving its time : a date
+    #  change ( or date check ), a daily listener, a timer or a time period listener. The events before it can all be
+    #  applied at once, by calling on_new_market_event with the last of them only
+    #  ( see MarketBook.on_new_minute_bar_batch )
+    #
+    def get_next_action_timestamp(self):
+        next_action_timestamp = min(self._get_next_date_check_timestamp(), self.next_timer_timestamp)
+        if self.current_idx < len(self.daily_watch_listeners):  # Notified once secs_since_midnight is past their time
+            daily_secs = int(self.daily_watch_listeners[self.current_idx][0])
+            next_action_timestamp = min(next_action_timestamp, self.last_ref_timestamp + daily_secs + 1)
+        if self.short_duration_watch_listeners:
+            next_action_timestamp = min(
+                next_action_timestamp,
+                self.last_ref_timestamp + self.secs_since_midnight_short_duration_updated + self.short_duration)
+        if self.long_duration_watch_listeners:
+            next_action_timestamp = min(
+                next_action_timestamp,
+                self.last_ref_timestamp + self.secs_since_midnight_long_duration_updated + self.long_duration)
+        return next_action_timestamp
+
+    ## @brief Unix seconds from which on_new_market_event looks for a new date
+    def _get_next_date_check_timestamp(self):
+        return self.last_ref_timestamp + 82800
 
     ## @brief On any new event file source should call this function of the watch to update it
     #
@@ -127,16 +257,10 @@ class Watch(object):
         # Therefore, we cannot update to latest_time and new_date even if the date has changed till we go
         # through the pending listeners
         if date_has_changed:
-            self.clear_pending_daily_watch_listeners()
+            self.clear_pending_daily_watch_listeners(new_last_ref_time)
             self.current_idx = 0  # Now that the date has changed, we need to start again
-        elif self.current_idx < len(self.daily_watch_listeners):
-            while ((self.current_idx < len(self.daily_watch_listeners)) and
-                   (self.daily_watch_listeners[self.current_idx][0] < new_secs_since_midnight)):
-                self.current_time = new_last_ref_time + datetime.timedelta(
-                    0, self.daily_watch_listeners[self.current_idx][0])
-                self.secs_since_midnight = self.daily_watch_listeners[self.current_idx][0]
-                self.daily_watch_listeners[self.current_idx][1].on_daily_time_update(self.current_time)
-                self.current_idx += 1
+        elif (self.current_idx < len(self.daily_watch_listeners) or self.next_timer_timestamp != INFINITE_TIME):
+            self._notify_daily_watch_listeners_and_timers(new_secs_since_midnight, new_secs_since_midnight)
 
         if date_has_changed:
             # Check if year has changed
@@ -144,6 +268,7 @@ class Watch(object):
 
             self.current_date = new_date  # Update date
             self.last_ref_time = new_last_ref_time  # Update last ref time
+            self.last_ref_timestamp = get_unix_seconds_from_datetime(new_last_ref_time)
             self.current_time = self.last_ref_time
             self.secs_since_midnight = 0  # TODO check
             self.secs_since_midnight_short_duration_updated = 0
@@ -153,14 +278,8 @@ class Watch(object):
             self.broadcast_date_change(new_date)
 
             # If the date has changed, then we need to move to correct index in vector
-            # Here we just need to move to correct index
-            while ((self.current_idx < len(self.daily_watch_listeners)) and
-                   (self.daily_watch_listeners[self.current_idx][0] < new_secs_since_midnight)):
-                self.current_time = new_last_ref_time + datetime.timedelta(
-                    0, self.daily_watch_listeners[self.current_idx][0])  # call the listener by simulating fake time
-                self.secs_since_midnight = self.daily_watch_listeners[self.current_idx][0]
-                self.daily_watch_listeners[self.current_idx][1].on_daily_time_update(self.current_time)
-                self.current_idx += 1
+            # Here we just need to move to correct index, calling the listeners by simulating fake time
+            self._notify_daily_watch_listeners_and_timers(new_secs_since_midnight, new_secs_since_midnight)
 
         ## We could not update these earlier because we were simulating fake events
         # Update secs_since_midnight
@@ -180,3 +299,102 @@ class Watch(object):
             self.secs_since_midnight_long_duration_updated = self.secs_since_midnight
             for listener in self.long_duration_watch_listeners:
                 listener.on_time_period_update(self.current_time)
+
+
+##
+# Watch which holds the time as integer unix seconds and secs_since_midnight as an int
+#
+# on_new_market_event takes the unix seconds of the event ( file sources pass them instead of datetimes when
+# watch.integer_clock is set ). The date can only change once the time reaches next_session_timestamp, which is
+# recomputed on every date change, so every other event costs a few integer comparisons.
+# current_time and last_ref_time are only built as datetimes when they are read, e.g. for the daily and time period
+# listeners. Dates, reference times and listener notifications are the same as with Watch, as long as the events
+# are dispatched in time order.
+#
+class IntegerClockWatch(Watch):
+    integer_clock = True
+
+    def __init__(self, start_date, end_date):
+        Watch.__init__(self, start_date, end_date)
+        self.current_timestamp = 0  # Unix seconds of current_time
+        self.last_ref_timestamp = 0  # Unix seconds of last_ref_time
+        self.next_session_timestamp = 0  # Events before this time cannot change the date
+
+    @property
+    def current_time(self):
+        return get_utc_datetime_from_unix_seconds(self.current_timestamp)
+
+    @current_time.setter
+    def current_time(self, value):
+        self.current_timestamp = get_unix_seconds_from_datetime(value)
+
+    @property
+    def last_ref_time(self):
+        return get_utc_datetime_from_unix_seconds(self.last_ref_timestamp)
+
+    @last_ref_time.setter
+    def last_ref_time(self, value):
+        self.last_ref_timestamp = get_unix_seconds_from_datetime(value)
+
+    def _get_current_timestamp(self):
+        return self.current_timestamp
+
+    def _set_fake_time(self, secs_since_midnight):
+        self.current_timestamp = self.last_ref_timestamp + secs_since_midnight
+        self.secs_since_midnight = secs_since_midnight
+
+    ## @brief Moves to the trading date of latest_timestamp if it is not the current date, and computes the next
+    #  time at which the date can change : once the current trading date has ended and, like Watch, at least
+    #  82800 seconds after the reference time
+    #
+    def _update_date(self, latest_timestamp):
+        new_date = get_custom_est_date_from_unix_seconds(latest_timestamp)
+        if new_date != self.current_date:
+            new_last_ref_timestamp = get_custom_est_ref_unix_seconds_from_unix_seconds(latest_timestamp)
+            # Call all the pending listeners of the previous date in time sorted order, with fake timing
+            self.clear_pending_daily_watch_listeners(new_last_ref_timestamp)
+            self.current_idx = 0  # Now that the date has changed, we need to start again
+
+            self.current_date = new_date
+            self.last_ref_timestamp = new_last_ref_timestamp
+            self.current_timestamp = self.last_ref_timestamp
+            self.secs_since_midnight = 0
+            self.secs_since_midnight_short_duration_updated = 0
+            self.secs_since_midnight_long_duration_updated = 0
+
+            # Notify the listeners that the date has changed
+            self.broadcast_date_change(new_date)
+        self.next_session_timestamp = max(get_custom_est_date_end_unix_seconds(self.current_date),
+                                          self.last_ref_timestamp + 82800)
+
+    def _get_next_date_check_timestamp(self):
+        return self.next_session_timestamp
+
+    ## @brief On any new event file source should call this function of the watch to update it
+    #  @param latest_timestamp The time associated with the new market event, as integer unix seconds
+    #
+    def on_new_market_event(self, latest_timestamp):
+        if latest_timestamp >= self.next_session_timestamp:
+            self._update_date(latest_timestamp)
+
+        new_secs_since_midnight = latest_timestamp - self.last_ref_timestamp
+        # Call the daily listeners and timers which are due by simulating fake time
+        if (latest_timestamp >= self.next_timer_timestamp
+                or (self.current_idx < len(self.daily_watch_listeners)
+                    and self.daily_watch_listeners[self.current_idx][0] < new_secs_since_midnight)):
+            self._notify_daily_watch_listeners_and_timers(new_secs_since_midnight, new_secs_since_midnight)
+
+        self.secs_since_midnight = new_secs_since_midnight
+        self.current_timestamp = latest_timestamp
+
+        # Notify Short Duration Listeners
+        if self.secs_since_midnight >= self.secs_since_midnight_short_duration_updated + self.short_duration:
+            self.secs_since_midnight_short_duration_updated = self.secs_since_midnight
+            for listener in self.short_duration_watch_listeners:
+                listener.on_time_period_update(self.current_time)
+
+        # Notify Long Duration Listeners
+        if self.secs_since_midnight >= self.secs_since_midnight_long_duration_updated + self.long_duration:
+            self.secs_since_midnight_long_duration_updated = self.secs_since_midnight
+            for listener in self.long_duration_watch_listeners:
+                listener.on_time_period_update(self.current_time)
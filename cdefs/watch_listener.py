@@ -34,3 +34,11 @@ class DailyWatchListener:
         pass
 
 DailyWatchListenerPair = namedtuple( 'DailyWatchListenerPair', 'secs_since_midnight daily_watch_listener' )
+
+## @brief Provides an interface for listeners of the timers of the watch ( see Watch.add_timer )
+class TimerListener:
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def on_timer_update( self, timer, current_time ):
+        pass
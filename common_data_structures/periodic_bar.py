@@ -1,7 +1,32 @@
+from utils.datetime_convertor import get_utc_datetime_from_unix_seconds
+
 INVALID_VALUE = -1
 
+## @brief Mid price of a quote
+def get_mid_price( quote ):
+    return ( quote.bid_price + quote.ask_price ) / 2
+
+## @brief Size weighted ( micro ) price of a quote : the bid and ask prices weighted by the size on the other side,
+#  nan if there is no size at all
+#
+def get_micro_price( quote ):
+    total_size = quote.bid_size + quote.ask_size
+    if total_size == 0:
+        return float( 'nan' )
+    return ( quote.bid_price * quote.ask_size + quote.ask_price * quote.bid_size ) / total_size
+
+## @brief Movement of a price change : 1 if it is above threshold, -1 if it is below -threshold, else 0
+def get_movement( price_change, threshold ):
+    if price_change > threshold:
+        return 1
+    elif price_change < -threshold:
+        return -1
+    return 0
+
 ## @brief Captures an intraday best quote,i.e. the bid/ask prices/sizes
 class Quote( object ):
+    __slots__ = ( 'bid_price', 'bid_size', 'ask_price', 'ask_size' )
+
     def __init__( self, bid_price, bid_size, ask_price, ask_size ):
         self.bid_price = bid_price
         self.bid_size = bid_size
@@ -18,6 +43,8 @@ class Quote( object ):
         return ( self.bid_price > 0 and self.ask_price > 0 and self.bid_size > 0 and self.ask_size > 0 )
 
 class PeriodicBar( object ):
+    __slots__ = ( 'open', 'close', 'high', 'low', 'volume', 'ts' )
+
     def __init__( self, open, close, high, low, volume, ts ):
         self.open = open
         self.close = close
@@ -32,7 +59,135 @@ class PeriodicBar( object ):
         self.high = INVALID_VALUE
         self.low = INVALID_VALUE
         self.volume = INVALID_VALUE
-        self.ts = 0 
+        self.ts = 0
+
+    def is_valid( self ):
+        return ( self.low > 0 and self.high > 0 and self.open.is_valid( ) and self.close.is_valid( ) and
+                 self.volume >= 0 )
+
+    # Derived quantities, computed from the quotes on every call ( PeriodicBarView reads them precomputed )
+    @property
+    def open_mid_price( self ):
+        return get_mid_price( self.open )
+
+    @property
+    def mid_price( self ):
+        return get_mid_price( self.close )
+
+    @property
+    def open_micro_price( self ):
+        return get_micro_price( self.open )
+
+    @property
+    def micro_price( self ):
+        return get_micro_price( self.close )
+
+    @property
+    def spread( self ):
+        return self.close.ask_price - self.close.bid_price
+
+    @property
+    def bar_return( self ):
+        return self.mid_price / self.open_mid_price - 1
+
+    ## @brief Movement ( +1 / -1 / 0 ) of the micro price over the bar, see get_movement
+    def get_movement( self, threshold ):
+        return get_movement( self.micro_price - self.open_micro_price, threshold )
+
+## @brief Read only Quote over a tuple of ( bid_price, bid_size, ask_price, ask_size ) columns at a given index
+class QuoteView( object ):
+    __slots__ = ( '_columns', '_index' )
+
+    def __init__( self, columns, index ):
+        self._columns = columns
+        self._index = index
+
+    @property
+    def bid_price( self ):
+        return self._columns[ 0 ].item( self._index )
+
+    @property
+    def bid_size( self ):
+        return self._columns[ 1 ].item( self._index )
+
+    @property
+    def ask_price( self ):
+        return self._columns[ 2 ].item( self._index )
+
+    @property
+    def ask_size( self ):
+        return self._columns[ 3 ].item( self._index )
+
+    def is_valid( self ):
+        return ( self.bid_price > 0 and self.ask_price > 0 and self.bid_size > 0 and self.ask_size > 0 )
+
+## @brief Read only PeriodicBar over the bar at a given index of a column store ( see PeriodicBarColumns )
+#  It only holds the store and the index, the values are read from the columns when they are asked for
+#
+class PeriodicBarView( object ):
+    __slots__ = ( '_store', '_index' )
+
+    def __init__( self, store, index ):
+        self._store = store
+        self._index = index
+
+    @property
+    def open( self ):
+        return QuoteView( self._store.open_columns, self._index )
+
+    @property
+    def close( self ):
+        return QuoteView( self._store.close_columns, self._index )
+
+    @property
+    def high( self ):
+        return self._store.high.item( self._index )
+
+    @property
+    def low( self ):
+        return self._store.low.item( self._index )
+
+    @property
+    def volume( self ):
+        return self._store.volume.item( self._index )
+
+    @property
+    def ts( self ):
+        return get_utc_datetime_from_unix_seconds( self._store.timestamps.item( self._index ) )
 
     def is_valid( self ):
-        return ( self.low > 0 and self.high > 0 and self.open.is_valid( ) and self.close.is_valid( ) and self.volume >= 0 )
+        return ( self.low > 0 and self.high > 0 and self.open.is_valid( ) and self.close.is_valid( ) and
+                 self.volume >= 0 )
+
+    # Derived quantities, read from the derived columns of the store ( see DerivedBarColumns ), computed on first use
+    def _get_derived( self ):
+        if self._store.derived is None:
+            self._store.annotate_derived_columns( )
+        return self._store.derived
+
+    @property
+    def open_mid_price( self ):
+        return self._get_derived( ).open_mid_price.item( self._index )
+
+    @property
+    def mid_price( self ):
+        return self._get_derived( ).mid_price.item( self._index )
+
+    @property
+    def open_micro_price( self ):
+        return self._get_derived( ).open_micro_price.item( self._index )
+
+    @property
+    def micro_price( self ):
+        return self._get_derived( ).micro_price.item( self._index )
+
+    @property
+    def spread( self ):
+        return self._get_derived( ).spread.item( self._index )
+
+    @property
+    def bar_return( self ):
+        return self._get_derived( ).bar_return.item( self._index )
+
+    def get_movement( self, threshold ):
+        return self._get_derived( ).get_movements( threshold ).item( self._index )
@@ -0,0 +1,104 @@
+from array import array
+from collections import deque
+
+
+##
+# Fixed capacity ring buffer of the latest values of a series ( e.g. one value per minute bar ), with rolling statistics
+# maintained as values come in : sum, mean, variance, min, max and the number of positive / negative values.
+#
+# Pushing a value, once the window is full, drops the oldest one. Every statistic is updated in O( 1 ) ( amortised
+# for min and max, which keep monotonic queues of candidates ), whatever the capacity, so a 390 bar window costs the
+# same per bar as a 2 bar one. The variance is the population variance, updated with Welford's method.
+#
+class RollingWindow( object ):
+    def __init__( self, capacity ):
+        if capacity < 1:
+            raise ValueError( 'RollingWindow : capacity should be at least 1' )
+        self.capacity = capacity
+        self.values = array( 'd', [ 0.0 ] * capacity )  # Ring buffer, the oldest value is at self.start
+        self.clear( )
+
+    def clear( self ):
+        self.start = 0
+        self.size = 0
+        self.num_pushed = 0  # Sequence number of the next value, used to expire the min / max candidates
+        self.sum = 0.0
+        self.mean = 0.0
+        self.sum_squared_deviations = 0.0  # Sum of the squared deviations from the mean ( M2 of Welford )
+        self.num_positive = 0
+        self.num_negative = 0
+        self.min_candidates = deque( )  # ( sequence number, value ), values increasing, the min in front
+        self.max_candidates = deque( )  # ( sequence number, value ), values decreasing, the max in front
+
+    def __len__( self ):
+        return self.size
+
+    def is_full( self ):
+        return self.size == self.capacity
+
+    ## @brief Value at index, 0 being the oldest and -1 the latest
+    def __getitem__( self, index ):
+        if index < 0:
+            index += self.size
+        if index < 0 or index >= self.size:
+            raise IndexError( 'RollingWindow : index out of range' )
+        return self.values[ ( self.start + index ) % self.capacity ]
+
+    ## @brief The values in the window, oldest first
+    def get_values( self ):
+        return [ self[ i ] for i in range( self.size ) ]
+
+    ## @brief Adds value, dropping the oldest value if the window is full. Returns the dropped value, None if none
+    def push( self, value ):
+        dropped = None
+        if self.size == self.capacity:
+            dropped = self.values[ self.start ]
+            self.values[ self.start ] = value
+            self.start = ( self.start + 1 ) % self.capacity
+            # Replace dropped by value in the mean and the squared deviations
+            old_mean = self.mean
+            self.mean += ( value - dropped ) / self.size
+            self.sum_squared_deviations += ( value - dropped ) * ( value - self.mean + dropped - old_mean )
+            if dropped > 0:
+                self.num_positive -= 1
+            elif dropped < 0:
+                self.num_negative -= 1
+            self.sum += value - dropped
+        else:
+            self.values[ ( self.start + self.size ) % self.capacity ] = value
+            self.size += 1
+            delta = value - self.mean
+            self.mean += delta / self.size
+            self.sum_squared_deviations += delta * ( value - self.mean )
+            self.sum += value
+        if value > 0:
+            self.num_positive += 1
+        elif value < 0:
+            self.num_negative += 1
+
+        # Candidates which can never be the min ( max ) again, and the ones which left the window
+        oldest_sequence_number = self.num_pushed - self.size + 1
+        while self.min_candidates and self.min_candidates[ -1 ][ 1 ] >= value:
+            self.min_candidates.pop( )
+        self.min_candidates.append( ( self.num_pushed, value ) )
+        if self.min_candidates[ 0 ][ 0 ] < oldest_sequence_number:
+            self.min_candidates.popleft( )
+        while self.max_candidates and self.max_candidates[ -1 ][ 1 ] <= value:
+            self.max_candidates.pop( )
+        self.max_candidates.append( ( self.num_pushed, value ) )
+        if self.max_candidates[ 0 ][ 0 ] < oldest_sequence_number:
+            self.max_candidates.popleft( )
+        self.num_pushed += 1
+        return dropped
+
+    ## @brief Population variance of the values in the window, 0 if it is empty
+    def variance( self ):
+        if self.size == 0:
+            return 0.0
+        return max( self.sum_squared_deviations / self.size, 0.0 )
+
+    def min( self ):
+        return self.min_candidates[ 0 ][ 1 ] if self.size > 0 else None
+
+    def max( self ):
+        return self.max_candidates[ 0 ][ 1 ] if self.size > 0 else None
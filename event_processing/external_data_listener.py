@@ -40,3 +40,29 @@ class ExternalDataListener( object ):
     ## Getter method for next event time of a source
     def get_next_event_timestamp( self ):
         return self.next_event_timestamp
+
+    ##
+    # Optional timeline dispatch, for HistoricalDispatcher.run_merged. Sources whose events are all known upfront set
+    # supports_event_timeline and implement get_event_timeline, apply_timeline_event and end_timeline. The dispatcher
+    # only uses run_merged if all its sources support it, and falls back to run otherwise
+    #
+    supports_event_timeline = False
+
+    ##
+    # Returns the timestamps ( int64 unix seconds array ) of all the events left to process, or None if they are not
+    # known upfront ( the dispatcher then falls back to run ). The timeline starts at the current event of the source.
+    #
+    def get_event_timeline( self ):
+        return None
+
+    ##
+    # Applies the event at offset in the timeline to the market book without notifying its listeners ( the watch is
+    # notified first if notify_watch ), returns the book to notify. Only called if supports_event_timeline
+    #
+    @abstractmethod
+    def apply_timeline_event( self, offset, notify_watch ):
+        pass
+
+    ## Called once all the events of the timeline have been applied
+    def end_timeline( self ):
+        self.next_event_timestamp = 0
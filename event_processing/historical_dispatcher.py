@@ -1,5 +1,7 @@
 from cdefs.heap import Heap
 
+import numpy
+
 ##
 #  @brief Gets a list of historical/logged file sources, ExternalDataListener will know the first timestamp for the events 
 #  it's processing, this class will ask them to read the data and depending on whether there is any data of interest 
@@ -57,15 +59,20 @@ class HistoricalDispatcher( object ):
 
         # Only way to get out of this loop is when all sources have been removed. This is the only while loop in the program
         while external_data_listener_heap.size( ) > 0:  # only way to get out of this loop is when all sources have been removed. This is the only while loop in the program
-            top_edl = external_data_listener_heap.pop( )
-            if external_data_listener_heap.size( ) == 0:
+            top_edl = external_data_listener_heap.top( ) # Stays in the heap, it is re-keyed in place below
+            next_edl = external_data_listener_heap.second( ) # The source which will be on top once top_edl is done
+            if next_edl is None:
                 top_edl.process_all_events( )
                 return
-            top_edl.process_events_till( external_data_listener_heap.top( ).next_event_timestamp ) # process all events in this source till the next event is older the one on the new top
+            # process all events in this source till the next event is older the one on the new top
+            top_edl.process_events_till( next_edl.next_event_timestamp )
             next_event_timestamp_from_edl = top_edl.next_event_timestamp # ask the source to get the next_event_timestamp ( the first event that is older than the specified endtime )
             source_has_events = next_event_timestamp_from_edl != 0 # if 0 then no events .. and in historical this means this source can be removed, since it has finished reading the file it was reading from
             if source_has_events:
-                external_data_listener_heap.push( top_edl )  # Reinsert into heap
+                # Re-key in place, a single sift down ( heapq.heapreplace )
+                external_data_listener_heap.replace_top( top_edl )
+            else:
+                external_data_listener_heap.pop( )
             heap_size = external_data_listener_heap.size( )
             if heap_size == 1: 
                 external_data_listener_heap.top( ).process_all_events( ) # Since ComputeEarliestDataTimestamp () has been called, or ProcessEventsTill has been called, the next_event_timestamp will be valid
@@ -73,3 +80,62 @@ class HistoricalDispatcher( object ):
                 return
             if heap_size == 0:
                 return
+
+    ##
+    #  @brief Alternative to run for sources whose events are all known upfront
+    #  ( see ExternalDataListener.supports_event_timeline )
+    #
+    #  The timelines of all the sources are merged once with a stable numpy sort on the timestamps, and replayed in a
+    #  single loop instead of going through the heap for every timestamp. The events of a timestamp are delivered as one
+    #  step : the watch is notified once, the market books of all these events are updated, and only then are the
+    #  listeners of the books notified, so that they all see the books as of that timestamp. Within a step the sources
+    #  keep the order in which they were added. A source with several events of the same timestamp gets one step per
+    #  event. Falls back to run if a source does not support timeline dispatch.
+    #
+    def run_merged( self ):
+        sources = self.external_data_listener_list
+        if not all( source.supports_event_timeline for source in sources ):
+            return self.run( )
+        timelines = [ source.get_event_timeline( ) for source in sources ]
+        if any( timeline is None for timeline in timelines ):
+            return self.run( )
+
+        lengths = numpy.array( [ len( timeline ) for timeline in timelines ], dtype = numpy.int64 )
+        num_events = int( lengths.sum( ) )
+        if num_events > 0:
+            timestamps = numpy.concatenate( timelines ).astype( numpy.int64 )
+            positions = numpy.arange( num_events )
+            source_indices = numpy.repeat( numpy.arange( len( sources ) ), lengths )
+            # Offset of each event in the timeline of its source
+            offsets = positions - numpy.repeat( numpy.cumsum( lengths ) - lengths, lengths )
+
+            # Occurrence of each event among the events of the same source and timestamp ( 0 unless there are
+            # duplicates )
+            is_first_occurrence = numpy.ones( num_events, dtype = bool )
+            is_first_occurrence[ 1 : ] = ( ( timestamps[ 1 : ] != timestamps[ : -1 ] ) |
+                                           ( source_indices[ 1 : ] != source_indices[ : -1 ] ) )
+            occurrences = positions - numpy.maximum.accumulate( numpy.where( is_first_occurrence, positions, 0 ) )
+
+            order = numpy.lexsort( ( source_indices, occurrences, timestamps ) )
+            timestamps, occurrences = timestamps[ order ], occurrences[ order ]
+            is_step_start = numpy.ones( num_events, dtype = bool )
+            is_step_start[ 1 : ] = ( ( timestamps[ 1 : ] != timestamps[ : -1 ] ) |
+                                     ( occurrences[ 1 : ] != occurrences[ : -1 ] ) )
+            step_starts = numpy.flatnonzero( is_step_start ).tolist( ) + [ num_events ]
+            source_indices, offsets = source_indices[ order ].tolist( ), offsets[ order ].tolist( )
+
+            for step in range( len( step_starts ) - 1 ):
+                begin, end = step_starts[ step ], step_starts[ step + 1 ]
+                if end == begin + 1:  # Single event
+                    market_book = sources[ source_indices[ begin ] ].apply_timeline_event( offsets[ begin ], True )
+                    market_book.notify_market_event_listeners( )
+                    continue
+                market_books = [ sources[ source_indices[ i ] ].apply_timeline_event( offsets[ i ], i == begin )
+                                 for i in range( begin, end ) ]
+                for market_book in market_books:
+                    market_book.notify_market_event_listeners( )
+
+        for source in sources:
+            source.end_timeline( )
+        self.prev_external_data_listener_list.extend( sources )
+        self.external_data_listener_list = [ ]
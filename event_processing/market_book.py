@@ -1,9 +1,8 @@
-from cdefs.defines import MarketEvent_t, TradingStatus_t
+from cdefs.defines import MAX_NUM_SECURITIES, MarketEvent_t, TradingStatus_t
+from cdefs.timer_queue import INFINITE_TIME
 from cdefs.watch import USING_EST_CUSTOM_TRADING_DATE
 from cdefs.watch_listener import DateChangeListener
-from utils.datetime_convertor import get_secs_from_midnight, get_custom_est_secs_from_midnight
-
-import pytz
+from utils.datetime_convertor import EST_TZ, get_secs_from_midnight, get_custom_est_session_secs_from_midnight
 
 
 class TradeTime(object):
@@ -18,20 +17,22 @@ class TradeTime(object):
 #
 class MarketBook(DateChangeListener):
 
-    unique_instances = [None] * 256
+    unique_instances = [None] * MAX_NUM_SECURITIES
 
     def __init__(self, watch, secid):
         self.watch = watch
         self.secid = secid
         self.latest_price = None
         self.one_minute_bar = None  # The latest one minute bar view of the security
+        self.minute_bar_period = None  # Period of the latest minute bar
         self.market_event_listener_list = []  # List of listeners of the updates of this market book
+        self.batch_listeners_only = True  # If all the listeners support batched updates, see get_batch_end_timestamp
 
         # Track the trading times
         self.watch.add_date_change_watch_listener(
             self)  # Listen to date change events because we need to refresh the book and trading times
-        self.trade_open_time = TradeTime(930, pytz.timezone("EST"))
-        self.trade_close_time = TradeTime(1600, pytz.timezone("EST"))
+        self.trade_open_time = TradeTime(930, EST_TZ)
+        self.trade_close_time = TradeTime(1600, EST_TZ)
         self.trade_open_time_midsec = None  # The seconds since midnight when this security starts trading
         self.trade_close_time_midsec = None  # The seconds since midnight when this security stops trading
 
@@ -56,16 +57,36 @@ class MarketBook(DateChangeListener):
     ## Called at the end of sim.Deletes the unique instance
     @staticmethod
     def RemoveUniqueInstances():
-        MarketBook.unique_instances = [None] * 256
+        MarketBook.unique_instances = [None] * MAX_NUM_SECURITIES
 
     ## Function to add a new market event listener
     def add_market_event_listener(self, new_listener):
         self.market_event_listener_list.append(new_listener)
+        self._update_batch_listeners_only()
 
+    ## Removes a listener, also from within a notification : the list is replaced instead of modified in place, so
+    #  the notification in progress still reaches all the other listeners
     def remove_market_event_listener(self, listener):
-        self.market_event_listener_list.remove(listener)
+        self.market_event_listener_list = [x for x in self.market_event_listener_list if x is not listener]
+        self._update_batch_listeners_only()
+
+    def _update_batch_listeners_only(self):
+        self.batch_listeners_only = all(
+            getattr(listener, 'supports_batch_updates', False) for listener in self.market_event_listener_list)
+
+    ## @brief Unix seconds of the first bar time at which a listener needs to be notified bar by bar again, 0 if one
+    #  of them does not support batched updates or needs every bar now
+    #
+    def get_batch_end_timestamp(self):
+        if not self.batch_listeners_only:
+            return 0
+        batch_end_timestamp = INFINITE_TIME
+        for listener in self.market_event_listener_list:
+            batch_end_timestamp = min(batch_end_timestamp, listener.get_batch_end_timestamp(self.secid, self))
+            if batch_end_timestamp <= 0:
+                break
+        return batch_end_timestamp
 
-        ## Provides information about the type of the latest market event this book has recieved
     def latest_market_event_type(self):
         return self.latest_event_type
 
@@ -79,6 +100,13 @@ class MarketBook(DateChangeListener):
 
     ## Whenever a new one minute bar is generated, this function should be called to update the market book with the latest one minute bar
     def on_new_minute_bar(self, new_bar, minute_bar_period):
+        self.update_minute_bar(new_bar, minute_bar_period)
+        self.notify_market_event_listeners()
+
+    ## Updates the book with a new minute bar without notifying the listeners, so that the books of several securities
+    #  can all be updated for a timestamp before any listener looks at them ( see HistoricalDispatcher.run_merged )
+    #
+    def update_minute_bar(self, new_bar, minute_bar_period):
         # if not self.is_minute_bar_valid( new_bar ):
         #     return
 
@@ -92,10 +120,22 @@ class MarketBook(DateChangeListener):
             self.trading_status = TradingStatus_t.PostClose
 
         self.one_minute_bar = new_bar
+        self.minute_bar_period = minute_bar_period
         self.latest_event_type = MarketEvent_t.OneMinuteBar
 
-        self.latest_price = (new_bar.close.bid_price + new_bar.close.ask_price) / 2
+        self.latest_price = new_bar.mid_price
+
+    ## Updates the book with the last of the bars periodic_bars[ begin : end ] and hands the whole block to the
+    #  listeners. The file source only calls it for bars before get_batch_end_timestamp and the next action of the
+    #  watch, which has been updated to the last bar : the book and the listeners end up as if the bars had come one by
+    #  one
+    #
+    def on_new_minute_bar_batch(self, periodic_bars, begin, end, minute_bar_period):
+        self.update_minute_bar(periodic_bars[end - 1], minute_bar_period)
+        for listener in self.market_event_listener_list:
+            listener.on_market_update_batch(self.secid, self, periodic_bars, begin, end)
 
+    def notify_market_event_listeners(self):
         for listener in self.market_event_listener_list:
             listener.on_market_update(self.secid, self)
 
@@ -104,9 +144,10 @@ class MarketBook(DateChangeListener):
         self.one_minute_bar = None
 
         if USING_EST_CUSTOM_TRADING_DATE:
-            self.trade_open_time_midsec = get_custom_est_secs_from_midnight(
-                self.watch.current_date, self.trade_open_time.hhmm, self.trade_open_time.tz)
-            self.trade_close_time_midsec = get_custom_est_secs_from_midnight(
+            self.trade_open_time_midsec = get_custom_est_session_secs_from_midnight(self.watch.current_date,
+                                                                                    self.trade_open_time.hhmm,
+                                                                                    self.trade_open_time.tz)
+            self.trade_close_time_midsec = get_custom_est_session_secs_from_midnight(
                 self.watch.current_date, self.trade_close_time.hhmm, self.trade_close_time.tz)
         else:
             self.trade_open_time_midsec = get_secs_from_midnight(self.watch.current_date, self.trade_open_time.hhmm,
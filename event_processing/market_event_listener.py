@@ -4,9 +4,16 @@ from abc import ABCMeta, abstractmethod
 ##
 # Interface class to derive all the classes who want to listen every price event for a given security
 #
+# Listeners can opt in to batched delivery by setting supports_batch_updates : when every listener of a market book
+# supports it, and neither the watch nor any listener needs to act before a given time ( see
+# get_batch_end_timestamp ), the bars up to that time are delivered as one block to on_market_update_batch instead of
+# one on_market_update per bar. Listeners which do not opt in always get every bar, in the same order as before.
+#
 class MarketEventListener:
     __metaclass__ = ABCMeta
 
+    supports_batch_updates = False  # True if the listener can be given blocks of bars, see on_market_update_batch
+
     ##
     # Called on every new market event
     # @param sec_id Security id to which the market event corresponds
@@ -15,3 +22,30 @@ class MarketEventListener:
     @abstractmethod
     def on_market_update(self, sec_id, market_info):
         pass
+
+    ##
+    # Unix seconds of the first bar time at which the listener needs on_market_update again, e.g. its start time or
+    # the time an order gets filled. Bars timestamped before it can be given in a block. 0 if it needs every bar now,
+    # INFINITE_TIME if it never does. Only called if supports_batch_updates
+    #
+    # 0 by default : setting supports_batch_updates alone never batches the bars of a listener, it also has to tell
+    # until when it can wait. Otherwise it could trade from a bar of a block while the other listeners ( e.g. the
+    # BackTester filling the orders ) have already decided the whole block without that order
+    #
+    def get_batch_end_timestamp(self, sec_id, market_info):
+        return 0
+
+    ##
+    # Called instead of on_market_update for a block of consecutive bars, once the watch and market_info are at the
+    # last bar of the block. Only called if supports_batch_updates
+    # @param periodic_bars The PeriodicBarColumns of the bars, with their timestamps and derived columns
+    # @param begin, end The bars of the block are periodic_bars[ begin : end ]
+    #
+    # By default on_market_update is called for every bar of the block, with market_info showing that bar. The watch
+    # stays at the last bar though, so listeners which look at the time of every bar should override it, or not opt in.
+    # Orders sent from these calls are only filled after the block ( see get_batch_end_timestamp )
+    #
+    def on_market_update_batch(self, sec_id, market_info, periodic_bars, begin, end):
+        for index in range(begin, end):
+            market_info.update_minute_bar(periodic_bars[index], market_info.minute_bar_period)
+            self.on_market_update(sec_id, market_info)
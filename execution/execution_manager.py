@@ -10,7 +10,14 @@ from cdefs.security_name_indexer import SecurityNameIndexer
 
 
 class ExecutionManager():
-    def __init__(self, watch, market_books, order_manager, algo_type=ExecAlgoType_t.Direct):
+    def __init__(self,
+                 watch,
+                 market_books,
+                 order_manager,
+                 algo_type=ExecAlgoType_t.Direct,
+                 security_name_indexer=None,
+                 verbose=True,
+                 algo_params=None):
         self.market_books = market_books
         self.order_manager = order_manager
         self.orders = []
@@ -18,6 +25,12 @@ class ExecutionManager():
         self.active_execution_requests = []
         self.algo_type = algo_type
         self.order_manager.add_execution_completion_listener(self)
+        # Used to print the shortcodes, by default the unique instance ( see SimulationContext )
+        self.security_name_indexer = security_name_indexer
+        self.verbose = verbose  # Print the performance of each completed execution
+        self.results = []  # Performance of the completed executions, see _get_stats
+        # Keyword arguments of the algorithms ( execution_window, threshold, lookback ), their defaults if not given
+        self.algo_params = algo_params if algo_params is not None else {}
 
     def activate(self, secid):
         '''
@@ -30,9 +43,11 @@ class ExecutionManager():
                     self.order_manager.send_order(order[0], order[1], order[2], order[3])
                     break
                 elif self.algo_type == ExecAlgoType_t.MeanRev:
-                    a = MeanReversion(self.watch, order[0], order[1], order[2], order[3], order[4], self.order_manager)
+                    a = MeanReversion(self.watch, order[0], order[1], order[2], order[3], order[4], self.order_manager,
+                                      **self.algo_params)
                 elif self.algo_type == ExecAlgoType_t.Momentum:
-                    a = Momentum(self.watch, order[0], order[1], order[2], order[3], order[4], self.order_manager)
+                    a = Momentum(self.watch, order[0], order[1], order[2], order[3], order[4], self.order_manager,
+                                 **self.algo_params)
                 else:
                     raise ValueError("Unknown algorithm: {}".format(self.algo_type))
                 self.active_execution_requests.append(a)
@@ -59,28 +74,48 @@ class ExecutionManager():
         self.orders.append((secid, trade_type, order_type, int_order_to_place, secs_from_midnight))
         self.execute_all()
 
-    def _print_stats(self, avg_price, size, algo_instance):
+    def _get_stats(self, avg_price, size, algo_instance):
+        '''
+        Returns the performance of execution as a dict
+        '''
+        sni = self.security_name_indexer
+        if sni is None:
+            sni = SecurityNameIndexer.GetUniqueInstance()
+        buysell = 'Buy' if algo_instance.trade_type == TradeType_t.Buy else 'Sell'
+        savings = avg_price - algo_instance.arrival_price
+        duration = self.watch.secs_since_midnight - algo_instance.start_midnight_seconds
+        if buysell == 'Buy':
+            savings *= -1
+        return {
+            'secid': algo_instance.secid,
+            'shortcode': sni.get_shortcode_from_id(algo_instance.secid),
+            'buysell': buysell,
+            'order_size': algo_instance.size,
+            'start_midnight_seconds': algo_instance.start_midnight_seconds,
+            'arrival_price': algo_instance.arrival_price,
+            'executed_price': avg_price,
+            'executed_size': size,
+            'savings': savings,
+            'duration': duration
+        }
+
+    def _print_stats(self, stats):
         '''
         Prints the performance of execution
         '''
-        sni = SecurityNameIndexer.GetUniqueInstance()
-        hh = int(algo_instance.start_midnight_seconds / 3600)
-        mm = int((algo_instance.start_midnight_seconds - hh * 3600) / 60)
-        ss = int((algo_instance.start_midnight_seconds - hh * 3600) / 60)
+        hh = int(stats['start_midnight_seconds'] / 3600)
+        mm = int((stats['start_midnight_seconds'] - hh * 3600) / 60)
+        ss = int((stats['start_midnight_seconds'] - hh * 3600) / 60)
 
         hh = str(hh) if hh > 9 else '0{}'.format(hh)
         mm = str(mm) if mm > 9 else '0{}'.format(mm)
         ss = str(ss) if ss > 9 else '0{}'.format(ss)
 
-        buysell = 'Buy' if algo_instance.trade_type == TradeType_t.Buy else 'Sell'
-        savings = avg_price - algo_instance.arrival_price
-        duration = self.watch.secs_since_midnight - algo_instance.start_midnight_seconds
-        if buysell == 'Buy':
-            savings *= -1
-        print('{}:{}:{}:UTC Order:{} {} {}'.format(hh, mm, ss, sni.get_shortcode_from_id(algo_instance.secid),
-                                                   algo_instance.size, buysell))
+        print('{}:{}:{}:UTC Order:{} {} {}'.format(hh, mm, ss, stats['shortcode'], stats['order_size'],
+                                                   stats['buysell']))
         print('Performance: Arrival_Price:{} Executed_Price:{} Executed_Size:{} Savings:{} Duration:{}'.format(
-            algo_instance.arrival_price, avg_price, size, savings, duration))
+            stats['arrival_price'], stats['executed_price'], stats['executed_size'], stats['savings'],
+            stats['duration']))
 
     def on_executed(self, secid, size, buysell, price):
         '''
@@ -92,11 +127,16 @@ class ExecutionManager():
         for index, req in enumerate(self.active_execution_requests):
             if req.secid == secid:
                 exec_request_found = True
-                self._print_stats(price, size, req)
+                stats = self._get_stats(price, size, req)
+                self.results.append(stats)
+                if self.verbose:
+                    self._print_stats(stats)
                 self.market_books[secid].remove_market_event_listener(req)
                 break
         if exec_request_found:
             del self.active_execution_requests[index]
         else:
-            print('Performance:Executed_Price:{} Executed_Size:{}'.format(price, size))
+            self.results.append({'secid': secid, 'executed_price': price, 'executed_size': size})
+            if self.verbose:
+                print('Performance:Executed_Price:{} Executed_Size:{}'.format(price, size))
         self.execute_all()
@@ -4,25 +4,20 @@ import sys
 import datetime
 import argparse
 import random
-import pytz
-
-# Common classes
-
-from cdefs.watch import Watch
-from cdefs.security_name_indexer import SecurityNameIndexer
 
 from cdefs.defines import TradeType_t, OrderType_t, get_algo_from_str
-from execution.execution_manager import ExecutionManager
+from execution.simulation_context import SimulationContext
+
 
-from order_routing.base_order_manager import BaseOrderManager
-from order_routing.backtester import BackTester
+## Seconds since midnight of an hhmmss time
+def get_start_midnight_seconds(hhmmss):
+    return 3600 * int(hhmmss // 10000) + 60 * (int(hhmmss % 10000) // 100) + hhmmss % 100
 
-# Filesources and data handlers
-from mds_messages.periodic_bar_file_source import PeriodicBarFileSource
 
-from event_processing.market_book import MarketBook
-from event_processing.historical_dispatcher import HistoricalDispatcher
-from utils.datetime_convertor import get_unix_timestamp_from_hhmm_tz
+## Keyword arguments of the algorithms ( see ExecutionManager ), only the parameters which are given
+def get_algo_params(execution_window=None, threshold=None, lookback=None):
+    algo_params = {'execution_window': execution_window, 'threshold': threshold, 'lookback': lookback}
+    return dict((name, value) for name, value in algo_params.items() if value is not None)
 
 
 def main():
@@ -30,64 +25,50 @@ def main():
     # Parse arguments
     parser = argparse.ArgumentParser()
     parser.add_argument('start_date', type=str, help='Date of the simulation')
-    parser.add_argument('shortcode', type=str, help='Security for which we want to simulate execution')
+    parser.add_argument('shortcode',
+                        type=str,
+                        help='Security for which we want to simulate execution, or a comma separated list of them')
 
     parser.add_argument('buysell', type=str, help='"B" for Buy, "S" for Sell.')
     parser.add_argument('size', type=int, help='size to buy/sell')
     parser.add_argument('algorithm', type=str, help='Momentum,MeanReversion, Direct')
     parser.add_argument('hhmmss', type=int, help='hhmmss (UTC timezone)')
+    parser.add_argument('--integer_clock', action='store_true', help='Keep the time of the watch as unix seconds')
+    parser.add_argument('--merged_timeline',
+                        action='store_true',
+                        help='Replay a pre-merged timeline of all the bars instead of the heap of file sources')
+    parser.add_argument('--execution_window', type=int, default=None, help='Seconds given to the algorithm to execute')
+    parser.add_argument('--threshold', type=float, default=None, help='Price change of a minute bar to be a movement')
+    parser.add_argument('--lookback', type=int, default=None, help='Number of minute bars moving the same way to trade')
 
     # parse arguments
     args = parser.parse_args()
 
     start_date = datetime.datetime.strptime(args.start_date, '%Y%m%d').date()
     end_date = start_date + datetime.timedelta(1)
-    shortcode = args.shortcode
+    shortcodes = args.shortcode.split(',')
     buysell = TradeType_t.Buy if args.buysell == 'B' else TradeType_t.Sell
     size = args.size
     execution_algorithm = get_algo_from_str(args.algorithm)
     hhmmss = args.hhmmss
 
-    watch = Watch.SetUniqueInstance(start_date, end_date)
-
-    # Create instance of security name indexer, created only once in whole program
-    sec_name_indexer = SecurityNameIndexer.GetUniqueInstance()
-    sec_name_indexer.add_symbol(shortcode)
-
-    # Create the unqiue instance of historical dispatcher, this is the only dispatcher object for the whole program
-    historical_dispatcher = HistoricalDispatcher()
+    # All the objects of the simulation ( watch, market books, backtester, dispatcher, order manager ) live in it
+    context = SimulationContext(start_date, end_date, args.integer_clock)
 
-    # Create instance of backtester
-    backtester = BackTester.GetUniqueInstance(watch)
+    # Create minute bar file sources, the dispatcher interleaves their bars in time order
+    secids = [context.add_file_source(shortcode).secid for shortcode in shortcodes]
 
-    watch.add_date_change_watch_listener(backtester)
+    # Instantiate execution manager, and the order manager it uses
+    execution_manager = context.add_execution_manager(execution_algorithm,
+                                                      algo_params=get_algo_params(args.execution_window, args.threshold,
+                                                                                  args.lookback))
 
-    market_book = MarketBook.GetUniqueInstance(watch, 0)  # Create a market book for this security
-    market_book.add_market_event_listener(backtester)  # Backtester listens to all the market books
-
-    # Create minute bar file sources
-    this_file_source = PeriodicBarFileSource(shortcode, watch, start_date, end_date)
-    historical_dispatcher.add_external_data_listener(this_file_source)
-
-    # We do not want any file source to have data prior to start date
-    historical_dispatcher.seek_hist_file_sources_to(get_unix_timestamp_from_hhmm_tz(start_date, 0, pytz.timezone(
-        'UTC')))
-    # Instantiate order manager.
-    order_manager = BaseOrderManager(watch, 0)
-
-    # Instantiate execution manager.
-    market_books = MarketBook.GetUniqueInstances(watch)
-    execution_manager = ExecutionManager(watch, market_books, order_manager, execution_algorithm)
-
-    start_midnight_seconds = 3600 * int(hhmmss / 10000) + 60 * (int(hhmmss % 10000) / 100) + hhmmss % 100
-    execution_manager.execute(0, buysell, OrderType_t.Market, size, start_midnight_seconds)
+    start_midnight_seconds = get_start_midnight_seconds(hhmmss)
+    for secid in secids:
+        execution_manager.execute(secid, buysell, OrderType_t.Market, size, start_midnight_seconds)
 
     # Run the dispatcher
-    historical_dispatcher.run()
-
-    # There might be some listeners which could not be called for the last day
-    # since there was no market event at that time. Calling them explicitly
-    watch.clear_pending_daily_watch_listeners()
+    context.run(args.merged_timeline)
     return True
 
 
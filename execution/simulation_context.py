@@ -0,0 +1,149 @@
+'''
+SimulationContext owns every object of one simulation : the watch, the security name indexer, the market books, the
+backtester, the historical dispatcher, the file sources and the order / execution managers.
+
+The objects are built directly and handed to each other explicitly, none of the process wide unique instances
+( Watch, SecurityNameIndexer, MarketBook, BackTester ) is used. Any number of contexts can live in the same process,
+one after the other or at the same time from several threads, and a context is released by simply dropping it.
+Within a context, add_shadow_execution runs any number of independent executions over a single replay.
+Only the bars are shared between contexts, through the read-only PeriodicBarCache / SharedPeriodicBarStore.
+'''
+
+from cdefs.defines import MAX_NUM_SECURITIES, ExecAlgoType_t, OrderType_t
+from cdefs.security_name_indexer import SecurityNameIndexer
+from cdefs.watch import Watch
+from event_processing.historical_dispatcher import HistoricalDispatcher
+from event_processing.market_book import MarketBook
+from execution.execution_manager import ExecutionManager
+from mds_messages.periodic_bar_file_source import PeriodicBarFileSource
+from order_routing.backtester import BackTester
+from order_routing.base_order_manager import BaseOrderManager
+from utils.datetime_convertor import UTC_TZ, get_unix_timestamp_from_hhmm_tz
+
+
+class SimulationContext(object):
+    def __init__(self, start_date, end_date, integer_clock=False):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.watch = Watch.Create(start_date, end_date, integer_clock)
+        self.security_name_indexer = SecurityNameIndexer()
+        self.historical_dispatcher = HistoricalDispatcher()
+        self.backtester = BackTester(self.watch)
+        self.watch.add_date_change_watch_listener(self.backtester)
+        self.market_books = [None] * MAX_NUM_SECURITIES  # Indexed by secid, like MarketBook.unique_instances
+        self.file_sources = []
+        self.order_managers = {}  # uid -> BaseOrderManager
+        self.execution_managers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def add_security(self, shortcode):
+        '''
+        Adds shortcode to the security name indexer of this context and creates its market book, returns its secid
+        '''
+        secid = self.security_name_indexer.add_symbol(shortcode)
+        self.get_market_book(secid)
+        return secid
+
+    def get_market_book(self, secid):
+        '''
+        Returns the market book of secid, created on first use with the backtester listening to it
+        '''
+        if self.market_books[secid] is None:
+            market_book = MarketBook(self.watch, secid)
+            market_book.add_market_event_listener(self.backtester)  # Backtester listens to all the market books
+            self.market_books[secid] = market_book
+        return self.market_books[secid]
+
+    def add_file_source(self, shortcode, file_source_class=PeriodicBarFileSource, **kwargs):
+        '''
+        Creates a file source ( PeriodicBarFileSource by default ) of shortcode over the dates of this context and adds
+        it to the dispatcher. kwargs are passed to the file source ( periodic_bar_period, catalog, chunk_size ... )
+        '''
+        secid = self.add_security(shortcode)
+        file_source = file_source_class(shortcode,
+                                        self.watch,
+                                        self.start_date,
+                                        self.end_date,
+                                        secid=secid,
+                                        market_book=self.market_books[secid],
+                                        security_name_indexer=self.security_name_indexer,
+                                        **kwargs)
+        self.file_sources.append(file_source)
+        self.historical_dispatcher.add_external_data_listener(file_source)
+        return file_source
+
+    def get_order_manager(self, uid=0):
+        '''
+        Returns the order manager of uid, created on first use and connected to the backtester of this context
+        '''
+        if uid not in self.order_managers:
+            self.order_managers[uid] = BaseOrderManager(self.watch, uid, backtester=self.backtester)
+        return self.order_managers[uid]
+
+    def add_execution_manager(self, algo_type=ExecAlgoType_t.Direct, uid=0, verbose=True, algo_params=None):
+        execution_manager = ExecutionManager(self.watch,
+                                             self.market_books,
+                                             self.get_order_manager(uid),
+                                             algo_type,
+                                             security_name_indexer=self.security_name_indexer,
+                                             verbose=verbose,
+                                             algo_params=algo_params)
+        self.execution_managers.append(execution_manager)
+        return execution_manager
+
+    def add_shadow_execution(self,
+                             secid,
+                             buysell,
+                             size,
+                             start_midnight_seconds,
+                             algo_type=ExecAlgoType_t.Direct,
+                             algo_params=None):
+        '''
+        Starts an execution isolated from all the others of this context : it gets its own uid, order manager and
+        execution manager, and its orders are filled by the backtester against the market book like any other. Any
+        number of them can share one replay, each with its own algo_params. Returns the execution manager, whose
+        results hold the performance
+        '''
+        uid = len(self.order_managers)
+        while uid in self.order_managers:
+            uid += 1
+        execution_manager = self.add_execution_manager(algo_type, uid=uid, verbose=False, algo_params=algo_params)
+        execution_manager.execute(secid, buysell, OrderType_t.Market, size, start_midnight_seconds)
+        return execution_manager
+
+    def run(self, merged_timeline=False):
+        '''
+        Replays all the file sources from the midnight ( UTC ) of the start date, then notifies the daily listeners
+        which were still pending at the end of the data
+        '''
+        # We do not want any file source to have data prior to start date
+        self.historical_dispatcher.seek_hist_file_sources_to(get_unix_timestamp_from_hhmm_tz(
+            self.start_date, 0, UTC_TZ))
+        if merged_timeline:
+            self.historical_dispatcher.run_merged()
+        else:
+            self.historical_dispatcher.run()
+
+        # There might be some listeners which could not be called for the last day
+        # since there was no market event at that time. Calling them explicitly
+        self.watch.clear_pending_daily_watch_listeners()
+
+    def close(self):
+        '''
+        Closes the files still open by the file sources and drops all the objects of the simulation
+        '''
+        for file_source in self.file_sources:
+            if file_source.file_reader is not None:
+                file_source.file_reader.close()
+                file_source.file_reader = None
+        self.file_sources = []
+        self.historical_dispatcher = None
+        self.market_books = [None] * MAX_NUM_SECURITIES
+        self.order_managers = {}
+        self.execution_managers = []
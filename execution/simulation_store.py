@@ -0,0 +1,205 @@
+'''
+SQLite store of simulation jobs and their results, used by simulation_sweep to memoize scenarios and resume sweeps.
+
+A job is keyed on a content hash of everything its result depends on : the scenario, the options of the simulation,
+the digest of the data file of the shortcode and the code version ( digest of the source ) of the algorithm and of the
+engine which replays the bars and fills the orders ( ENGINE_PACKAGES ). The same scenario over the same data with the
+same code is simulated once, by whichever sweep gets to it first, and served from the store afterwards. Changing the
+data file, the algorithm or the engine gives new keys, old results are simply not used.
+
+Jobs go from pending to running ( claimed by a worker ) to done or failed. Any number of processes can share a store
+file : claims are atomic ( BEGIN IMMEDIATE ), and a running job whose worker died is claimed again once its claim is
+older than stale_seconds. A sweep interrupted halfway resumes by being run again on the same store.
+'''
+
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from algo import mean_reversion, momentum
+
+STORE_FORMAT_VERSION = 1  # Bump to invalidate all the stored results, e.g. if the result format changes
+DEFAULT_STALE_SECONDS = 3600
+
+ALGO_MODULES = {'MeanRev': mean_reversion, 'Momentum': momentum}  # Modules whose source is the code version
+# Packages of the engine ( dispatch, market books, order routing, execution ... ), all their sources are part of the
+# code version of every algorithm
+ENGINE_PACKAGES = [
+    'cdefs', 'common_data_structures', 'event_processing', 'execution', 'mds_messages', 'order_routing', 'utils'
+]
+
+_file_digests = {}  # ( path, size, mtime ) -> digest, the data files are only hashed once per process
+_code_versions = {}
+_digest_lock = threading.Lock()
+
+
+def get_file_digest(path):
+    '''
+    sha256 of the contents of path, None if it does not exist
+    '''
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    cache_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _digest_lock:
+        if cache_key in _file_digests:
+            return _file_digests[cache_key]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file_:
+        for block in iter(lambda: file_.read(1 << 20), b''):
+            digest.update(block)
+    with _digest_lock:
+        _file_digests[cache_key] = digest.hexdigest()
+    return _file_digests[cache_key]
+
+
+def get_engine_code_version():
+    '''
+    sha256 of the sources of ENGINE_PACKAGES
+    '''
+    if 'engine' not in _code_versions:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(inspect.getsourcefile(mean_reversion))))
+        paths = []
+        for package in ENGINE_PACKAGES:
+            for directory, subdirectories, filenames in os.walk(os.path.join(root, package)):
+                paths.extend(os.path.join(directory, filename) for filename in filenames if filename.endswith('.py'))
+        digest = hashlib.sha256()
+        for path in sorted(paths):
+            digest.update('{}:{}\n'.format(os.path.relpath(path, root), get_file_digest(path)).encode('utf-8'))
+        _code_versions['engine'] = digest.hexdigest()
+    return _code_versions['engine']
+
+
+def get_algo_code_version(algorithm):
+    '''
+    sha256 of the source of the module of algorithm ( 'MeanRev', 'Momentum' ) and of the engine, the engine alone for
+    Direct
+    '''
+    if algorithm not in _code_versions:
+        inputs = {'engine': get_engine_code_version()}
+        if algorithm in ALGO_MODULES:
+            inputs['algo'] = get_file_digest(inspect.getsourcefile(ALGO_MODULES[algorithm]))
+        _code_versions[algorithm] = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+    return _code_versions[algorithm]
+
+
+def get_data_file_path(shortcode):
+    return os.path.expanduser('./datafiles/{}'.format(shortcode))  # Same path as PeriodicBarFileSource
+
+
+def get_job_key(scenario, options):
+    '''
+    Content hash of a scenario ( dict ) run with options ( dict ), over its data file and algorithm code
+    '''
+    inputs = {
+        'format': STORE_FORMAT_VERSION,
+        'scenario': scenario,
+        'options': options,
+        'data': get_file_digest(get_data_file_path(scenario['shortcode'])),
+        'code': get_algo_code_version(scenario['algorithm'])
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class SimulationStore(object):
+    def __init__(self, path, stale_seconds=DEFAULT_STALE_SECONDS):
+        self.path = path
+        self.stale_seconds = stale_seconds
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)  # Transactions are explicit
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS jobs ( key TEXT PRIMARY KEY, scenario TEXT, options TEXT, '
+                                'status TEXT, worker TEXT, claimed_at REAL, result TEXT, error TEXT, updated_at REAL )')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs ( status )')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        self.connection.close()
+
+    def add_jobs(self, jobs):
+        '''
+        Adds ( key, scenario, options ) jobs as pending. Jobs already in the store are left as they are, except failed
+        ones which are retried
+        '''
+        now = time.time()
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            for key, scenario, options in jobs:
+                self.connection.execute(
+                    'INSERT OR IGNORE INTO jobs ( key, scenario, options, status, updated_at ) '
+                    'VALUES ( ?, ?, ?, \'pending\', ? )', (key, json.dumps(scenario), json.dumps(options), now))
+                self.connection.execute(
+                    'UPDATE jobs SET status = \'pending\', error = NULL, updated_at = ? '
+                    'WHERE key = ? AND status = \'failed\'', (now, key))
+            self.connection.execute('COMMIT')
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+
+    def get_results(self, keys):
+        '''
+        Returns key -> result of the keys whose job is done
+        '''
+        results = {}
+        keys = list(keys)
+        for i in range(0, len(keys), 500):  # Stay below the limit of variables of a statement
+            batch = keys[i:i + 500]
+            query = 'SELECT key, result FROM jobs WHERE status = \'done\' AND key IN ( {} )'
+            rows = self.connection.execute(query.format(','.join('?' * len(batch))), batch)
+            for key, result in rows:
+                results[key] = json.loads(result)
+        return results
+
+    def claim(self, key, worker):
+        '''
+        Claims the job of key for worker if it is pending ( or running with a stale claim ), returns True on success
+        '''
+        now = time.time()
+        cursor = self.connection.execute(
+            'UPDATE jobs SET status = \'running\', worker = ?, claimed_at = ?, updated_at = ? WHERE key = ? AND '
+            '( status = \'pending\' OR ( status = \'running\' AND claimed_at < ? ) )',
+            (worker, now, now, key, now - self.stale_seconds))
+        return cursor.rowcount == 1
+
+    def claim_next(self, worker):
+        '''
+        Claims any claimable job for worker, returns ( key, scenario, options ) or None if there is none left
+        '''
+        now = time.time()
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.connection.execute(
+                'SELECT key, scenario, options FROM jobs WHERE status = \'pending\' OR '
+                '( status = \'running\' AND claimed_at < ? ) LIMIT 1', (now - self.stale_seconds, )).fetchone()
+            if row is not None:
+                self.connection.execute(
+                    'UPDATE jobs SET status = \'running\', worker = ?, claimed_at = ?, updated_at = ? WHERE key = ?',
+                    (worker, now, now, row[0]))
+            self.connection.execute('COMMIT')
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), json.loads(row[2])
+
+    def complete(self, key, result):
+        self.connection.execute(
+            'UPDATE jobs SET status = \'done\', result = ?, error = NULL, updated_at = ? WHERE key = ?',
+            (json.dumps(result), time.time(), key))
+
+    def fail(self, key, error):
+        self.connection.execute('UPDATE jobs SET status = \'failed\', error = ?, updated_at = ? WHERE key = ?',
+                                (error, time.time(), key))
+
+    def get_status_counts(self):
+        return dict(self.connection.execute('SELECT status, COUNT( * ) FROM jobs GROUP BY status').fetchall())
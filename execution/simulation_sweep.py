@@ -0,0 +1,408 @@
+#/usr/bin/env python
+'''
+Runs many execution simulations ( date, shortcode, buy/sell, size, algorithm, hhmmss ) across a pool of worker
+processes, instead of one simulate_execution process per scenario.
+
+Each scenario runs in its own SimulationContext. Scenarios are sent to the workers in chunks of scenarios sharing the
+same date and shortcode, so a worker loads the bars of a file once ( PeriodicBarCache ) and replays them for the
+whole chunk. With shared_bars, the parent loads every file / date once into shared memory ( SharedPeriodicBarStore )
+and the workers attach to it instead of reading the files themselves.
+
+Results are streamed as JSON lines as soon as their chunk completes, in completion order : every line holds the
+scenario, its index in the input, the performance of its executions ( see ExecutionManager._get_stats ) and the error
+if the scenario failed. Progress and throughput are reported on stderr.
+
+With --store, results are memoized in a SimulationStore : scenarios already simulated over the same data and algorithm
+code are served from it, and an interrupted sweep resumes by running it again. --drain runs the jobs left in a store
+from any number of extra processes.
+
+With --shadow, the scenarios of a chunk sharing a date and shortcode are simulated as independent executions of a
+single replay, each with its own order manager ( see SimulationContext.add_shadow_execution ).
+
+--execution_window, --threshold and --lookback set the parameters of the algorithms of all the scenarios, in every mode.
+They are part of the keys of the store.
+
+    python execution/simulation_sweep.py --dates 20150325,20150326 --shortcodes VWO,BND --algorithms MeanRev,Momentum
+        --hhmmss 133000,150000 --workers 8 --output results.jsonl
+'''
+
+import argparse
+import collections
+import concurrent.futures
+import datetime
+import itertools
+import json
+import os
+import socket
+import sys
+import time
+import traceback
+
+from cdefs.defines import TradeType_t, OrderType_t, get_algo_from_str
+from execution.simulate_execution import get_algo_params, get_start_midnight_seconds
+from execution.simulation_context import SimulationContext
+from execution.simulation_store import SimulationStore, get_data_file_path, get_job_key
+from mds_messages.shared_periodic_bar_store import SharedPeriodicBarStore, initialize_shared_bar_worker
+
+Scenario = collections.namedtuple('Scenario', ['date', 'shortcode', 'buysell', 'size', 'algorithm', 'hhmmss'])
+
+
+def make_scenario_grid(dates, shortcodes, buysells, sizes, algorithms, hhmmss_list):
+    '''
+    Cartesian product of the values of each field. dates are YYYYMMDD strings, buysells 'B' / 'S' and algorithms
+    'Direct', 'MeanRev' or 'Momentum', like the arguments of simulate_execution
+    '''
+    grid = itertools.product(dates, shortcodes, buysells, sizes, algorithms, hhmmss_list)
+    return [Scenario(*values) for values in grid]
+
+
+def read_scenarios(path):
+    '''
+    Reads a list of scenarios from a JSON lines file, one object with the fields of Scenario per line
+    '''
+    scenarios = []
+    with open(path) as file_:
+        for line in file_:
+            if line.strip():
+                fields = json.loads(line)
+                scenarios.append(
+                    Scenario(str(fields['date']), fields['shortcode'], fields['buysell'], int(fields['size']),
+                             fields['algorithm'], int(fields['hhmmss'])))
+    return scenarios
+
+
+def _get_dates(date):
+    '''
+    The start and end dates of the simulation of a YYYYMMDD date
+    '''
+    start_date = datetime.datetime.strptime(date, '%Y%m%d').date()
+    return start_date, start_date + datetime.timedelta(1)
+
+
+def run_scenario(scenario, integer_clock=False, merged_timeline=False, algo_params=None):
+    '''
+    Simulates one scenario in a fresh SimulationContext, returns the performance of its executions. algo_params are
+    the parameters of the algorithm ( see ExecutionManager ), its defaults if not given
+    '''
+    start_date, end_date = _get_dates(scenario.date)
+    with SimulationContext(start_date, end_date, integer_clock) as context:
+        secid = context.add_file_source(scenario.shortcode).secid
+        execution_manager = context.add_execution_manager(get_algo_from_str(scenario.algorithm),
+                                                          verbose=False,
+                                                          algo_params=algo_params)
+        buysell = TradeType_t.Buy if scenario.buysell == 'B' else TradeType_t.Sell
+        execution_manager.execute(secid, buysell, OrderType_t.Market, scenario.size,
+                                  get_start_midnight_seconds(scenario.hhmmss))
+        context.run(merged_timeline)
+        return execution_manager.results
+
+
+def run_shadow_scenarios(scenarios, integer_clock=False, merged_timeline=False, algo_params=None):
+    '''
+    Simulates scenarios of the same date and shortcode in a single replay, as shadow executions ( see
+    SimulationContext.add_shadow_execution ), returns the performance of the executions of each scenario. algo_params
+    are the parameters of all their algorithms, as in run_scenario
+    '''
+    start_date, end_date = _get_dates(scenarios[0].date)
+    with SimulationContext(start_date, end_date, integer_clock) as context:
+        secid = context.add_file_source(scenarios[0].shortcode).secid
+        execution_managers = []
+        for scenario in scenarios:
+            buysell = TradeType_t.Buy if scenario.buysell == 'B' else TradeType_t.Sell
+            execution_managers.append(
+                context.add_shadow_execution(secid,
+                                             buysell,
+                                             scenario.size,
+                                             get_start_midnight_seconds(scenario.hhmmss),
+                                             get_algo_from_str(scenario.algorithm),
+                                             algo_params=algo_params))
+        context.run(merged_timeline)
+        return [execution_manager.results for execution_manager in execution_managers]
+
+
+def _get_worker_name():
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def _get_options(integer_clock, merged_timeline, algo_params):
+    '''
+    Options of the jobs of a SimulationStore, part of their key. The algorithm parameters are only there when some are
+    given, so the jobs with the default parameters keep their key
+    '''
+    options = {'integer_clock': integer_clock, 'merged_timeline': merged_timeline}
+    if algo_params:
+        options['algo_params'] = algo_params
+    return options
+
+
+def _run_results(results, scenarios, integer_clock, merged_timeline, shadow, algo_params):
+    '''
+    Fills the executions ( or error ) of results, the result dicts of scenarios
+    '''
+    if not shadow:
+        for result, scenario in zip(results, scenarios):
+            try:
+                result['executions'] = run_scenario(scenario, integer_clock, merged_timeline, algo_params)
+            except Exception:
+                result['error'] = traceback.format_exc()
+        return
+
+    groups = collections.OrderedDict()  # ( date, shortcode ) -> ( results, scenarios )
+    for result, scenario in zip(results, scenarios):
+        group = groups.setdefault((scenario.date, scenario.shortcode), ([], []))
+        group[0].append(result)
+        group[1].append(scenario)
+    for group_results, group_scenarios in groups.values():
+        try:
+            executions = run_shadow_scenarios(group_scenarios, integer_clock, merged_timeline, algo_params)
+            for result, scenario_executions in zip(group_results, executions):
+                result['executions'] = scenario_executions
+        except Exception:
+            error = traceback.format_exc()
+            for result in group_results:
+                result['error'] = error
+
+
+def run_scenario_chunk(chunk,
+                       integer_clock=False,
+                       merged_timeline=False,
+                       store_path=None,
+                       shadow=False,
+                       algo_params=None):
+    '''
+    Runs ( index, scenario, key ) triplets in this process, returns one result dict per scenario. A failing scenario
+    gives a result with its error instead of failing the whole chunk. With shadow, the scenarios of the chunk with the
+    same date and shortcode are all simulated in one replay ( see run_shadow_scenarios ). algo_params are the
+    parameters of all the algorithms, as in run_scenario
+
+    With a store, each scenario is claimed before it is run and its result is saved. A scenario already done by
+    another worker meanwhile is served from the store, one still running elsewhere is run again but not saved
+    '''
+    store = SimulationStore(store_path) if store_path is not None else None
+    worker = _get_worker_name()
+    results = []
+    try:
+        results_to_run, scenarios_to_run, claimed_keys = [], [], set()
+        for index, scenario, key in chunk:
+            result = {'index': index, 'scenario': scenario._asdict(), 'key': key, 'cached': False}
+            results.append(result)
+            if store is not None:
+                if store.claim(key, worker):
+                    claimed_keys.add(key)
+                else:
+                    stored_results = store.get_results([key])
+                    if key in stored_results:
+                        result.update(stored_results[key], cached=True)
+                        continue
+            result.update(executions=[], error=None)
+            results_to_run.append(result)
+            scenarios_to_run.append(scenario)
+
+        _run_results(results_to_run, scenarios_to_run, integer_clock, merged_timeline, shadow, algo_params)
+
+        for result in results_to_run:
+            if result['key'] in claimed_keys:
+                if result['error'] is None:
+                    store.complete(result['key'], {'executions': result['executions'], 'error': None})
+                else:
+                    store.fail(result['key'], result['error'])
+    finally:
+        if store is not None:
+            store.close()
+    return results
+
+
+def make_chunks(indexed_scenarios, chunk_size):
+    '''
+    Splits ( index, scenario, key ) triplets in chunks of at most chunk_size, grouped on ( date, shortcode ) so that a
+    chunk replays the same bars as often as possible
+    '''
+    indexed_scenarios = sorted(indexed_scenarios, key=lambda x: (x[1].date, x[1].shortcode, x[0]))
+    return [indexed_scenarios[i:i + chunk_size] for i in range(0, len(indexed_scenarios), chunk_size)]
+
+
+def _get_default_chunk_size(num_scenarios, num_workers):
+    return max(1, min(64, num_scenarios // (num_workers * 4)))
+
+
+def _load_shared_bars(store, scenarios):
+    for date, shortcode in sorted(set((scenario.date, scenario.shortcode) for scenario in scenarios)):
+        start_date, end_date = _get_dates(date)
+        filesource = get_data_file_path(shortcode)
+        if os.path.exists(filesource):
+            store.add(filesource, start_date, end_date)
+
+
+def run_sweep(scenarios,
+              num_workers=None,
+              chunk_size=None,
+              shared_bars=False,
+              integer_clock=False,
+              merged_timeline=False,
+              progress=None,
+              store_path=None,
+              shadow=False,
+              algo_params=None):
+    '''
+    Generator over the results of the scenarios ( see run_scenario_chunk ), yielded as they complete
+
+    num_workers : number of worker processes ( default os.cpu_count( ) ), 0 runs the scenarios in this process
+    chunk_size : number of scenarios sent to a worker at a time ( default : about 4 chunks per worker, at most 64 )
+    shared_bars : load the bars once in the parent and share them with the workers through shared memory
+    progress : if given, called with ( number of completed scenarios, number of scenarios, elapsed seconds )
+    store_path : SimulationStore file, the scenarios already done in it are yielded first ( with cached set ) and
+                 only the others are simulated, and saved to it
+    shadow : simulate the scenarios of a chunk which share a date and shortcode in a single replay
+    algo_params : parameters of all the algorithms ( see ExecutionManager ), their defaults if not given. They are part
+                  of the keys of the store, results of other parameters are never served
+    '''
+    num_workers = os.cpu_count() if num_workers is None else num_workers
+    start_time = time.time()
+    num_completed = 0
+
+    indexed_scenarios = [(index, scenario, None) for index, scenario in enumerate(scenarios)]
+    if store_path is not None:
+        options = _get_options(integer_clock, merged_timeline, algo_params)
+        indexed_scenarios = [(index, scenario, get_job_key(scenario._asdict(), options))
+                             for index, scenario, key in indexed_scenarios]
+        with SimulationStore(store_path) as store:
+            stored_results = store.get_results(key for index, scenario, key in indexed_scenarios)
+            store.add_jobs((key, scenario._asdict(), options) for index, scenario, key in indexed_scenarios
+                           if key not in stored_results)
+        for index, scenario, key in indexed_scenarios:
+            if key in stored_results:
+                num_completed += 1
+                result = {'index': index, 'scenario': scenario._asdict(), 'key': key, 'cached': True}
+                result.update(stored_results[key])
+                yield result
+        indexed_scenarios = [x for x in indexed_scenarios if x[2] not in stored_results]
+        if progress is not None and num_completed > 0:
+            progress(num_completed, len(scenarios), time.time() - start_time)
+
+    chunk_size = chunk_size or _get_default_chunk_size(len(indexed_scenarios), max(1, num_workers))
+    chunks = make_chunks(indexed_scenarios, chunk_size)
+
+    if num_workers == 0:
+        for chunk in chunks:
+            for result in run_scenario_chunk(chunk, integer_clock, merged_timeline, store_path, shadow, algo_params):
+                num_completed += 1
+                yield result
+            if progress is not None:
+                progress(num_completed, len(scenarios), time.time() - start_time)
+        return
+
+    with SharedPeriodicBarStore() as shared_bar_store:
+        pool_kwargs = {'max_workers': num_workers}
+        if shared_bars:
+            _load_shared_bars(shared_bar_store, [x[1] for x in indexed_scenarios])
+            pool_kwargs.update(initializer=initialize_shared_bar_worker, initargs=(shared_bar_store.get_registry(), ))
+        with concurrent.futures.ProcessPoolExecutor(**pool_kwargs) as executor:
+            futures = [
+                executor.submit(run_scenario_chunk, chunk, integer_clock, merged_timeline, store_path, shadow,
+                                algo_params) for chunk in chunks
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                for result in future.result():
+                    num_completed += 1
+                    yield result
+                if progress is not None:
+                    progress(num_completed, len(scenarios), time.time() - start_time)
+
+
+def drain_store(store_path):
+    '''
+    Claims and runs the jobs of a SimulationStore until none is left, returns the number of jobs run. Any number of
+    processes can drain the same store
+    '''
+    num_jobs = 0
+    worker = _get_worker_name()
+    with SimulationStore(store_path) as store:
+        while True:
+            job = store.claim_next(worker)
+            if job is None:
+                return num_jobs
+            key, scenario, options = job
+            try:
+                executions = run_scenario(Scenario(**scenario), options['integer_clock'], options['merged_timeline'],
+                                          options.get('algo_params'))
+                store.complete(key, {'executions': executions, 'error': None})
+            except Exception:
+                store.fail(key, traceback.format_exc())
+            num_jobs += 1
+
+
+def print_progress(num_completed, num_scenarios, elapsed_seconds):
+    rate = num_completed / elapsed_seconds if elapsed_seconds > 0 else 0.0
+    remaining_seconds = (num_scenarios - num_completed) / rate if rate > 0 else 0.0
+    sys.stderr.write('\r{}/{} scenarios  {:.1f} scenarios/s  elapsed {:.0f}s  eta {:.0f}s'.format(
+        num_completed, num_scenarios, rate, elapsed_seconds, remaining_seconds))
+    if num_completed == num_scenarios:
+        sys.stderr.write('\n')
+    sys.stderr.flush()
+
+
+def _split(values, convert=str):
+    return [convert(x) for x in values.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs a sweep of execution simulations across worker processes')
+    parser.add_argument('--scenarios', type=str, help='JSON lines file of scenarios, instead of the grid arguments')
+    parser.add_argument('--dates', type=str, help='Comma separated YYYYMMDD dates')
+    parser.add_argument('--shortcodes', type=str, help='Comma separated shortcodes')
+    parser.add_argument('--buysells', type=str, default='B,S', help='Comma separated "B" / "S"')
+    parser.add_argument('--sizes', type=str, default='12', help='Comma separated sizes')
+    parser.add_argument('--algorithms', type=str, default='Direct,MeanRev,Momentum', help='Comma separated algorithms')
+    parser.add_argument('--hhmmss', type=str, help='Comma separated hhmmss (UTC timezone)')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes, 0 to run inline')
+    parser.add_argument('--chunk_size', type=int, default=None, help='Number of scenarios per task')
+    parser.add_argument('--shared_bars', action='store_true', help='Share the bars with the workers in shared memory')
+    parser.add_argument('--integer_clock', action='store_true', help='Keep the time of the watch as unix seconds')
+    parser.add_argument('--merged_timeline', action='store_true', help='Replay a pre-merged timeline of the bars')
+    parser.add_argument('--execution_window', type=int, default=None, help='Seconds given to the algorithms to execute')
+    parser.add_argument('--threshold', type=float, default=None, help='Price change of a minute bar to be a movement')
+    parser.add_argument('--lookback', type=int, default=None, help='Number of minute bars moving the same way to trade')
+    parser.add_argument('--output', type=str, default=None, help='JSON lines output file ( default stdout )')
+    parser.add_argument('--store', type=str, default=None, help='SimulationStore file to memoize and resume the sweep')
+    parser.add_argument('--drain', action='store_true', help='Only run the jobs left in --store, then exit')
+    parser.add_argument('--shadow',
+                        action='store_true',
+                        help='Simulate the scenarios of a chunk sharing a date and shortcode in a single replay')
+    args = parser.parse_args()
+
+    if args.drain:
+        if args.store is None:
+            parser.error('--drain needs --store')
+        sys.stderr.write('{} jobs run\n'.format(drain_store(args.store)))
+        return
+
+    if args.scenarios is not None:
+        scenarios = read_scenarios(args.scenarios)
+    else:
+        if args.dates is None or args.shortcodes is None or args.hhmmss is None:
+            parser.error('either --scenarios or --dates, --shortcodes and --hhmmss are needed')
+        scenarios = make_scenario_grid(_split(args.dates), _split(args.shortcodes), _split(args.buysells),
+                                       _split(args.sizes, int), _split(args.algorithms), _split(args.hhmmss, int))
+
+    algo_params = get_algo_params(args.execution_window, args.threshold, args.lookback)
+    output = open(args.output, 'w') if args.output is not None else sys.stdout
+    try:
+        for result in run_sweep(scenarios,
+                                num_workers=args.workers,
+                                chunk_size=args.chunk_size,
+                                shared_bars=args.shared_bars,
+                                integer_clock=args.integer_clock,
+                                merged_timeline=args.merged_timeline,
+                                progress=print_progress,
+                                store_path=args.store,
+                                shadow=args.shadow,
+                                algo_params=algo_params):
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+#/usr/bin/env python
+'''
+Vectorised backtest of the MeanRev and Momentum execution algorithms ( and Direct ) over the bars of a day.
+
+The event driven simulation replays every minute bar through the watch, the market book, the backtester and the
+algorithm, while the decisions of the algorithms only depend on per bar quantities : the movement ( +1 / -1 / 0 ) of
+the size weighted price of the bar, the seconds since midnight of the watch and the trading status of the book. They
+are computed here with numpy over the arrays of the bars, once per ( date, shortcode ), and each scenario then boils
+down to finding a few indices :
+
+    arrival  : first bar at or after start_midnight_seconds, the arrival price is the mid of its open
+    trigger  : first bar from the arrival on ( and at or after the start time ) where the movements of the last
+               lookback bars all go the way of the algorithm and side, or where the execution window is over
+    fill     : first bar after the trigger while the book is Trading, the BackTester fills at the mid of its close
+
+evaluate_grid runs a whole grid of thresholds x lookbacks x start times x execution windows at once, as arrays of fill
+prices, savings and durations, for parameter studies.
+
+The results have the format of ExecutionManager.results and are equal to the ones of the event driven path ( see
+check_equivalence ), they are meant for screening studies over many scenarios. The prices of the bars are the
+DerivedBarColumns the event driven algorithms read as well.
+
+    python execution/vectorised_backtest.py --dates 20150325,20150326 --shortcodes VWO,BND --hhmmss 133000,150000
+        --output results.jsonl
+    python execution/vectorised_backtest.py --dates 20150325 --shortcodes VWO,BND --hhmmss 133000,150000 --check
+'''
+
+import argparse
+import json
+import sys
+import time
+
+import numpy
+
+from cdefs.defines import ExecAlgoType_t, TradeType_t, get_algo_from_str
+from execution.simulate_execution import get_algo_params, get_start_midnight_seconds
+from execution.simulation_store import get_data_file_path
+from execution.simulation_sweep import make_scenario_grid, read_scenarios, run_scenario, _get_dates, _split
+from mds_messages.periodic_bar_array import DerivedBarColumns, get_periodic_bar_timestamps, sort_periodic_bar_array
+from mds_messages.periodic_bar_cache import PeriodicBarCache
+from mds_messages.periodic_bar_index import load_periodic_bar_array_range
+from utils.datetime_convertor import (EST_TZ, UTC_TZ, get_custom_est_dates_from_unix_seconds,
+                                      get_custom_est_ref_unix_seconds_from_unix_seconds,
+                                      get_custom_est_session_secs_from_midnight, get_unix_timestamp_from_hhmm_tz,
+                                      get_unix_seconds)
+
+MOVEMENT_THRESHOLD = 0.005  # Default parameters of the algorithms
+LOOKBACK = 2
+EXECUTION_WINDOW = 7200
+TRADE_OPEN_HHMM = 930  # Trading session of MarketBook, EST
+TRADE_CLOSE_HHMM = 1600
+DATE_CHANGE_SECONDS = 82800  # Watch only looks for a new date 82800 seconds after the reference time
+
+
+def get_watch_dates(timestamps):
+    '''
+    Replays the date changes of the Watch over sorted timestamps ( unix seconds ). Returns ( first index, trading date,
+    reference time ) of every date, the seconds since midnight of the bars from first index on are timestamp - reference
+    time. Like the watch, the date is only looked at 82800 seconds after the reference time of the current date
+    '''
+    custom_dates = get_custom_est_dates_from_unix_seconds(timestamps)
+    dates = []
+    current_date = numpy.datetime64('NaT', 'D')  # Differs from any date, like the INITIAL_DATE of the watch
+    last_ref_timestamp = 0
+    first_index = 0
+    while first_index < len(timestamps):
+        first_index = max(first_index,
+                          int(numpy.searchsorted(timestamps, last_ref_timestamp + DATE_CHANGE_SECONDS, side='left')))
+        changed = numpy.flatnonzero(custom_dates[first_index:] != current_date)
+        if len(changed) == 0:
+            break
+        first_index += int(changed[0])
+        current_date = custom_dates[first_index]
+        last_ref_timestamp = get_custom_est_ref_unix_seconds_from_unix_seconds(timestamps.item(first_index))
+        dates.append((first_index, current_date.item(), last_ref_timestamp))
+        first_index += 1
+    return dates
+
+
+def get_first_true_index(mask):
+    '''
+    Index of the first True along the last axis of mask, the length of the axis if there is none
+    '''
+    if mask.shape[-1] == 0:
+        return numpy.zeros(mask.shape[:-1], dtype=numpy.int64)
+    return numpy.where(mask.any(axis=-1), mask.argmax(axis=-1), mask.shape[-1])
+
+
+class VectorisedDay(object):
+    def __init__(self, bars, start_date, shortcode=None, secid=0):
+        '''
+        bars : sorted array of C_PERIODIC_BAR records of the simulation, only the ones after the midnight ( UTC ) of
+        start_date are replayed, like SimulationContext.run
+        '''
+        self.shortcode = shortcode
+        self.secid = secid
+        timestamps = get_periodic_bar_timestamps(bars)
+        start_timestamp = get_unix_seconds(get_unix_timestamp_from_hhmm_tz(start_date, 0, UTC_TZ))
+        first_index = int(numpy.searchsorted(timestamps, start_timestamp, side='right'))
+        bars, timestamps = bars[first_index:], timestamps[first_index:]
+
+        # Seconds since midnight of the watch, and trading status of the book, at each bar
+        self.secs_since_midnight = numpy.empty(len(bars), dtype=numpy.int64)
+        self.trading = numpy.zeros(len(bars), dtype=bool)
+        dates = get_watch_dates(timestamps)
+        for i, (begin, date, ref_timestamp) in enumerate(dates):
+            end = dates[i + 1][0] if i + 1 < len(dates) else len(bars)
+            secs_since_midnight = timestamps[begin:end] - ref_timestamp
+            self.secs_since_midnight[begin:end] = secs_since_midnight
+            self.trading[begin:end] = (
+                (secs_since_midnight >= get_custom_est_session_secs_from_midnight(date, TRADE_OPEN_HHMM, EST_TZ)) &
+                (secs_since_midnight <= get_custom_est_session_secs_from_midnight(date, TRADE_CLOSE_HHMM, EST_TZ)))
+
+        # Change of the size weighted price over each bar, the movement of the bar is its sign beyond the threshold
+        derived = DerivedBarColumns(bars)
+        self.price_changes = derived.micro_price_change
+        self.open_mid_prices = derived.open_mid_price
+        self.close_mid_prices = derived.mid_price  # MarketBook.latest_price, at which orders are filled
+
+        # Index of the first Trading bar from each bar on ( len( bars ) if none ), the last entry stands for the end
+        trading_indices = numpy.where(self.trading, numpy.arange(len(bars)), len(bars))
+        self.next_trading_index = numpy.empty(len(bars) + 1, dtype=numpy.int64)
+        self.next_trading_index[-1] = len(bars)
+        self.next_trading_index[:-1] = numpy.minimum.accumulate(trading_indices[::-1])[::-1]
+
+    @staticmethod
+    def Load(shortcode, start_date, end_date, secid=0):
+        '''
+        VectorisedDay of the bars of shortcode over [start_date, end_date], loaded like PeriodicBarFileSource does
+        ( through the process wide PeriodicBarCache )
+        '''
+        filesource = get_data_file_path(shortcode)
+        periodic_bar_columns = PeriodicBarCache.GetUniqueInstance().get(
+            filesource, start_date, end_date,
+            lambda: sort_periodic_bar_array(load_periodic_bar_array_range(filesource, start_date, end_date)))
+        return VectorisedDay(periodic_bar_columns.bars, start_date, shortcode, secid)
+
+    def _get_fill(self, order_index):
+        '''
+        ( index, price ) of the fill of an order sent at order_index ( -1 before the first bar ), None if never filled
+        '''
+        fill_index = self.next_trading_index.item(order_index + 1)
+        if fill_index == len(self.trading):
+            return None
+        return fill_index, self.close_mid_prices.item(fill_index)
+
+    def get_signals(self, thresholds, lookbacks):
+        '''
+        Sum of the movements ( +1 / -1 / 0 ) of the last lookback bars at each bar, for every threshold and lookback,
+        as an array of shape ( thresholds, lookbacks, bars ). 0 where there are fewer than lookback bars so far
+        '''
+        thresholds = numpy.asarray(thresholds, dtype=numpy.float64)[:, None]
+        lookbacks = numpy.asarray(lookbacks, dtype=numpy.int64)
+        movements = (self.price_changes > thresholds).astype(numpy.int64) - (self.price_changes < -thresholds)
+        cumulative_movements = numpy.zeros((len(thresholds), len(self.trading) + 1), dtype=numpy.int64)
+        numpy.cumsum(movements, axis=1, out=cumulative_movements[:, 1:])
+        ends = numpy.arange(1, len(self.trading) + 1)
+        begins = ends[None, :] - lookbacks[:, None]  # ( lookbacks, bars )
+        signals = cumulative_movements[:, ends][:, None, :] - cumulative_movements[:, numpy.maximum(begins, 0)]
+        return numpy.where(begins >= 0, signals, 0)
+
+    def evaluate_grid(self,
+                      algo_type,
+                      trade_type,
+                      start_midnight_seconds,
+                      thresholds=(MOVEMENT_THRESHOLD, ),
+                      lookbacks=(LOOKBACK, ),
+                      execution_windows=(EXECUTION_WINDOW, )):
+        '''
+        Runs algo_type ( MeanRev or Momentum ) for every combination of threshold, lookback, start time and execution
+        window in one numpy computation. Returns a dict of arrays of shape ( thresholds, lookbacks, start times,
+        execution windows ) :
+
+            fill_index     : bar at which the order is filled, number of bars if it is never filled
+            executed_price : fill price, nan if never filled
+            savings        : improvement of the fill price over the arrival price, nan if never filled
+            duration       : seconds from the start time to the fill, nan if never filled
+
+        and arrival_index / arrival_price of shape ( start times, ), nan price if the start time is never reached
+        '''
+        if algo_type == ExecAlgoType_t.MeanRev:
+            direction = -1 if trade_type == TradeType_t.Buy else 1
+        elif algo_type == ExecAlgoType_t.Momentum:
+            direction = 1 if trade_type == TradeType_t.Buy else -1
+        else:
+            raise ValueError("Unknown algorithm: {}".format(algo_type))
+        num_bars = len(self.trading)
+        starts = numpy.asarray(start_midnight_seconds)
+        lookbacks = numpy.asarray(lookbacks, dtype=numpy.int64)
+        bar_indices = numpy.arange(num_bars)
+
+        # The algorithms ignore the bars before their start time, also the ones after a date change
+        started = self.secs_since_midnight[None, :] >= starts[:, None]  # ( start times, bars )
+        arrival_index = get_first_true_index(started)
+        active = started & (bar_indices[None, :] >= arrival_index[:, None])
+
+        # First active bar with all the movements of the lookback in the direction of the algorithm
+        signaled = self.get_signals(thresholds, lookbacks) == direction * lookbacks[None, :, None]
+        triggers = signaled[:, :, None, :] & active[None, None, :, :]  # ( thresholds, lookbacks, start times, bars )
+        first_signal = get_first_true_index(triggers)
+        # First active bar past the execution window
+        ends = starts[:, None] + numpy.asarray(execution_windows)[None, :]
+        timeouts = active[:, None, :] & (self.secs_since_midnight[None, None, :] >= ends[:, :, None])
+        first_timeout = get_first_true_index(timeouts)
+        trigger_index = numpy.minimum(first_signal[:, :, :, None], first_timeout[None, None, :, :])
+
+        # The order sent at the trigger is filled on the next Trading bar
+        fill_index = self.next_trading_index[numpy.minimum(trigger_index + 1, num_bars)]
+        filled = fill_index < num_bars
+        close_mid_prices = numpy.append(self.close_mid_prices, numpy.nan)
+        open_mid_prices = numpy.append(self.open_mid_prices, numpy.nan)
+        secs_since_midnight = numpy.append(self.secs_since_midnight, 0)
+        arrival_price = open_mid_prices[arrival_index]
+        executed_price = close_mid_prices[fill_index]
+        savings = executed_price - arrival_price[None, None, :, None]
+        if trade_type == TradeType_t.Buy:
+            savings *= -1
+        duration = numpy.where(filled, secs_since_midnight[fill_index] - starts[None, None, :, None], numpy.nan)
+        return {
+            'arrival_index': arrival_index,
+            'arrival_price': arrival_price,
+            'fill_index': fill_index,
+            'executed_price': executed_price,
+            'savings': savings,
+            'duration': duration
+        }
+
+    def run(self,
+            algo_type,
+            trade_type,
+            size,
+            start_midnight_seconds,
+            execution_window=EXECUTION_WINDOW,
+            threshold=MOVEMENT_THRESHOLD,
+            lookback=LOOKBACK):
+        '''
+        Performance of one execution, in the format of ExecutionManager.results
+        '''
+        if algo_type == ExecAlgoType_t.Direct:
+            fill = self._get_fill(-1)  # The order is sent before the first bar
+            if fill is None:
+                return []
+            return [{'secid': self.secid, 'executed_price': fill[1], 'executed_size': size}]
+
+        grid = self.evaluate_grid(algo_type, trade_type, [start_midnight_seconds], [threshold], [lookback],
+                                  [execution_window])
+        fill_index = grid['fill_index'].item(0)
+        if fill_index == len(self.trading):
+            return []
+        return [{
+            'secid': self.secid,
+            'shortcode': self.shortcode,
+            'buysell': 'Buy' if trade_type == TradeType_t.Buy else 'Sell',
+            'order_size': size,
+            'start_midnight_seconds': start_midnight_seconds,
+            'arrival_price': grid['arrival_price'].item(0),
+            'executed_price': grid['executed_price'].item(0),
+            'executed_size': size,
+            'savings': grid['savings'].item(0),
+            'duration': self.secs_since_midnight.item(fill_index) - start_midnight_seconds
+        }]
+
+
+def run_vectorised_scenarios(scenarios, algo_params=None):
+    '''
+    Performance of the executions of each scenario ( see simulation_sweep ), the bars of each date and shortcode are
+    only processed once. algo_params are the parameters of the algorithms ( execution_window, threshold, lookback )
+    '''
+    algo_params = algo_params if algo_params is not None else {}
+    days = {}
+    results = []
+    for scenario in scenarios:
+        if (scenario.date, scenario.shortcode) not in days:
+            start_date, end_date = _get_dates(scenario.date)
+            days[(scenario.date, scenario.shortcode)] = VectorisedDay.Load(scenario.shortcode, start_date, end_date)
+        buysell = TradeType_t.Buy if scenario.buysell == 'B' else TradeType_t.Sell
+        results.append(days[(scenario.date, scenario.shortcode)].run(get_algo_from_str(scenario.algorithm), buysell,
+                                                                     scenario.size,
+                                                                     get_start_midnight_seconds(scenario.hhmmss),
+                                                                     **algo_params))
+    return results
+
+
+def check_equivalence(scenarios, integer_clock=False, merged_timeline=False, algo_params=None):
+    '''
+    Runs the scenarios both vectorised and event driven ( simulation_sweep.run_scenario ), returns the
+    ( scenario, vectorised executions, event driven executions ) of the scenarios whose results differ
+    '''
+    mismatches = []
+    for scenario, executions in zip(scenarios, run_vectorised_scenarios(scenarios, algo_params)):
+        expected = run_scenario(scenario, integer_clock, merged_timeline, algo_params)
+        if executions != expected:
+            mismatches.append((scenario, executions, expected))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs execution scenarios with the vectorised backtest')
+    parser.add_argument('--scenarios', type=str, help='JSON lines file of scenarios, instead of the grid arguments')
+    parser.add_argument('--dates', type=str, help='Comma separated YYYYMMDD dates')
+    parser.add_argument('--shortcodes', type=str, help='Comma separated shortcodes')
+    parser.add_argument('--buysells', type=str, default='B,S', help='Comma separated "B" / "S"')
+    parser.add_argument('--sizes', type=str, default='12', help='Comma separated sizes')
+    parser.add_argument('--algorithms', type=str, default='Direct,MeanRev,Momentum', help='Comma separated algorithms')
+    parser.add_argument('--hhmmss', type=str, help='Comma separated hhmmss (UTC timezone)')
+    parser.add_argument('--execution_window', type=int, default=None, help='Execution window of the algorithms')
+    parser.add_argument('--threshold', type=float, default=None, help='Movement threshold of the algorithms')
+    parser.add_argument('--lookback', type=int, default=None, help='Number of minute bars of the signal')
+    parser.add_argument('--output', type=str, default=None, help='JSON lines output file ( default stdout )')
+    parser.add_argument('--check',
+                        action='store_true',
+                        help='Compare the results with the event driven simulation instead of writing them')
+    parser.add_argument('--integer_clock', action='store_true', help='With --check, use the integer clock watch')
+    args = parser.parse_args()
+
+    if args.scenarios is not None:
+        scenarios = read_scenarios(args.scenarios)
+    else:
+        if args.dates is None or args.shortcodes is None or args.hhmmss is None:
+            parser.error('either --scenarios or --dates, --shortcodes and --hhmmss are needed')
+        scenarios = make_scenario_grid(_split(args.dates), _split(args.shortcodes), _split(args.buysells),
+                                       _split(args.sizes, int), _split(args.algorithms), _split(args.hhmmss, int))
+
+    algo_params = get_algo_params(args.execution_window, args.threshold, args.lookback)
+    if args.check:
+        mismatches = check_equivalence(scenarios, args.integer_clock, algo_params=algo_params)
+        for scenario, executions, expected in mismatches:
+            print('Mismatch {} : vectorised {} event driven {}'.format(scenario, executions, expected))
+        print('{} scenarios, {} mismatches'.format(len(scenarios), len(mismatches)))
+        sys.exit(1 if mismatches else 0)
+
+    start_time = time.time()
+    results = run_vectorised_scenarios(scenarios, algo_params)
+    output = open(args.output, 'w') if args.output is not None else sys.stdout
+    try:
+        for index, (scenario, executions) in enumerate(zip(scenarios, results)):
+            output.write(
+                json.dumps({
+                    'index': index,
+                    'scenario': scenario._asdict(),
+                    'executions': executions,
+                    'error': None
+                }) + '\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    sys.stderr.write('{} scenarios in {:.3f}s\n'.format(len(scenarios), time.time() - start_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+#/usr/bin/env python
+'''
+Ingests vendor minute bar drops ( CSV ) into the binary C_PERIODIC_BAR files read by PeriodicBarFileSource.
+
+Expected layout, one bar per line, an optional header line is skipped :
+timestamp,shortcode,open_bid_price,open_bid_size,open_ask_price,open_ask_size,close_bid_price,close_bid_size,
+close_ask_price,close_ask_size,low,high,volume
+where timestamp is either unix seconds or a UTC 'YYYY-MM-DD HH:MM:SS'.
+
+Files are cut into byte ranges on line boundaries and parsed in parallel by a process pool with numpy's vectorised
+text parser. A block the vectorised parser cannot take ( a malformed line, timestamps of both formats ) is parsed again
+line by line, and its malformed lines are rejected and reported with their byte offset in the file. The records are
+then validated, grouped by shortcode, merged with the existing data ( a new bar replaces an existing bar of the same
+timestamp ), sorted and written either as flat files with their PeriodicBarIndex or into a PeriodicBarCatalog.
+'''
+
+from concurrent.futures import ProcessPoolExecutor
+from mds_messages.periodic_bar_array import (PERIODIC_BAR_DTYPE, concatenate_periodic_bar_arrays,
+                                             get_periodic_bar_timestamps, load_periodic_bar_array,
+                                             sort_periodic_bar_array)
+from mds_messages.periodic_bar_catalog import PeriodicBarCatalog
+from mds_messages.periodic_bar_index import PeriodicBarIndex
+
+import argparse
+import io
+import numpy
+import os
+import sys
+import time
+
+DEFAULT_BLOCK_SIZE = 64 << 20  # Bytes of CSV parsed by one task
+MAX_REPORTED_LINES = 20  # Malformed lines reported, per block and in total
+
+CSV_COLUMNS = [('open_bid_price', '<f8'), ('open_bid_size', '<i8'), ('open_ask_price', '<f8'), ('open_ask_size', '<i8'),
+               ('close_bid_price', '<f8'), ('close_bid_size', '<i8'), ('close_ask_price', '<f8'),
+               ('close_ask_size', '<i8'), ('low', '<f8'), ('high', '<f8'), ('volume', '<i8')]
+
+CSV_FIELD_PATHS = [(('open', 'bid_price'), 'open_bid_price'), (('open', 'bid_size'), 'open_bid_size'),
+                   (('open', 'ask_price'), 'open_ask_price'), (('open', 'ask_size'), 'open_ask_size'),
+                   (('close', 'bid_price'), 'close_bid_price'), (('close', 'bid_size'), 'close_bid_size'),
+                   (('close', 'ask_price'), 'close_ask_price'), (('close', 'ask_size'), 'close_ask_size'),
+                   (('low', ), 'low'), (('high', ), 'high'), (('volume', ), 'volume')]
+
+INT32_MAX = 2**31 - 1
+
+
+## @brief Cuts a file into byte ranges of about block_size, each starting at the beginning of a line
+def split_file(filesource, block_size=DEFAULT_BLOCK_SIZE):
+    file_size = os.path.getsize(filesource)
+    ranges = []
+    with open(filesource, 'rb') as file_:
+        begin = 0
+        while begin < file_size:
+            end = min(begin + block_size, file_size)
+            if end < file_size:
+                file_.seek(end)
+                file_.readline()  # Move to the start of the next line
+                end = file_.tell()
+            ranges.append((filesource, begin, end))
+            begin = end
+    return ranges
+
+
+## @brief Returns the bytes of the block and the offset in the file of their first byte ( after the header, if any )
+def _read_block(filesource, begin, end):
+    with open(filesource, 'rb') as file_:
+        file_.seek(begin)
+        data = file_.read(end - begin)
+    if begin == 0:
+        first_line_end = data.find(b'\n') + 1 or len(data)
+        if not data[:first_line_end].lstrip()[:1].isdigit():  # Header line
+            return data[first_line_end:], first_line_end
+    return data, begin
+
+
+## @brief Parses all the lines of data at once with numpy, raises ValueError if any line is malformed
+#  The format of the timestamps is inferred from the first line, and checked on all the others
+#
+def _parse_rows(data):
+    first_field = data.lstrip()[:data.lstrip().find(b',')]
+    is_unix_timestamp = first_field.strip().isdigit()
+    csv_dtype = [('timestamp', '<i8' if is_unix_timestamp else 'U32'), ('shortcode', 'U32')] + CSV_COLUMNS
+    rows = numpy.loadtxt(io.BytesIO(data), delimiter=',', dtype=csv_dtype, ndmin=1, comments=None, encoding='utf-8')
+    if is_unix_timestamp:
+        return rows, rows['timestamp']
+    timestamp_fields = numpy.char.strip(rows['timestamp'])
+    if numpy.any(numpy.char.isdigit(timestamp_fields)):
+        raise ValueError('timestamps of both formats')
+    return rows, timestamp_fields.astype('datetime64[s]').astype(numpy.int64)
+
+
+def _parse_timestamp(field):
+    field = field.strip()
+    if field.isdigit():
+        return int(field)
+    return int(numpy.datetime64(field, 's').astype(numpy.int64))
+
+
+## @brief Parses the lines of data one by one, for the blocks _parse_rows rejects
+#  @return ( rows, timestamps, malformed lines as ( offset in data, line ) )
+#
+def _parse_lines(data):
+    csv_dtype = [('timestamp', '<i8'), ('shortcode', 'U32')] + CSV_COLUMNS
+    values, malformed_lines = [], []
+    offset = 0
+    for line in data.splitlines(True):
+        line_offset, offset = offset, offset + len(line)
+        if len(line.strip()) == 0:
+            continue
+        try:
+            fields = line.decode('utf-8').split(',')
+            if len(fields) != len(csv_dtype):
+                raise ValueError('{} fields instead of {}'.format(len(fields), len(csv_dtype)))
+            values.append((_parse_timestamp(fields[0]), fields[1].strip()) + tuple(
+                float(field) if dtype == '<f8' else int(field)
+                for field, (name, dtype) in zip(fields[2:], CSV_COLUMNS)))
+        except ValueError:
+            malformed_lines.append((line_offset, line.rstrip(b'\r\n').decode('utf-8', 'replace')))
+    rows = numpy.array(values, dtype=csv_dtype)
+    return rows, rows['timestamp'], malformed_lines
+
+
+## @brief Parses a block of CSV lines
+#  @return ( shortcodes, bars, number of lines rejected, number of malformed lines, malformed lines ) with bars in
+#  PERIODIC_BAR_DTYPE. The rejected lines are the malformed ones and the ones which fail validation. At most
+#  MAX_REPORTED_LINES malformed lines are returned, as ( filesource, byte offset, line )
+#
+def parse_block(filesource, begin, end):
+    data, data_begin = _read_block(filesource, begin, end)
+    if len(data.strip()) == 0:
+        return numpy.zeros(0, dtype='U1'), numpy.zeros(0, dtype=PERIODIC_BAR_DTYPE), 0, 0, []
+    try:
+        rows, timestamps = _parse_rows(data)
+        malformed_lines = []
+    except ValueError:
+        rows, timestamps, malformed_lines = _parse_lines(data)
+
+    is_valid = ((timestamps > 0) & (timestamps <= INT32_MAX) & (rows['low'] <= rows['high']) & (rows['volume'] >= 0))
+    for name, dtype in CSV_COLUMNS:
+        if name.endswith('price') or name in ('low', 'high'):
+            is_valid &= numpy.isfinite(rows[name]) & (rows[name] > 0)
+        elif name.endswith('size'):
+            is_valid &= (rows[name] >= 0) & (rows[name] <= INT32_MAX)
+
+    rows, timestamps = rows[is_valid], timestamps[is_valid]
+    bars = numpy.zeros(len(rows), dtype=PERIODIC_BAR_DTYPE)
+    for path, name in CSV_FIELD_PATHS:
+        field = bars
+        for field_name in path:
+            field = field[field_name]
+        field[:] = rows[name]
+    bars['ts']['time']['tv_sec'] = timestamps
+    num_malformed = len(malformed_lines)
+    reported_lines = [(filesource, data_begin + offset, line) for offset, line in malformed_lines[:MAX_REPORTED_LINES]]
+    num_rejected = int(len(is_valid) - numpy.count_nonzero(is_valid)) + num_malformed
+    return numpy.char.strip(rows['shortcode']), bars, num_rejected, num_malformed, reported_lines
+
+
+def _parse_block_task(task):
+    return parse_block(*task)
+
+
+## @brief Keeps the last bar of each timestamp ( bars must be sorted on timestamp with a stable sort )
+def _drop_duplicate_timestamps(bars):
+    if len(bars) == 0:
+        return bars
+    timestamps = get_periodic_bar_timestamps(bars)
+    return bars[numpy.r_[timestamps[1:] != timestamps[:-1], True]]
+
+
+## @brief Merges new bars into the flat file of a shortcode and rebuilds its index
+def write_flat_file(output_dir, shortcode, bars):
+    filesource = os.path.join(output_dir, shortcode)
+    if os.path.exists(filesource):
+        bars = concatenate_periodic_bar_arrays([load_periodic_bar_array(filesource, sort=False), bars])
+    bars = _drop_duplicate_timestamps(sort_periodic_bar_array(bars))
+    records = numpy.zeros(len(bars), dtype=PERIODIC_BAR_DTYPE)  # Zeroed padding, so the output is deterministic
+    records[:] = bars
+    temp_path = '{}.{}.tmp'.format(filesource, os.getpid())
+    records.tofile(temp_path)
+    os.replace(temp_path, filesource)
+    PeriodicBarIndex.GetIndex(filesource)
+
+
+## @brief Parses the CSV files in parallel and writes their bars
+#
+#  @param filesources CSV files to ingest
+#  @param output_dir Directory of the flat files, used if catalog is None
+#  @param catalog PeriodicBarCatalog to write into instead of flat files
+#  @param max_workers Number of parsing processes ( None is one per core )
+#  @return Dictionary of counters : rows, rejected ( including malformed ), malformed, shortcodes, seconds, and
+#  malformed_lines, the first MAX_REPORTED_LINES malformed lines as ( filesource, byte offset, line )
+#
+def ingest(filesources, output_dir=None, catalog=None, max_workers=None, block_size=DEFAULT_BLOCK_SIZE):
+    start_time = time.time()
+    tasks = [task for filesource in filesources for task in split_file(filesource, block_size)]
+    shortcode_arrays, bar_arrays, num_rejected, num_malformed, malformed_lines = [], [], 0, 0, []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for shortcodes, bars, rejected, malformed, lines in executor.map(_parse_block_task, tasks):
+            shortcode_arrays.append(shortcodes)
+            bar_arrays.append(bars)
+            num_rejected += rejected
+            num_malformed += malformed
+            malformed_lines.extend(lines[:MAX_REPORTED_LINES - len(malformed_lines)])
+    if len(bar_arrays) == 0:
+        return {
+            'rows': 0,
+            'rejected': 0,
+            'malformed': 0,
+            'shortcodes': 0,
+            'seconds': time.time() - start_time,
+            'malformed_lines': []
+        }
+
+    shortcodes = numpy.concatenate(shortcode_arrays)
+    bars = concatenate_periodic_bar_arrays(bar_arrays)
+    order = numpy.argsort(shortcodes, kind='stable')  # Keeps the file order inside a shortcode
+    shortcodes, bars = shortcodes[order], bars[order]
+    starts = numpy.flatnonzero(numpy.r_[len(bars) > 0, shortcodes[1:] != shortcodes[:-1]])
+    ends = numpy.r_[starts[1:], len(bars)]
+
+    if catalog is None and not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    for begin, end in zip(starts.tolist(), ends.tolist()):
+        shortcode_bars = _drop_duplicate_timestamps(sort_periodic_bar_array(bars[begin:end]))
+        if catalog is not None:
+            catalog.add_bars(str(shortcodes[begin]), shortcode_bars)
+        else:
+            write_flat_file(output_dir, str(shortcodes[begin]), shortcode_bars)
+    return {
+        'rows': len(bars) + num_rejected,
+        'rejected': num_rejected,
+        'malformed': num_malformed,
+        'shortcodes': len(starts),
+        'seconds': time.time() - start_time,
+        'malformed_lines': malformed_lines
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingests CSV minute bars into the binary minute bar format')
+    parser.add_argument('filesources', type=str, nargs='+', help='CSV files to ingest')
+    parser.add_argument('--output_dir', type=str, default='./datafiles', help='Directory of the flat minute bar files')
+    parser.add_argument('--catalog', type=str, default=None, help='Root of a PeriodicBarCatalog to write into instead')
+    parser.add_argument('--workers', type=int, default=None, help='Number of parsing processes, default one per core')
+    parser.add_argument('--block_size', type=int, default=DEFAULT_BLOCK_SIZE, help='Bytes of CSV per parsing task')
+    args = parser.parse_args()
+
+    catalog = PeriodicBarCatalog(args.catalog) if args.catalog is not None else None
+    stats = ingest(args.filesources, args.output_dir, catalog, args.workers, args.block_size)
+    rows_per_second = stats['rows'] / stats['seconds'] if stats['seconds'] > 0 else 0
+    for filesource, offset, line in stats['malformed_lines']:
+        sys.stderr.write('Malformed line at byte {} of {} : {}\n'.format(offset, filesource, line))
+    sys.stderr.write(
+        'Ingested {} rows ( {} rejected, {} malformed ) for {} shortcodes in {:.2f}s : {:.0f} rows/s\n'.format(
+            stats['rows'], stats['rejected'], stats['malformed'], stats['shortcodes'], stats['seconds'],
+            rows_per_second))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+#/usr/bin/env python
+from mds_messages.periodic_bar_array import (PERIODIC_BAR_DTYPE, concatenate_periodic_bar_arrays,
+                                             get_periodic_bar_timestamps, load_periodic_bar_array,
+                                             sort_periodic_bar_array)
+from utils.datetime_convertor import get_custom_est_dates_from_unix_seconds
+
+import argparse
+import bisect
+import datetime
+import hashlib
+import json
+import lzma
+import numpy
+import os
+import struct
+import zlib
+
+ARCHIVE_MAGIC = b'PBARCHV1'
+ARCHIVE_VERSION = 1
+PRICE_SCALE = 10000  # Prices are stored as integer multiples of 1 / PRICE_SCALE when that is lossless
+
+DEFAULT_CACHE_DIR = '~/.cache/trade-analysis/periodic_bar_archive'  # Default cache_dir, None turns the cache off
+DEFAULT_MAX_CACHE_BYTES = 1 << 30  # 1 GB
+
+# ( column name, path of the field in PERIODIC_BAR_DTYPE, encoding )
+ARCHIVE_COLUMNS = [('ts_sec', ('ts', 'time', 'tv_sec'), 'delta'), ('ts_usec', ('ts', 'time', 'tv_usec'), 'delta'),
+                   ('open_bid_price', ('open', 'bid_price'), 'price'), ('open_bid_size', ('open', 'bid_size'), 'delta'),
+                   ('open_ask_price', ('open', 'ask_price'), 'price'), ('open_ask_size', ('open', 'ask_size'), 'delta'),
+                   ('close_bid_price', ('close', 'bid_price'), 'price'),
+                   ('close_bid_size', ('close', 'bid_size'), 'delta'),
+                   ('close_ask_price', ('close', 'ask_price'), 'price'),
+                   ('close_ask_size', ('close', 'ask_size'), 'delta'), ('low', ('low', ), 'price'),
+                   ('high', ('high', ), 'price'), ('volume', ('volume', ), 'delta')]
+
+COMPRESSORS = {'zlib': (lambda x: zlib.compress(x, 6), zlib.decompress), 'lzma': (lzma.compress, lzma.decompress)}
+
+
+def _get_field(bars, path):
+    for name in path:
+        bars = bars[name]
+    return bars
+
+
+## @brief Delta encodes an integer column, using int32 deltas whenever they fit
+def _encode_deltas(values):
+    deltas = numpy.diff(values.astype(numpy.int64), prepend=numpy.int64(0))
+    if len(deltas) == 0 or (deltas.min() >= -2**31 and deltas.max() < 2**31):
+        return '<i4', deltas.astype('<i4').tobytes()
+    return '<i8', deltas.astype('<i8').tobytes()
+
+
+## @brief Encodes one column of a chunk, returns its description and its bytes
+def _encode_column(values, encoding):
+    if encoding == 'price':
+        ticks = numpy.round(values * PRICE_SCALE)
+        if numpy.all(numpy.isfinite(ticks)) and numpy.all(numpy.abs(ticks) < 2**62) and numpy.array_equal(
+                ticks / PRICE_SCALE, values):
+            dtype, data = _encode_deltas(ticks.astype(numpy.int64))
+            return {'encoding': 'ticks', 'dtype': dtype}, data
+        return {'encoding': 'raw', 'dtype': '<f8'}, values.astype('<f8').tobytes()  # Not on the tick grid, keep as is
+    dtype, data = _encode_deltas(values)
+    return {'encoding': 'delta', 'dtype': dtype}, data
+
+
+def _decode_column(description, data, num_bars):
+    values = numpy.frombuffer(data, dtype=description['dtype'], count=num_bars)
+    if description['encoding'] == 'raw':
+        return values
+    values = numpy.cumsum(values, dtype=numpy.int64)
+    if description['encoding'] == 'ticks':
+        return values / PRICE_SCALE
+    return values
+
+
+## @brief Encodes and compresses the bars of one trading date
+def encode_chunk(bars, codec='zlib'):
+    columns, blobs = [], []
+    for name, path, encoding in ARCHIVE_COLUMNS:
+        description, data = _encode_column(numpy.ascontiguousarray(_get_field(bars, path)), encoding)
+        description['name'] = name
+        description['length'] = len(data)
+        columns.append(description)
+        blobs.append(data)
+    return columns, COMPRESSORS[codec][0](b''.join(blobs))
+
+
+## @brief Decompresses and decodes a chunk back into C_PERIODIC_BAR records
+def decode_chunk(columns, num_bars, compressed, codec='zlib'):
+    data = COMPRESSORS[codec][1](compressed)
+    bars = numpy.zeros(num_bars, dtype=PERIODIC_BAR_DTYPE)
+    begin = 0
+    for (name, path, encoding), description in zip(ARCHIVE_COLUMNS, columns):
+        end = begin + description['length']
+        field = _get_field(bars, path)
+        field[:] = _decode_column(description, data[begin:end], num_bars)
+        begin = end
+    return bars
+
+
+## @brief Writes bars to a compressed columnar archive
+#
+#  Layout : ARCHIVE_MAGIC, uint32 length of the JSON header, the JSON header, then the compressed chunks.
+#  There is one chunk per custom EST trading date. Inside a chunk every column is stored separately,
+#  timestamps and sizes as deltas and prices as deltas of ticks, so that the chunk compresses well.
+#
+def write_archive(archive_path, bars, codec='zlib'):
+    bars = sort_periodic_bar_array(bars)
+    trading_dates = get_custom_est_dates_from_unix_seconds(get_periodic_bar_timestamps(bars))
+    starts = numpy.flatnonzero(numpy.r_[len(bars) > 0, trading_dates[1:] != trading_dates[:-1]])
+    ends = numpy.r_[starts[1:], len(bars)]
+    chunks, blobs, offset = [], [], 0
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        columns, compressed = encode_chunk(bars[start:end], codec)
+        chunks.append({
+            'date': trading_dates[start].item().isoformat(),
+            'num_bars': end - start,
+            'offset': offset,
+            'length': len(compressed),
+            'columns': columns
+        })
+        blobs.append(compressed)
+        offset += len(compressed)
+    header = json.dumps({
+        'version': ARCHIVE_VERSION,
+        'codec': codec,
+        'price_scale': PRICE_SCALE,
+        'chunks': chunks
+    }).encode('utf-8')
+    temp_path = '{}.{}.tmp'.format(archive_path, os.getpid())
+    with open(temp_path, 'wb') as file_:
+        file_.write(ARCHIVE_MAGIC)
+        file_.write(struct.pack('<I', len(header)))
+        file_.write(header)
+        for blob in blobs:
+            file_.write(blob)
+    os.replace(temp_path, archive_path)
+
+
+## @brief Converts a flat minute bar file ( as in datafiles/ ) into an archive
+def convert_file(filesource, archive_path, codec='zlib'):
+    write_archive(archive_path, load_periodic_bar_array(filesource), codec)
+
+
+## @brief Reader of a compressed columnar archive
+#
+#  Decoded chunks are kept in an on-disk cache ( cache_dir, DEFAULT_CACHE_DIR by default, None to turn it off ) as
+#  plain C_PERIODIC_BAR files and memory mapped from there, so only the first read of a trading date pays for
+#  decompression.
+#  Cache entries are named after the path of the archive and its version ( size and modification time ), a rewritten
+#  archive therefore never serves stale bars, and the entries of its previous versions are deleted when the new version
+#  is first cached. Once the cache holds more than max_cache_bytes, the least recently used entries are deleted.
+#
+class PeriodicBarArchive(object):
+    def __init__(self, archive_path, cache_dir=DEFAULT_CACHE_DIR, max_cache_bytes=DEFAULT_MAX_CACHE_BYTES):
+        self.archive_path = archive_path
+        self.cache_dir = os.path.expanduser(cache_dir) if cache_dir is not None else None
+        self.max_cache_bytes = max_cache_bytes
+        with open(archive_path, 'rb') as file_:
+            if file_.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+                raise ValueError('PeriodicBarArchive : {} is not a minute bar archive'.format(archive_path))
+            header_length = struct.unpack('<I', file_.read(4))[0]
+            header = json.loads(file_.read(header_length).decode('utf-8'))
+        if header['version'] != ARCHIVE_VERSION or header['price_scale'] != PRICE_SCALE:
+            raise ValueError('PeriodicBarArchive : Unsupported archive {}'.format(archive_path))
+        self.codec = header['codec']
+        self.chunks = header['chunks']
+        self.dates = [datetime.datetime.strptime(chunk['date'], '%Y-%m-%d').date() for chunk in self.chunks]
+        self.data_offset = len(ARCHIVE_MAGIC) + 4 + header_length
+        stat = os.stat(archive_path)
+        # Cache entries are <path digest>.<version digest>.<trading date>
+        self.cache_prefix = hashlib.sha1(os.path.abspath(archive_path).encode('utf-8')).hexdigest()[:20] + '.'
+        version = '{}:{}'.format(stat.st_size, stat.st_mtime_ns)
+        self.cache_version = hashlib.sha1(version.encode('utf-8')).hexdigest()[:20]
+        self.stale_entries_removed = False
+
+    def _cache_path(self, chunk):
+        return os.path.join(self.cache_dir, '{}{}.{}'.format(self.cache_prefix, self.cache_version, chunk['date']))
+
+    ## @brief Deletes the cache entries of the other versions of the archive, and the least recently used entries
+    #  beyond max_cache_bytes
+    #
+    def _clean_cache(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if name.endswith('.tmp'):
+                    continue
+                if (not self.stale_entries_removed and name.startswith(self.cache_prefix)
+                        and not name.startswith(self.cache_prefix + self.cache_version + '.')):
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+            except OSError:
+                pass  # Removed meanwhile by another process
+        self.stale_entries_removed = True
+        cache_bytes = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if cache_bytes <= self.max_cache_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            cache_bytes -= size
+
+    def _decode(self, chunk):
+        with open(self.archive_path, 'rb') as file_:
+            file_.seek(self.data_offset + chunk['offset'])
+            compressed = file_.read(chunk['length'])
+        return decode_chunk(chunk['columns'], chunk['num_bars'], compressed, self.codec)
+
+    ## @brief Returns the bars of one chunk, from the cache when possible
+    def load_chunk(self, chunk):
+        if self.cache_dir is None:
+            return self._decode(chunk)
+        cache_path = self._cache_path(chunk)
+        if os.path.exists(cache_path):
+            try:
+                os.utime(cache_path)  # Most recently used
+                return load_periodic_bar_array(cache_path, sort=False)
+            except (IOError, OSError):
+                pass  # Evicted meanwhile by another process
+        bars = self._decode(chunk)
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            temp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+            bars.tofile(temp_path)
+            os.replace(temp_path, cache_path)
+            self._clean_cache()
+        except (IOError, OSError):
+            pass  # The cache is only an optimisation
+        return bars
+
+    ## @brief Returns the bars of the trading dates in [start_date, end_date] as one sorted array
+    def load(self, start_date, end_date):
+        begin = bisect.bisect_left(self.dates, start_date)
+        end = bisect.bisect_right(self.dates, end_date)
+        bar_arrays = [self.load_chunk(chunk) for chunk in self.chunks[begin:end]]
+        if len(bar_arrays) == 1:
+            return bar_arrays[0]
+        return concatenate_periodic_bar_arrays(bar_arrays)
+
+
+## @brief Directory of archives named <shortcode>.pba, usable as the catalog of a PeriodicBarFileSource
+#  cache_dir and max_cache_bytes are passed to the archives, see PeriodicBarArchive
+#
+class PeriodicBarArchiveDirectory(object):
+    def __init__(self, root, cache_dir=DEFAULT_CACHE_DIR, max_cache_bytes=DEFAULT_MAX_CACHE_BYTES):
+        self.root = os.path.expanduser(root)
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_bytes
+
+    def get_archive_path(self, shortcode):
+        return os.path.join(self.root, '{}.pba'.format(shortcode))
+
+    def load(self, shortcode, start_date, end_date):
+        return PeriodicBarArchive(self.get_archive_path(shortcode), self.cache_dir,
+                                  self.max_cache_bytes).load(start_date, end_date)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Converts flat minute bar files into compressed archives')
+    parser.add_argument('output_dir', type=str, help='Directory in which <shortcode>.pba archives are written')
+    parser.add_argument('filesources', type=str, nargs='+', help='Minute bar files, the file name is the shortcode')
+    parser.add_argument('--codec', type=str, default='zlib', choices=sorted(COMPRESSORS), help='Compression codec')
+    args = parser.parse_args()
+
+    archive_directory = PeriodicBarArchiveDirectory(args.output_dir)
+    if not os.path.isdir(archive_directory.root):
+        os.makedirs(archive_directory.root)
+    for filesource in args.filesources:
+        archive_path = archive_directory.get_archive_path(os.path.basename(filesource))
+        convert_file(filesource, archive_path, args.codec)
+        print('{} : {} -> {} bytes'.format(filesource, os.path.getsize(filesource), os.path.getsize(archive_path)))
+
+
+if __name__ == '__main__':
+    main()
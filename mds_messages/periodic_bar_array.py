@@ -0,0 +1,202 @@
+from common_data_structures.periodic_bar import PeriodicBarView
+from ctypes import *
+from utils.datetime_convertor import get_custom_est_trading_calendar_from_unix_seconds
+
+import mmap
+import numpy
+import os
+
+
+class C_TimeInternal(Structure):
+    _fields_ = [("tv_usec", c_int), ("tv_sec", c_int)]
+
+
+class C_Time(Union):
+    _fields_ = [("val", c_ulong), ("time", C_TimeInternal)]
+
+
+class C_Quote(Structure):
+    _fields_ = [('bid_price', c_double), ('bid_size', c_int), ('ask_price', c_double), ('ask_size', c_int)]
+
+
+class C_PERIODIC_BAR(Structure):
+    _fields_ = [('open', C_Quote), ('close', C_Quote), ('low', c_double), ('high', c_double), ('volume', c_ulonglong),
+                ('ts', C_Time)]
+
+
+# Structured dtype with exactly the layout ( including padding and the C_Time union ) of C_PERIODIC_BAR,
+# so that a minute bar file can be viewed as an array without decoding record by record
+PERIODIC_BAR_DTYPE = numpy.dtype(C_PERIODIC_BAR)
+
+assert PERIODIC_BAR_DTYPE.itemsize == sizeof(C_PERIODIC_BAR)
+
+
+## @brief Returns the timestamps of the bars as int64 seconds since epoch
+#  Microseconds are dropped, exactly as the object based loader truncates them
+#
+def get_periodic_bar_timestamps(bars):
+    time_ = bars['ts']['time']
+    return time_['tv_sec'].astype(numpy.int64) + time_['tv_usec'] // 1000000
+
+
+def timestamps_are_sorted(timestamps):
+    return len(timestamps) < 2 or bool(numpy.all(timestamps[1:] >= timestamps[:-1]))
+
+
+## @brief Concatenates arrays of bars
+#  numpy.concatenate would canonicalise the C_Time union into separate fields and change the record layout
+#
+def concatenate_periodic_bar_arrays(bar_arrays):
+    output = numpy.empty(sum(len(bars) for bars in bar_arrays), dtype=PERIODIC_BAR_DTYPE)
+    begin = 0
+    for bars in bar_arrays:
+        output[begin:begin + len(bars)] = bars
+        begin += len(bars)
+    return output
+
+
+## @brief Sorts the bars on timestamp, keeping the file order for equal timestamps
+#  When the bars are already in order they are returned as is, so a memory mapped array stays memory mapped
+#
+def sort_periodic_bar_array(bars):
+    timestamps = get_periodic_bar_timestamps(bars)
+    if timestamps_are_sorted(timestamps):
+        return bars
+    return bars[numpy.argsort(timestamps, kind='stable')]
+
+
+## @brief Maps a file of C_PERIODIC_BAR records as one read-only array
+#  A trailing partial record is ignored, the same as a short readinto
+#
+#  @param filesource Path to the minute bar file
+#  @param sort If True the bars are returned sorted on timestamp ( see sort_periodic_bar_array )
+#
+def load_periodic_bar_array(filesource, sort=True):
+    num_bars = os.path.getsize(filesource) // PERIODIC_BAR_DTYPE.itemsize
+    if num_bars == 0:  # numpy cannot map an empty file
+        return numpy.zeros(0, dtype=PERIODIC_BAR_DTYPE)
+    bars = numpy.memmap(filesource, dtype=PERIODIC_BAR_DTYPE, mode='r', shape=(num_bars, ))
+    if sort:
+        bars = sort_periodic_bar_array(bars)
+    return bars
+
+
+## @brief True if the memory of array is a mapping of a file ( e.g. load_periodic_bar_array ), which the page cache
+#  holds instead of the process
+#
+def is_memory_mapped(array):
+    while array is not None:
+        if isinstance(array, mmap.mmap):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+
+## @brief Mid prices of quotes ( the open or close columns of an array of bars )
+def get_mid_prices(quotes):
+    return (quotes['bid_price'].astype(numpy.float64) + quotes['ask_price'].astype(numpy.float64)) / 2
+
+
+## @brief Size weighted ( micro ) prices of quotes ( the open or close columns of an array of bars ), see
+#  get_micro_price
+def get_micro_prices(quotes):
+    bid_price, ask_price = quotes['bid_price'].astype(numpy.float64), quotes['ask_price'].astype(numpy.float64)
+    bid_size, ask_size = quotes['bid_size'].astype(numpy.float64), quotes['ask_size'].astype(numpy.float64)
+    total_size = bid_size + ask_size
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        micro_prices = (bid_price * ask_size + ask_price * bid_size) / total_size
+    return numpy.where(total_size != 0, micro_prices, numpy.nan)
+
+
+## @brief Movements ( +1 / -1 / 0, see get_movement ) of price changes for a threshold
+def get_movements(price_changes, threshold):
+    return (price_changes > threshold).astype(numpy.int8) - (price_changes < -threshold)
+
+
+## @brief Quantities derived from the quotes of an array of bars, computed once with numpy for all the bars instead of
+#  by every listener for every bar. PeriodicBarView reads them through its PeriodicBarColumns, with exactly the values
+#  PeriodicBar computes for a single bar
+#
+class DerivedBarColumns(object):
+    def __init__(self, bars):
+        self.open_mid_price = get_mid_prices(bars['open'])
+        self.mid_price = get_mid_prices(bars['close'])  # Latest price of the market book once the bar is received
+        self.open_micro_price = get_micro_prices(bars['open'])
+        self.micro_price = get_micro_prices(bars['close'])
+        self.spread = bars['close']['ask_price'].astype(numpy.float64) - bars['close']['bid_price']
+        self.bar_return = self.mid_price / self.open_mid_price - 1
+        self.micro_price_change = self.micro_price - self.open_micro_price
+        self.movements = {}  # threshold -> movements of the bars, see get_movements
+
+    def get_movements(self, threshold):
+        if threshold not in self.movements:
+            self.movements[threshold] = get_movements(self.micro_price_change, threshold)
+        return self.movements[threshold]
+
+    ## @brief Bytes of all the columns, including the movements computed so far
+    def get_nbytes(self):
+        columns = [
+            self.open_mid_price, self.mid_price, self.open_micro_price, self.micro_price, self.spread, self.bar_return,
+            self.micro_price_change
+        ] + list(self.movements.values())
+        return sum(column.nbytes for column in columns)
+
+
+## @brief Column store over an array of C_PERIODIC_BAR records
+#  The columns are strided views into the records ( no copy ), only the timestamps are materialised.
+#  Bars are handed out as PeriodicBarView objects which are created on demand and read through to the columns,
+#  so a loaded file costs about the size of its records instead of a Python object graph per bar
+#
+class PeriodicBarColumns(object):
+    def __init__(self, bars, timestamps=None):
+        self.bars = bars
+        self.open_columns = (bars['open']['bid_price'], bars['open']['bid_size'], bars['open']['ask_price'],
+                             bars['open']['ask_size'])
+        self.close_columns = (bars['close']['bid_price'], bars['close']['bid_size'], bars['close']['ask_price'],
+                              bars['close']['ask_size'])
+        self.high = bars['high']
+        self.low = bars['low']
+        self.volume = bars['volume']
+        self.timestamps = timestamps if timestamps is not None else get_periodic_bar_timestamps(bars)
+        self.trading_dates = None  # Custom EST trading calendar of the bars, see annotate_trading_calendar
+        self.ref_times = None
+        self.secs_from_midnight = None
+        self.derived = None  # Derived columns ( mid, micro price ... ) of the bars, see annotate_derived_columns
+
+    ## @brief Computes the trading date, reference time and secs from midnight of all the bars in one pass
+    #  ( once, the columns can be shared by several file sources )
+    #
+    def annotate_trading_calendar(self):
+        if self.secs_from_midnight is None:
+            self.trading_dates, self.ref_times, self.secs_from_midnight = (
+                get_custom_est_trading_calendar_from_unix_seconds(self.timestamps))
+        return self
+
+    ## @brief Computes the derived columns of all the bars in one pass ( once, like the trading calendar )
+    def annotate_derived_columns(self):
+        if self.derived is None:
+            self.derived = DerivedBarColumns(self.bars)
+        return self
+
+    ## @brief Bytes held in memory by the bars, the timestamps and the annotations computed so far. Memory mapped bars
+    #  are not counted, they are in the page cache
+    #
+    def get_nbytes(self):
+        nbytes = self.timestamps.nbytes
+        if not is_memory_mapped(self.bars):
+            nbytes += self.bars.nbytes
+        if self.secs_from_midnight is not None:
+            nbytes += self.trading_dates.nbytes + self.ref_times.nbytes + self.secs_from_midnight.nbytes
+        if self.derived is not None:
+            nbytes += self.derived.get_nbytes()
+        return nbytes
+
+    def __len__(self):
+        return len(self.bars)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.bars)
+        if index < 0 or index >= len(self.bars):
+            raise IndexError('PeriodicBarColumns : index out of range')
+        return PeriodicBarView(self, index)
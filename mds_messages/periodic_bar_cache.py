@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from mds_messages.periodic_bar_array import PeriodicBarColumns
+
+import os
+import threading
+
+DEFAULT_MAX_BYTES = 1 << 30  # 1 GB
+
+
+## @brief Process wide LRU cache of loaded bars, shared by all the file sources of the process
+#
+#  Entries are PeriodicBarColumns keyed on the path, size and modification time of the data file and the
+#  requested date range, so a modified file is never served from the cache. The bars are read-only and can be
+#  shared by any number of file sources. The trading calendar and the derived columns the file sources read are built
+#  before the bars are cached, and an entry counts the bytes of its bars ( unless they are memory mapped ), timestamps
+#  and these annotations ( see PeriodicBarColumns.get_nbytes ). Entries are re-accounted when they are hit, as the
+#  listeners can add derived columns later ( movements of a new threshold ). Least recently used entries are evicted
+#  once the entries exceed max_bytes.
+#
+class PeriodicBarCache(object):
+
+    unique_instance = None
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.entries = OrderedDict()  # key -> ( PeriodicBarColumns, size in bytes ), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def GetUniqueInstance():
+        if PeriodicBarCache.unique_instance is None:
+            PeriodicBarCache.unique_instance = PeriodicBarCache()
+        return PeriodicBarCache.unique_instance
+
+    @staticmethod
+    def RemoveUniqueInstance():
+        PeriodicBarCache.unique_instance = None
+
+    @staticmethod
+    def GetKey(filesource, start_date, end_date):
+        stat = os.stat(filesource)
+        return (os.path.abspath(filesource), stat.st_size, stat.st_mtime_ns, start_date, end_date)
+
+    ## @brief Returns the bars of filesource for [start_date, end_date], calling loader() only on a miss
+    #  @param loader Function returning the sorted array of C_PERIODIC_BAR records to cache
+    #
+    def get(self, filesource, start_date, end_date, loader):
+        key = PeriodicBarCache.GetKey(filesource, start_date, end_date)
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                periodic_bar_columns = self.entries[key][0]
+                self._update_size(key)
+                self._evict()
+                return periodic_bar_columns
+            self.misses += 1
+
+        bars = loader()
+        if bars.flags.writeable:
+            bars.setflags(write=False)
+        periodic_bar_columns = PeriodicBarColumns(bars)
+        periodic_bar_columns.timestamps.setflags(write=False)
+        periodic_bar_columns.annotate_trading_calendar().annotate_derived_columns()  # Counted with the bars
+        size = periodic_bar_columns.get_nbytes()
+
+        with self.lock:
+            if key not in self.entries and size <= self.max_bytes:
+                self.entries[key] = (periodic_bar_columns, size)
+                self.current_bytes += size
+                self._evict()
+        return periodic_bar_columns
+
+    ## @brief Re-accounts the size of the entry of key, for the columns added since it was last accounted
+    def _update_size(self, key):
+        periodic_bar_columns, size = self.entries[key]
+        new_size = periodic_bar_columns.get_nbytes()
+        if new_size != size:
+            self.entries[key] = (periodic_bar_columns, new_size)
+            self.current_bytes += new_size - size
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self.entries:
+            key, (periodic_bar_columns, size) = self.entries.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
+
+    def set_max_bytes(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            for key in list(self.entries):
+                self._update_size(key)
+            self._evict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def get_stats(self):
+        with self.lock:
+            for key in list(self.entries):
+                self._update_size(key)
+            self._evict()
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes
+            }
@@ -0,0 +1,200 @@
+#/usr/bin/env python
+from mds_messages.periodic_bar_array import (PERIODIC_BAR_DTYPE, concatenate_periodic_bar_arrays,
+                                             get_periodic_bar_timestamps, load_periodic_bar_array,
+                                             sort_periodic_bar_array)
+from utils.datetime_convertor import get_custom_est_dates_from_unix_seconds
+
+import argparse
+import datetime
+import json
+import numpy
+import os
+
+MANIFEST_FILE_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+
+## @brief Description of one partition of the catalog, i.e. the bars of one security for one month
+class PeriodicBarPartition(object):
+    def __init__(self, shortcode, period, path, first_date, last_date, first_ts, last_ts, num_bars):
+        self.shortcode = shortcode
+        self.period = period  # yyyymm of the trading dates in this partition
+        self.path = path  # Path of the data file, relative to the catalog root
+        self.first_date = first_date
+        self.last_date = last_date
+        self.first_ts = first_ts
+        self.last_ts = last_ts
+        self.num_bars = num_bars
+
+    def overlaps(self, start_date, end_date):
+        return self.first_date <= end_date and self.last_date >= start_date
+
+    def to_dict(self):
+        return {
+            'shortcode': self.shortcode,
+            'period': self.period,
+            'path': self.path,
+            'first_date': self.first_date.isoformat(),
+            'last_date': self.last_date.isoformat(),
+            'first_ts': self.first_ts,
+            'last_ts': self.last_ts,
+            'num_bars': self.num_bars
+        }
+
+    @staticmethod
+    def FromDict(content):
+        return PeriodicBarPartition(content['shortcode'], content['period'], content['path'],
+                                    datetime.datetime.strptime(content['first_date'], '%Y-%m-%d').date(),
+                                    datetime.datetime.strptime(content['last_date'], '%Y-%m-%d').date(),
+                                    content['first_ts'], content['last_ts'], content['num_bars'])
+
+
+## @brief On disk catalog of minute bars partitioned by security and month
+#
+#  Layout : <root>/<shortcode>/<yyyymm> holds the C_PERIODIC_BAR records of that month sorted on timestamp, and
+#  <root>/manifest.json lists every partition with its time bounds, so that a query only opens the partitions
+#  overlapping the requested dates. Months follow the custom EST trading date of the bars.
+#
+class PeriodicBarCatalog(object):
+    def __init__(self, root):
+        self.root = os.path.expanduser(root)
+        self.partitions = {}  # ( shortcode, period ) -> PeriodicBarPartition
+        self.load_manifest()
+
+    def _manifest_path(self):
+        return os.path.join(self.root, MANIFEST_FILE_NAME)
+
+    def load_manifest(self):
+        self.partitions = {}
+        if not os.path.exists(self._manifest_path()):
+            return
+        with open(self._manifest_path()) as file_:
+            content = json.load(file_)
+        if content.get('version') != MANIFEST_VERSION or content.get('record_size') != PERIODIC_BAR_DTYPE.itemsize:
+            raise ValueError('PeriodicBarCatalog : Unsupported manifest {}'.format(self._manifest_path()))
+        for partition_content in content['partitions']:
+            partition = PeriodicBarPartition.FromDict(partition_content)
+            self.partitions[(partition.shortcode, partition.period)] = partition
+
+    def save_manifest(self):
+        content = {
+            'version': MANIFEST_VERSION,
+            'record_size': PERIODIC_BAR_DTYPE.itemsize,
+            'partitions': [self.partitions[key].to_dict() for key in sorted(self.partitions)]
+        }
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        temp_path = '{}.{}.tmp'.format(self._manifest_path(), os.getpid())
+        with open(temp_path, 'w') as file_:
+            json.dump(content, file_, indent=1)
+        os.replace(temp_path, self._manifest_path())
+
+    def get_shortcodes(self):
+        return sorted(set(shortcode for shortcode, period in self.partitions))
+
+    ## @brief Adds bars of a security to the catalog, merging them into the existing partitions of their months
+    #  Bars with a timestamp already present in a partition replace the old ones
+    #
+    def add_bars(self, shortcode, bars):
+        if len(bars) == 0:
+            return
+        bars = sort_periodic_bar_array(bars)
+        periods = get_custom_est_dates_from_unix_seconds(get_periodic_bar_timestamps(bars)).astype('datetime64[M]')
+        starts = numpy.flatnonzero(numpy.r_[True, periods[1:] != periods[:-1]])
+        ends = numpy.r_[starts[1:], len(bars)]
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            period = int(str(periods[start]).replace('-', ''))
+            self._write_partition(shortcode, period, bars[start:end])
+        self.save_manifest()
+
+    def _write_partition(self, shortcode, period, bars):
+        key = (shortcode, period)
+        relative_path = os.path.join(shortcode, str(period))
+        path = os.path.join(self.root, relative_path)
+        if key in self.partitions:
+            old_bars = load_periodic_bar_array(path)
+            old_bars = old_bars[~numpy.isin(get_periodic_bar_timestamps(old_bars), get_periodic_bar_timestamps(bars))]
+            bars = sort_periodic_bar_array(concatenate_periodic_bar_arrays([old_bars, bars]))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        numpy.ascontiguousarray(bars).tofile(temp_path)
+        os.replace(temp_path, path)
+
+        timestamps = get_periodic_bar_timestamps(bars)
+        trading_dates = get_custom_est_dates_from_unix_seconds(timestamps[[0, -1]])
+        self.partitions[key] = PeriodicBarPartition(shortcode, period, relative_path, trading_dates[0].item(),
+                                                    trading_dates[1].item(), timestamps[0].item(),
+                                                    timestamps[-1].item(), len(bars))
+
+    ## @brief Copies a flat minute bar file ( as in datafiles/ ) into the catalog
+    def import_file(self, shortcode, filesource):
+        self.add_bars(shortcode, load_periodic_bar_array(filesource))
+
+    ## @brief Returns the partitions of the given securities overlapping [start_date, end_date], in time order
+    def get_partitions(self, shortcodes, start_date, end_date):
+        shortcodes = set(shortcodes)
+        partitions = [
+            partition for partition in self.partitions.values()
+            if partition.shortcode in shortcodes and partition.overlaps(start_date, end_date)
+        ]
+        partitions.sort(key=lambda x: (x.period, x.first_ts, x.shortcode))
+        return partitions
+
+    def _load_partition(self, partition, start_date, end_date):
+        bars = load_periodic_bar_array(os.path.join(self.root, partition.path), sort=False)
+        if partition.first_date >= start_date and partition.last_date <= end_date:
+            return bars
+        trading_dates = get_custom_est_dates_from_unix_seconds(get_periodic_bar_timestamps(bars))
+        begin = numpy.searchsorted(trading_dates, numpy.datetime64(start_date, 'D'), side='left')
+        end = numpy.searchsorted(trading_dates, numpy.datetime64(end_date, 'D'), side='right')
+        return bars[begin:end]
+
+    ## @brief Returns the bars of a security for the trading dates in [start_date, end_date] as one sorted array
+    def load(self, shortcode, start_date, end_date):
+        bar_arrays = [
+            self._load_partition(partition, start_date, end_date)
+            for partition in self.get_partitions([shortcode], start_date, end_date)
+        ]
+        if len(bar_arrays) == 1:
+            return bar_arrays[0]
+        return concatenate_periodic_bar_arrays(bar_arrays)
+
+    ## @brief Streams the bars of several securities for [start_date, end_date] in timestamp order, one month at a time
+    #  Bars with equal timestamps are ordered as the shortcodes are
+    #
+    #  @return Generator of ( shortcode_indices, bars ), shortcode_indices[i] being the index in shortcodes of bars[i]
+    #
+    def stream(self, shortcodes, start_date, end_date):
+        shortcode_to_index = dict((shortcode, index) for index, shortcode in enumerate(shortcodes))
+        partitions = self.get_partitions(shortcodes, start_date, end_date)
+        begin = 0
+        while begin < len(partitions):
+            end = begin
+            while end < len(partitions) and partitions[end].period == partitions[begin].period:
+                end += 1
+            period_partitions = sorted(partitions[begin:end], key=lambda x: shortcode_to_index[x.shortcode])
+            bar_arrays = [self._load_partition(partition, start_date, end_date) for partition in period_partitions]
+            shortcode_indices = numpy.concatenate([
+                numpy.full(len(bars), shortcode_to_index[partition.shortcode], dtype=numpy.int32)
+                for partition, bars in zip(period_partitions, bar_arrays)
+            ])
+            bars = concatenate_periodic_bar_arrays(bar_arrays)
+            order = numpy.argsort(get_periodic_bar_timestamps(bars), kind='stable')
+            yield shortcode_indices[order], bars[order]
+            begin = end
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Imports flat minute bar files into a partitioned catalog')
+    parser.add_argument('catalog_root', type=str, help='Root directory of the catalog')
+    parser.add_argument('filesources', type=str, nargs='+', help='Minute bar files, the file name is the shortcode')
+    args = parser.parse_args()
+
+    catalog = PeriodicBarCatalog(args.catalog_root)
+    for filesource in args.filesources:
+        catalog.import_file(os.path.basename(filesource), filesource)
+
+
+if __name__ == '__main__':
+    main()
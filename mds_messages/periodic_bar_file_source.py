@@ -1,135 +1,226 @@
-from common_data_structures.periodic_bar import Quote, PeriodicBar
-from ctypes import *
-from datetime import datetime
+from cdefs.security_name_indexer import SecurityNameIndexer
 from event_processing.external_data_listener import ExternalDataListener
 from event_processing.market_book import MarketBook
-from utils.datetime_convertor import get_unix_timestamp_from_hhmm_tz
+from mds_messages.periodic_bar_array import PeriodicBarColumns, concatenate_periodic_bar_arrays, sort_periodic_bar_array
+from mds_messages.periodic_bar_cache import PeriodicBarCache
+from mds_messages.periodic_bar_index import load_periodic_bar_array_range
+from mds_messages.shared_periodic_bar_store import SharedPeriodicBarRegistry
+from utils.datetime_convertor import get_unix_seconds, get_utc_datetime_from_unix_seconds
 
+import numpy
 import os
-import pytz
-
-
-class C_TimeInternal(Structure):
-    _fields_ = [("tv_usec", c_int), ("tv_sec", c_int)]
-
-
-class C_Time(Union):
-    _fields_ = [("val", c_ulong), ("time", C_TimeInternal)]
-
-
-class C_Quote(Structure):
-    _fields_ = [('bid_price', c_double), ('bid_size', c_int), ('ask_price', c_double), ('ask_size', c_int)]
-
-
-class C_PERIODIC_BAR(Structure):
-    _fields_ = [('open', C_Quote), ('close', C_Quote), ('low', c_double), ('high', c_double), ('volume', c_ulonglong),
-                ('ts', C_Time)]
 
 
 class PeriodicBarFileSource(ExternalDataListener):
-    def __init__(self, shortcode, watch, start_date, end_date, periodic_bar_period=1):
+    supports_event_timeline = True  # All the bars are loaded upfront, see HistoricalDispatcher.run_merged
+
+    def __init__(self,
+                 shortcode,
+                 watch,
+                 start_date,
+                 end_date,
+                 periodic_bar_period=1,
+                 catalog=None,
+                 use_bar_cache=True,
+                 secid=None,
+                 market_book=None,
+                 security_name_indexer=None):
         self.watch = watch
         self.shortcode = shortcode
+        # The security whose market book gets the bars, by default the id of shortcode in the security name indexer
+        # ( the process wide SecurityNameIndexer unless one is given, see SimulationContext )
+        if secid is None:
+            if security_name_indexer is None:
+                security_name_indexer = SecurityNameIndexer.GetUniqueInstance()
+            secid = security_name_indexer.add_symbol(shortcode)
+        self.secid = secid
         self.start_date = start_date  # The date from which this file source should load data
         self.end_date = end_date  # The last date till which this file source should consider data
         self.current_date = start_date  # The date for which csi file source has read the latest struct
         self.current_index = 0
         self.file_reader = None  # The file from which this filesource will read structs
         self.current_quote = None  # The latest read daily_quote (is needed by dispatcher to see the next timestamp of a source)
-        self.market_books = MarketBook.GetUniqueInstances(
-            watch)  # A pointer to the market book to which the data packets are to be sent
+        # The market book to which the data packets are to be sent, by default the unique instance of the security
+        self.market_book = market_book if market_book is not None else MarketBook.GetUniqueInstance(watch, self.secid)
 
-        self.periodic_bars = []
+        self.bar_array = None  # The bars of the file as one array of C_PERIODIC_BAR records
+        self.periodic_bars = []  # Sequence of the bars to dispatch, indexed by current_index
         self.periodic_bar_period = periodic_bar_period
+        self.timeline_start = 0  # Index of the first bar of the timeline of the dispatcher, see get_event_timeline
+        self.catalog = catalog  # If given ( PeriodicBarCatalog, PeriodicBarArchiveDirectory ), bars are loaded from it
+        self.use_bar_cache = use_bar_cache  # Share the loaded files through the process wide PeriodicBarCache
 
         self.load_data()
 
         # Set next_event_timestamp_
-        if self.current_index < len(self.periodic_bars):
-            self.next_event_timestamp = self.periodic_bars[self.current_index].ts
+        if self._has_events():
+            self.next_event_timestamp = self._get_event_timestamp(self.current_index)
         else:
             self.next_event_timestamp = 0  # Go to passive mode
 
+    ## @brief Returns True if there is a bar at current_index
+    #  Derived sources which do not hold all their bars in memory refill periodic_bars here
+    #
+    def _has_events(self):
+        return self.current_index < len(self.periodic_bars)
+
+    ## @brief The time of the bar at index : integer unix seconds if the watch has an integer clock, else a tz aware
+    #  datetime, built only when needed
+    #
+    def _get_event_timestamp(self, index):
+        if self.watch.integer_clock:
+            return self.periodic_bars.timestamps.item(index)
+        return get_utc_datetime_from_unix_seconds(self.periodic_bars.timestamps.item(index))
+
     def _filesource(self, ticker):
         return os.path.expanduser('./datafiles/{}'.format(ticker))
 
     def load_data(self):
-        self.process_etf_data([self._filesource(self.shortcode)])
-        self.periodic_bars.sort(key=lambda x: x.ts)
-
-    @staticmethod
-    def get_minutebar(filesource):
-        output = []
-        with open(filesource, 'rb') as file_:
-            a = C_PERIODIC_BAR()
-            while (file_.readinto(a) == sizeof(C_PERIODIC_BAR)):
-                open_ = Quote(a.open.bid_price, a.open.bid_size, a.open.ask_price, a.open.ask_size)
-                close_ = Quote(a.close.bid_price, a.close.bid_size, a.close.ask_price, a.close.ask_size)
-                ts = datetime.utcfromtimestamp(a.ts.time.tv_sec + a.ts.time.tv_usec / 1000000)
-                ts_with_tz = datetime(year=ts.year,
-                                      month=ts.month,
-                                      day=ts.day,
-                                      hour=ts.hour,
-                                      minute=ts.minute,
-                                      second=ts.second,
-                                      tzinfo=pytz.UTC)
-                elem = PeriodicBar(open_, close_, a.high, a.low, a.volume, ts_with_tz)
-                output.append(elem)
-
-        return output
+        if self.catalog is not None:
+            self.set_bars(self.catalog.load(self.shortcode, self.start_date, self.end_date))
+        else:
+            self.process_etf_data([self._filesource(self.shortcode)])
+
+    ## @brief Sets the array of C_PERIODIC_BAR records ( sorted on timestamp ) this source dispatches
+    def set_bars(self, bar_array):
+        self.set_periodic_bars(PeriodicBarColumns(bar_array))
+
+    def set_periodic_bars(self, periodic_bar_columns):
+        periodic_bar_columns.annotate_trading_calendar()  # Trading dates and secs from midnight of all the bars
+        periodic_bar_columns.annotate_derived_columns()  # Mid, micro price ... of all the bars, read by the listeners
+        self.bar_array = periodic_bar_columns.bars
+        self.periodic_bars = periodic_bar_columns  # Bars are only materialised when dispatched
+
+    def _load_filesource(self, filesource):
+        return sort_periodic_bar_array(load_periodic_bar_array_range(filesource, self.start_date, self.end_date))
+
+    ## @brief Returns the bars of one file : attached from shared memory when the process is a worker of a
+    #  SharedPeriodicBarStore, else from the process wide cache ( if use_bar_cache ), else loaded from disk
+    #
+    def _get_periodic_bar_columns(self, filesource):
+        shared_bar_registry = SharedPeriodicBarRegistry.GetUniqueInstance()
+        if shared_bar_registry is not None:
+            periodic_bar_columns = shared_bar_registry.attach(filesource, self.start_date, self.end_date)
+            if periodic_bar_columns is not None:
+                return periodic_bar_columns
+        if self.use_bar_cache:
+            return PeriodicBarCache.GetUniqueInstance().get(filesource, self.start_date, self.end_date,
+                                                            lambda: self._load_filesource(filesource))
+        return PeriodicBarColumns(self._load_filesource(filesource))
 
     ## @brief Make quote objects from futures data
     #  date,product,specific_ticker,open,high,low,close,contract_volume,contract_oi,total_volume,total_oi
     #
+    #  Only the records of the trading dates in [start_date, end_date] are mapped ( see PeriodicBarIndex ),
+    #  and they are only sorted if their timestamps are not already in order
+    #
     def process_etf_data(self, filesources):
-        for filesource in filesources:
-            min_bar_list = self.get_minutebar(filesource)
-            for minutebar in min_bar_list:
-                self.periodic_bars.append(minutebar)
+        periodic_bar_columns = [self._get_periodic_bar_columns(filesource) for filesource in filesources]
+        if len(periodic_bar_columns) == 1:
+            self.set_periodic_bars(periodic_bar_columns[0])
+        else:
+            bar_arrays = [x.bars for x in periodic_bar_columns]
+            self.set_bars(sort_periodic_bar_array(concatenate_periodic_bar_arrays(bar_arrays)))
+
+    ## @brief Index of the first bar timestamped after end_time ( datetime or unix seconds ), found by binary search
+    #  from the current index
+    #
+    def _get_first_index_after(self, end_time):
+        first_index = int(numpy.searchsorted(self.periodic_bars.timestamps, get_unix_seconds(end_time), side='right'))
+        return max(first_index, self.current_index)
 
     def seek_to_first_event_after(self, end_time):
-        # Go through all the quotes which are timestamped <= end_time
-        while ((self.current_index < len(self.periodic_bars)) and
-               (self.periodic_bars[self.current_index].ts <= end_time)):
-            self.current_index += 1
-        if self.current_index < len(self.periodic_bars):  # If there are more events
+        # Skip all the quotes which are timestamped <= end_time
+        while self._has_events():
+            self.current_index = self._get_first_index_after(end_time)
+            if self.current_index < len(self.periodic_bars):
+                break
+        if self._has_events():  # If there are more events
             source_has_events = True
-            self.next_event_timestamp = self.periodic_bars[self.current_index].ts
+            self.next_event_timestamp = self._get_event_timestamp(self.current_index)
         else:  # there are no more events
             source_has_events = False
             self.next_event_timestamp = 0  # Go to passive mode
         return source_has_events
 
+    ## @brief Delivers the bars from current_index on as one block ( see MarketBook.on_new_minute_bar_batch ), up to
+    #  the first bar at which the watch or a listener of the book needs to act, and not after end_seconds
+    #  ( unix seconds, None for no limit ). Returns False, without doing anything, if that leaves fewer than 2 bars
+    #
+    def _process_batch(self, end_seconds):
+        begin = self.current_index
+        timestamps = self.periodic_bars.timestamps
+        if begin + 1 >= len(timestamps):
+            return False
+        next_timestamp = timestamps.item(begin + 1)
+        batch_end_timestamp = self.market_book.get_batch_end_timestamp()  # Cheaper than the watch, and mostly 0
+        if next_timestamp >= batch_end_timestamp:
+            return False
+        batch_end_timestamp = min(batch_end_timestamp, self.watch.get_next_action_timestamp())
+        if end_seconds is not None:
+            batch_end_timestamp = min(batch_end_timestamp, end_seconds + 1)
+        if next_timestamp >= batch_end_timestamp:
+            return False
+        end = int(numpy.searchsorted(timestamps, batch_end_timestamp, side='left'))
+        self.watch.on_new_market_event(self._get_event_timestamp(end - 1))  # The watch has nothing to do before
+        self.market_book.on_new_minute_bar_batch(self.periodic_bars, begin, end, self.periodic_bar_period)
+        self.current_index = end
+        return True
+
     def process_all_events(self):
         # If there are no events, then simply return
-        if self.current_index == len(self.periodic_bars):
+        if not self._has_events():
             self.next_event_timestamp = 0  # Go to passive mode
             return
         # Else process the events
-        while self.current_index < len(self.periodic_bars):
-            self.next_event_timestamp = self.periodic_bars[self.current_index].ts
+        while self._has_events():
+            if self.market_book.batch_listeners_only and self._process_batch(None):
+                continue
+            self.next_event_timestamp = self._get_event_timestamp(self.current_index)
             self.watch.on_new_market_event(self.next_event_timestamp)  # Notify the watch first
             # Notify the market book
-            self.market_books[0].on_new_minute_bar(self.periodic_bars[self.current_index], self.periodic_bar_period)
+            self.market_book.on_new_minute_bar(self.periodic_bars[self.current_index], self.periodic_bar_period)
             self.current_index += 1
         self.next_event_timestamp = 0  # Since we have processed all events, go to passive mode
 
+    def get_event_timeline(self):
+        self.timeline_start = self.current_index
+        return self.periodic_bars.timestamps[self.current_index:]
+
+    def apply_timeline_event(self, offset, notify_watch):
+        self.current_index = self.timeline_start + offset
+        if notify_watch:
+            self.watch.on_new_market_event(self._get_event_timestamp(self.current_index))  # Notify the watch first
+        self.market_book.update_minute_bar(self.periodic_bars[self.current_index], self.periodic_bar_period)
+        return self.market_book
+
+    def end_timeline(self):
+        self.current_index = len(self.periodic_bars)
+        self.next_event_timestamp = 0  # All the events have been processed, go to passive mode
+
     def process_events_till(self, end_time):
         # If there are no events, return
-        if self.current_index == len(self.periodic_bars):
+        if not self._has_events():
             self.next_event_timestamp = 0  # Go to passive mode
             return
         # Go through all the quotes which are timestamped <= end_time
-        while (self.current_index < len(self.periodic_bars)) and (self.next_event_timestamp <= end_time):
+        end_seconds = None
+        while self._has_events() and (self.next_event_timestamp <= end_time):
+            if self.market_book.batch_listeners_only:
+                if end_seconds is None:
+                    end_seconds = get_unix_seconds(end_time)
+                if self._process_batch(end_seconds):
+                    if self._has_events():
+                        self.next_event_timestamp = self._get_event_timestamp(self.current_index)
+                    continue
             self.watch.on_new_market_event(self.next_event_timestamp)  # Notify the watch first
             # Notify the market book
-            self.market_books[0].on_new_minute_bar(self, self.periodic_bars[self.current_index],
-                                                   self.periodic_bar_period)
+            self.market_book.on_new_minute_bar(self.periodic_bars[self.current_index], self.periodic_bar_period)
             self.current_index += 1
-            if self.current_index < len(self.periodic_bars):
-                self.next_event_timestamp = self.periodic_bars[self.current_index].ts
+            if self._has_events():
+                self.next_event_timestamp = self._get_event_timestamp(self.current_index)
         # If there are events
-        if self.current_index < len(self.periodic_bars):
-            self.next_event_timestamp = self.periodic_bars[self.current_index].ts
+        if self._has_events():
+            self.next_event_timestamp = self._get_event_timestamp(self.current_index)
         else:  # There are no more events
             self.next_event_timestamp = 0  # Go to passive mode
@@ -0,0 +1,118 @@
+from mds_messages.periodic_bar_array import (PERIODIC_BAR_DTYPE, get_periodic_bar_timestamps, load_periodic_bar_array,
+                                             timestamps_are_sorted)
+from utils.datetime_convertor import get_custom_est_dates_from_unix_seconds
+
+import bisect
+import datetime
+import json
+import numpy
+import os
+
+INDEX_FILE_VERSION = 1
+
+
+def get_index_path(filesource):
+    return filesource + '.idx'
+
+
+## @brief Sidecar index of a minute bar file, mapping each trading date to the byte offset and the number of its records
+#
+#  The index is saved next to the data file ( <filesource>.idx ) and remembers the size and modification time of the
+#  data file it was built from, so that it is rebuilt as soon as the data file changes.
+#  Trading dates follow the custom EST definition used by the watch ( see get_custom_est_date_from_unix_timestamp ).
+#  A file whose records are not in timestamp order cannot be sliced by date, it is flagged with is_sorted = False
+#
+class PeriodicBarIndex(object):
+    def __init__(self, data_size, data_mtime_ns, is_sorted, days):
+        self.data_size = data_size
+        self.data_mtime_ns = data_mtime_ns
+        self.is_sorted = is_sorted
+        self.days = days  # List of ( date, offset in bytes, number of records ) sorted on date
+        self.dates = [day[0] for day in days]
+
+    ## @brief Scans the data file once and builds its index
+    @staticmethod
+    def Build(filesource):
+        stat = os.stat(filesource)
+        timestamps = get_periodic_bar_timestamps(load_periodic_bar_array(filesource, sort=False))
+        is_sorted = timestamps_are_sorted(timestamps)
+        days = []
+        if is_sorted and len(timestamps) > 0:
+            trading_dates = get_custom_est_dates_from_unix_seconds(timestamps)
+            starts = numpy.flatnonzero(numpy.r_[True, trading_dates[1:] != trading_dates[:-1]])
+            counts = numpy.diff(numpy.r_[starts, len(timestamps)])
+            for start, count in zip(starts.tolist(), counts.tolist()):
+                days.append((trading_dates[start].item(), start * PERIODIC_BAR_DTYPE.itemsize, count))
+        return PeriodicBarIndex(stat.st_size, stat.st_mtime_ns, is_sorted, days)
+
+    ## @brief Loads the saved index of the data file, returns None if there is none or if it is stale
+    @staticmethod
+    def Load(filesource):
+        try:
+            with open(get_index_path(filesource)) as file_:
+                content = json.load(file_)
+            stat = os.stat(filesource)
+        except (IOError, OSError, ValueError):
+            return None
+        if (content.get('version') != INDEX_FILE_VERSION or content.get('record_size') != PERIODIC_BAR_DTYPE.itemsize
+                or content.get('data_size') != stat.st_size or content.get('data_mtime_ns') != stat.st_mtime_ns):
+            return None
+        days = [(datetime.datetime.strptime(date, '%Y-%m-%d').date(), offset, count)
+                for date, offset, count in content['days']]
+        return PeriodicBarIndex(content['data_size'], content['data_mtime_ns'], content['is_sorted'], days)
+
+    ## @brief Returns an up to date index of the data file, building and saving it if needed
+    @staticmethod
+    def GetIndex(filesource):
+        index = PeriodicBarIndex.Load(filesource)
+        if index is None:
+            index = PeriodicBarIndex.Build(filesource)
+            try:
+                index.save(get_index_path(filesource))
+            except (IOError, OSError):
+                pass  # Read only data directory, the index is simply rebuilt next time
+        return index
+
+    def save(self, index_path):
+        content = {
+            'version': INDEX_FILE_VERSION,
+            'record_size': PERIODIC_BAR_DTYPE.itemsize,
+            'data_size': self.data_size,
+            'data_mtime_ns': self.data_mtime_ns,
+            'is_sorted': self.is_sorted,
+            'days': [(date.isoformat(), offset, count) for date, offset, count in self.days]
+        }
+        temp_path = '{}.{}.tmp'.format(index_path, os.getpid())
+        with open(temp_path, 'w') as file_:
+            json.dump(content, file_)
+        os.replace(temp_path, index_path)  # Atomic, readers see either the old or the new index
+
+    ## @brief Returns ( first record, number of records ) of the trading dates in [start_date, end_date]
+    def get_record_range(self, start_date, end_date):
+        begin = bisect.bisect_left(self.dates, start_date)
+        end = bisect.bisect_right(self.dates, end_date)
+        if begin >= end:
+            return 0, 0
+        first_record = self.days[begin][1] // PERIODIC_BAR_DTYPE.itemsize
+        last_record = self.days[end - 1][1] // PERIODIC_BAR_DTYPE.itemsize + self.days[end - 1][2]
+        return first_record, last_record - first_record
+
+
+## @brief Maps only the records of the trading dates in [start_date, end_date] of a minute bar file
+#  Falls back to loading, sorting and filtering the whole file when its records are not in timestamp order
+#
+def load_periodic_bar_array_range(filesource, start_date, end_date):
+    index = PeriodicBarIndex.GetIndex(filesource)
+    if not index.is_sorted:
+        bars = load_periodic_bar_array(filesource)
+        trading_dates = get_custom_est_dates_from_unix_seconds(get_periodic_bar_timestamps(bars))
+        return bars[(trading_dates >= numpy.datetime64(start_date, 'D'))
+                    & (trading_dates <= numpy.datetime64(end_date, 'D'))]
+    first_record, num_records = index.get_record_range(start_date, end_date)
+    if num_records == 0:
+        return numpy.zeros(0, dtype=PERIODIC_BAR_DTYPE)
+    return numpy.memmap(filesource,
+                        dtype=PERIODIC_BAR_DTYPE,
+                        mode='r',
+                        offset=first_record * PERIODIC_BAR_DTYPE.itemsize,
+                        shape=(num_records, ))
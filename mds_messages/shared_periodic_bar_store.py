@@ -0,0 +1,107 @@
+from mds_messages.periodic_bar_array import (PERIODIC_BAR_DTYPE, PeriodicBarColumns, get_periodic_bar_timestamps,
+                                             sort_periodic_bar_array)
+from mds_messages.periodic_bar_index import load_periodic_bar_array_range
+from multiprocessing import shared_memory
+
+import numpy
+import os
+
+
+def get_shared_bar_key(filesource, start_date, end_date):
+    return (os.path.abspath(filesource), start_date, end_date)
+
+
+## @brief Returns views of ( bars, timestamps ) laid out one after the other in a shared memory buffer
+def _get_shared_arrays(buffer_, num_bars):
+    bars = numpy.ndarray((num_bars, ), dtype=PERIODIC_BAR_DTYPE, buffer=buffer_)
+    timestamps = numpy.ndarray((num_bars, ),
+                               dtype=numpy.int64,
+                               buffer=buffer_,
+                               offset=num_bars * PERIODIC_BAR_DTYPE.itemsize)
+    return bars, timestamps
+
+
+## @brief Parent side of the shared bar store
+#
+#  Loads each file / date range once into a multiprocessing.shared_memory block ( the sorted records followed by
+#  their int64 timestamps ). get_registry( ) gives the picklable name map to hand to the workers, typically with
+#  initialize_shared_bar_worker as the initializer of the process pool. The store owns the blocks : close( ), or
+#  leaving the with block, unlinks them, so it must outlive the pool.
+#
+class SharedPeriodicBarStore(object):
+    def __init__(self):
+        self.blocks = {}  # key -> ( SharedMemory, num_bars )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    ## @brief Loads the bars of filesource for the trading dates in [start_date, end_date] into shared memory
+    def add(self, filesource, start_date, end_date):
+        key = get_shared_bar_key(filesource, start_date, end_date)
+        if key in self.blocks:
+            return
+        bars = sort_periodic_bar_array(load_periodic_bar_array_range(filesource, start_date, end_date))
+        num_bars = len(bars)
+        block = shared_memory.SharedMemory(create=True, size=max(1, num_bars * (PERIODIC_BAR_DTYPE.itemsize + 8)))
+        shared_bars, shared_timestamps = _get_shared_arrays(block.buf, num_bars)
+        shared_bars[:] = bars
+        shared_timestamps[:] = get_periodic_bar_timestamps(bars)
+        del shared_bars, shared_timestamps  # Release the exported buffers, else the block cannot be closed
+        self.blocks[key] = (block, num_bars)
+
+    def get_registry(self):
+        return dict((key, (block.name, num_bars)) for key, (block, num_bars) in self.blocks.items())
+
+    def close(self):
+        for block, num_bars in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+
+
+## @brief Worker side of the shared bar store, attaches file sources to the blocks of a SharedPeriodicBarStore
+class SharedPeriodicBarRegistry(object):
+
+    unique_instance = None
+
+    def __init__(self, registry):
+        self.registry = registry  # key -> ( shared memory name, num_bars ), see SharedPeriodicBarStore.get_registry
+        self.attached = {}  # key -> ( SharedMemory, PeriodicBarColumns ), kept open for the life of the process
+
+    @staticmethod
+    def SetUniqueInstance(registry):
+        SharedPeriodicBarRegistry.unique_instance = SharedPeriodicBarRegistry(registry)
+        return SharedPeriodicBarRegistry.unique_instance
+
+    @staticmethod
+    def GetUniqueInstance():
+        return SharedPeriodicBarRegistry.unique_instance
+
+    @staticmethod
+    def RemoveUniqueInstance():
+        SharedPeriodicBarRegistry.unique_instance = None
+
+    ## @brief Returns read-only PeriodicBarColumns over the shared block of filesource, None if there is no such block
+    def attach(self, filesource, start_date, end_date):
+        key = get_shared_bar_key(filesource, start_date, end_date)
+        if key in self.attached:
+            return self.attached[key][1]
+        if key not in self.registry:
+            return None
+        name, num_bars = self.registry[key]
+        block = shared_memory.SharedMemory(name=name)
+        bars, timestamps = _get_shared_arrays(block.buf, num_bars)
+        bars.setflags(write=False)
+        timestamps.setflags(write=False)
+        self.attached[key] = (block, PeriodicBarColumns(bars, timestamps))
+        return self.attached[key][1]
+
+
+## @brief Initializer of the worker processes of a pool, e.g.
+#  ProcessPoolExecutor( initializer = initialize_shared_bar_worker, initargs = ( store.get_registry( ), ) )
+#
+def initialize_shared_bar_worker(registry):
+    SharedPeriodicBarRegistry.SetUniqueInstance(registry)
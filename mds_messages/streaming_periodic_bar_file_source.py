@@ -0,0 +1,85 @@
+from mds_messages.periodic_bar_array import PERIODIC_BAR_DTYPE, PeriodicBarColumns
+from mds_messages.periodic_bar_file_source import PeriodicBarFileSource
+from mds_messages.periodic_bar_index import PeriodicBarIndex
+
+import numpy
+
+DEFAULT_CHUNK_SIZE = 4096  # Number of bars read from the file at a time
+
+
+##
+# File source which reads its bars from disk chunk_size records at a time, as they get dispatched,
+# instead of loading the whole date range upfront. Memory use does not depend on the length of the history and the
+# first event can be dispatched as soon as the first chunk has been read.
+#
+# Each chunk is a fresh array : bars already handed to listeners stay valid after the next chunk is read, and a chunk
+# is freed as soon as no listener holds one of its bars anymore.
+# The date range is located through the PeriodicBarIndex of the file. Files whose records are not in timestamp order
+# cannot be streamed, for them the source falls back to loading the whole range like PeriodicBarFileSource.
+#
+class StreamingPeriodicBarFileSource(PeriodicBarFileSource):
+    # The bars are not known upfront, HistoricalDispatcher.run_merged falls back to the heap based dispatch
+    supports_event_timeline = False
+
+    def __init__(self,
+                 shortcode,
+                 watch,
+                 start_date,
+                 end_date,
+                 periodic_bar_period=1,
+                 chunk_size=DEFAULT_CHUNK_SIZE,
+                 secid=None,
+                 market_book=None,
+                 security_name_indexer=None):
+        self.chunk_size = chunk_size
+        self.next_record = 0  # Index in the file of the first record not read yet
+        self.end_record = 0  # Index in the file of the record after the last one to dispatch
+        PeriodicBarFileSource.__init__(self,
+                                       shortcode,
+                                       watch,
+                                       start_date,
+                                       end_date,
+                                       periodic_bar_period,
+                                       use_bar_cache=False,
+                                       secid=secid,
+                                       market_book=market_book,
+                                       security_name_indexer=security_name_indexer)
+
+    def load_data(self):
+        filesource = self._filesource(self.shortcode)
+        index = PeriodicBarIndex.GetIndex(filesource)
+        if not index.is_sorted:
+            PeriodicBarFileSource.load_data(self)
+            return
+        first_record, num_records = index.get_record_range(self.start_date, self.end_date)
+        self.next_record = first_record
+        self.end_record = first_record + num_records
+        self.file_reader = open(filesource, 'rb')
+        self.file_reader.seek(first_record * PERIODIC_BAR_DTYPE.itemsize)
+        self.set_bars(numpy.zeros(0, dtype=PERIODIC_BAR_DTYPE))
+        self._read_next_chunk()
+
+    ## @brief Replaces periodic_bars by the next chunk of the file, returns False once the range is exhausted
+    def _read_next_chunk(self):
+        if self.file_reader is None:
+            return False
+        num_records = min(self.chunk_size, self.end_record - self.next_record)
+        if num_records <= 0:
+            self.file_reader.close()
+            self.file_reader = None
+            return False
+        bars = numpy.fromfile(self.file_reader, dtype=PERIODIC_BAR_DTYPE, count=num_records)
+        if len(bars) == 0:  # The file has been truncated since it was indexed
+            self.file_reader.close()
+            self.file_reader = None
+            return False
+        self.next_record += len(bars)
+        self.set_periodic_bars(PeriodicBarColumns(bars))
+        self.current_index = 0
+        return True
+
+    def _has_events(self):
+        while self.current_index >= len(self.periodic_bars):
+            if not self._read_next_chunk():
+                return False
+        return True
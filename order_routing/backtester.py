@@ -2,7 +2,8 @@ import copy
 import logging
 from abc import ABCMeta, abstractmethod
 
-from cdefs.defines import TradingStatus_t, MarketEvent_t
+from cdefs.defines import MAX_NUM_SECURITIES, TradingStatus_t, MarketEvent_t
+from cdefs.timer_queue import INFINITE_TIME
 from cdefs.watch_listener import DateChangeListener
 from cdefs.defines import OrderType_t
 from order_routing.base_order import Order
@@ -67,6 +68,7 @@ class OrderCancelRejectedListener:
 class BackTester(MarketEventListener, DateChangeListener):
 
     unique_instance = None
+    supports_batch_updates = True  # Bars only matter while there are orders to fill
 
     def __init__(self, watch):
         self.watch = watch
@@ -74,7 +76,7 @@ class BackTester(MarketEventListener, DateChangeListener):
         # An array indexed by sec id, each entry of the array is a vector of orders for that security
         # This is because on a particular market update,
         # we will update all orders of a particular secid.
-        self.secid_to_orders = [[] for x in range(256)]
+        self.secid_to_orders = [[] for x in range(MAX_NUM_SECURITIES)]
 
         # Listeners vector
         self.order_confirmed_listener = {}
@@ -96,7 +98,7 @@ class BackTester(MarketEventListener, DateChangeListener):
     ## @brief On date change, backtester will send rejection for all the pending orders */
     def on_date_change(self, new_date):
         return
-        for secid in range(256):
+        for secid in range(MAX_NUM_SECURITIES):
             this_secid_orders = self.secid_to_orders[secid]
             for order in this_secid_orders:
                 self.broadcast_rejection(order.uid, order.secid, order.orderid)
@@ -139,6 +141,15 @@ class BackTester(MarketEventListener, DateChangeListener):
                 unexecuted_orders.append(order)
         self.secid_to_orders[secid] = unexecuted_orders
 
+    ## @brief Orders are filled on the first bar while Trading, the bars of a security can only be batched while it has
+    #  no live order
+    #
+    def get_batch_end_timestamp(self, secid, market_info):
+        return 0 if self.secid_to_orders[secid] else INFINITE_TIME
+
+    def on_market_update_batch(self, secid, market_info, periodic_bars, begin, end):
+        return  # No live order of secid ( see get_batch_end_timestamp ), nothing to fill
+
     def add_order_confirmed_listener(self, uid, listener):
         self.order_confirmed_listener.setdefault(uid, []).append(listener)
 
@@ -1,3 +1,4 @@
+import collections
 import logging
 from abc import ABCMeta, abstractmethod
 
@@ -22,17 +23,21 @@ class PositionUpdateListener:
 
 class BaseOrderManager(OrderConfirmedListener, OrderExecutedListener, OrderCancelledListener, OrderRejectedListener,
                        OrderCancelRejectedListener):
-    def __init__(self, watch, uid):
+    def __init__(self, watch, uid, backtester=None):
         self.watch = watch
         self.orderid = 0
         self.uid = uid
+        # The backtester to which the orders are sent, by default the unique instance ( see SimulationContext )
+        self.backtester = backtester if backtester is not None else BackTester.GetUniqueInstance(watch)
         self.base_trader = self.instantiate_base_trader(uid)
-        self.unconfirmed_orders = [[] for i in range(256)]
-        self.confirmed_orders = [[] for i in range(256)]
+        # Orders of each secid, only created for the securities traded ( there can be many order managers, see
+        # SimulationContext.add_shadow_execution )
+        self.unconfirmed_orders = collections.defaultdict(list)
+        self.confirmed_orders = collections.defaultdict(list)
         self.position_update_listener_list = []
         self.execution_completion_listener_list = []
 
-        backtester = BackTester.GetUniqueInstance(watch)
+        backtester = self.backtester
         backtester.add_order_confirmed_listener(self.uid, self)
         backtester.add_order_executed_listener(self.uid, self)
         backtester.add_order_cancelled_listener(self.uid, self)
@@ -40,7 +45,7 @@ class BaseOrderManager(OrderConfirmedListener, OrderExecutedListener, OrderCance
         backtester.add_order_cancel_rejected_listener(self.uid, self)
 
     def instantiate_base_trader(self, uid):
-        return BaseSimTrader(BackTester.GetUniqueInstance(self.watch), uid)
+        return BaseSimTrader(self.backtester, uid)
 
     def send_order(self, secid, buysell, ordertype, size, price=0.0):
         new_order = Order()
@@ -0,0 +1,38 @@
+import datetime
+import numpy
+import os
+
+from mds_messages.periodic_bar_array import (concatenate_periodic_bar_arrays, get_periodic_bar_timestamps,
+                                             load_periodic_bar_array)
+from utils.datetime_convertor import get_custom_est_dates_from_unix_seconds
+
+DATAFILES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'datafiles')
+SAMPLE_DATE = datetime.date(2015, 3, 25)  # The one trading date of the sample minute bar files
+
+
+## @brief Copies the sample bars of shortcode onto several trading dates, shifted by day_offsets days from SAMPLE_DATE
+def make_multi_day_bars(shortcode, day_offsets):
+    sample_bars = numpy.array(load_periodic_bar_array(os.path.join(DATAFILES_DIR, shortcode)))
+    bar_arrays = []
+    for day_offset in day_offsets:
+        bars = sample_bars.copy()
+        bars['ts']['time']['tv_sec'] += day_offset * 86400
+        bar_arrays.append(bars)
+    return concatenate_periodic_bar_arrays(bar_arrays)
+
+
+## @brief The bars whose trading date is in [start_date, end_date], by brute force
+def select_dates(bars, start_date, end_date):
+    trading_dates = get_custom_est_dates_from_unix_seconds(get_periodic_bar_timestamps(bars)).tolist()
+    return bars[numpy.array([start_date <= trading_date <= end_date for trading_date in trading_dates], dtype=bool)]
+
+
+## @brief Field values of the bars, to compare arrays whatever their padding bytes hold
+def get_bar_values(bars):
+    return [(bar['open'].tolist(), bar['close'].tolist(), bar['low'], bar['high'], bar['volume'],
+             bar['ts']['time'].tolist()) for bar in bars]
+
+
+def write_bars(path, bars):
+    with open(path, 'wb') as file_:
+        file_.write(bars.tobytes())
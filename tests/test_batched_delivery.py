@@ -0,0 +1,147 @@
+import datetime
+import unittest
+
+from cdefs.defines import ExecAlgoType_t, OrderType_t, TradeType_t
+from cdefs.timer_queue import INFINITE_TIME
+from event_processing.market_event_listener import MarketEventListener
+from execution.simulation_context import SimulationContext
+from mds_messages.periodic_bar_file_source import PeriodicBarFileSource
+from mds_messages.streaming_periodic_bar_file_source import StreamingPeriodicBarFileSource
+from periodic_bar_fixtures import SAMPLE_DATE
+
+
+## @brief Listener which does not support batched updates : the bars of its market book are always delivered one by one
+class PerBarListener(MarketEventListener):
+    def on_market_update(self, sec_id, market_info):
+        pass
+
+
+## @brief Listener which can take any block of bars, and logs every bar it is given with the time of the watch
+class BarRecorder(MarketEventListener):
+    supports_batch_updates = True
+
+    def __init__(self, watch, log):
+        self.watch = watch
+        self.log = log
+        self.num_batches = 0
+
+    def get_batch_end_timestamp(self, sec_id, market_info):
+        return INFINITE_TIME
+
+    def on_market_update(self, sec_id, market_info):
+        self.log.append((sec_id, market_info.get_latest_one_minute_bar().ts, self.watch.current_time))
+
+    def on_market_update_batch(self, sec_id, market_info, periodic_bars, begin, end):
+        self.num_batches += 1
+        for index in range(begin, end):
+            self.log.append((sec_id, periodic_bars[index].ts, None))  # The watch is at the last bar of the block
+
+
+## @brief Sends a market order on the first bar at or after trade_secs since midnight, and logs its fill
+#  With batch_end, bars before trade_secs can come in blocks ( see MarketEventListener.get_batch_end_timestamp ),
+#  else only supports_batch_updates is set, which should not let them come in blocks
+#
+class Trader(MarketEventListener):
+    supports_batch_updates = True
+
+    def __init__(self, watch, order_manager, secid, trade_secs, batch_end, log):
+        self.watch = watch
+        self.order_manager = order_manager
+        self.secid = secid
+        self.trade_secs = trade_secs
+        self.batch_end = batch_end
+        self.log = log
+        self.order_sent = False
+        self.order_manager.add_execution_completion_listener(self)
+
+    def get_batch_end_timestamp(self, sec_id, market_info):
+        if not self.batch_end:
+            return MarketEventListener.get_batch_end_timestamp(self, sec_id, market_info)
+        if self.order_sent:
+            return INFINITE_TIME
+        return self.watch.last_ref_timestamp + self.trade_secs
+
+    def on_market_update(self, sec_id, market_info):
+        if not self.order_sent and self.watch.secs_since_midnight >= self.trade_secs:
+            self.log.append(('order', sec_id, self.watch.current_time, market_info.latest_price))
+            self.order_manager.send_order(sec_id, TradeType_t.Buy, OrderType_t.Market, 10)
+            self.order_sent = True
+
+    def on_executed(self, secid, size, buysell, price):
+        self.log.append(('fill', secid, self.watch.current_time, size, price))
+
+
+## @brief Logs the timers of the watch, with the number of bars delivered before each
+class TimerRecorder(object):
+    def __init__(self, watch, bar_log, log):
+        self.watch = watch
+        self.bar_log = bar_log
+        self.log = log
+
+    def on_timer_update(self, timer, current_time):
+        self.log.append(('timer', current_time, self.watch.secs_since_midnight, len(self.bar_log)))
+
+
+class BatchedDeliveryTest(unittest.TestCase):
+    '''
+    Delivering the bars in blocks should not change what the listeners see and do : the bars they are given, the
+    orders sent, their fills and the timers of the watch are the same as with bar by bar delivery
+    '''
+
+    def run_context(self, per_bar, shortcodes, traders, integer_clock, merged_timeline, file_source_class, **kwargs):
+        context = SimulationContext(SAMPLE_DATE, SAMPLE_DATE + datetime.timedelta(1), integer_clock)
+        secids = [
+            context.add_file_source(shortcode, file_source_class=file_source_class, **kwargs).secid
+            for shortcode in shortcodes
+        ]
+        bar_log, trade_log, timer_log = [], [], []
+        recorders = []
+        for secid in secids:
+            market_book = context.get_market_book(secid)
+            recorders.append(BarRecorder(context.watch, bar_log))
+            market_book.add_market_event_listener(recorders[-1])
+            if per_bar:
+                market_book.add_market_event_listener(PerBarListener())
+        for uid, (index, trade_secs, batch_end) in enumerate(traders):
+            order_manager = context.get_order_manager(uid + 1)
+            context.get_market_book(secids[index]).add_market_event_listener(
+                Trader(context.watch, order_manager, secids[index], trade_secs, batch_end, trade_log))
+        context.watch.add_periodic_timer(2700,
+                                         TimerRecorder(context.watch, bar_log, timer_log),
+                                         first_fire_time=1427300000)
+        execution_manager = context.add_execution_manager(ExecAlgoType_t.MeanRev, verbose=False)
+        execution_manager.execute(secids[-1], TradeType_t.Sell, OrderType_t.Market, 12, 62000)
+        context.run(merged_timeline)
+        context.close()
+        num_batches = sum(recorder.num_batches for recorder in recorders)
+        return [(sec_id, bar_time) for sec_id, bar_time, current_time in bar_log], trade_log, timer_log, \
+            execution_manager.results, num_batches
+
+    def assertSameAsPerBarDelivery(self, shortcodes, traders):
+        for integer_clock in [False, True]:
+            for merged_timeline in [False, True]:
+                for file_source_class, kwargs in [(PeriodicBarFileSource, {}),
+                                                  (StreamingPeriodicBarFileSource, {
+                                                      'chunk_size': 37
+                                                  })]:
+                    args = (shortcodes, traders, integer_clock, merged_timeline, file_source_class)
+                    expected = self.run_context(True, *args, **kwargs)
+                    batched = self.run_context(False, *args, **kwargs)
+                    self.assertEqual(0, expected[-1])
+                    self.assertEqual(expected[:-1], batched[:-1])
+                    self.assertEqual(2 * len(traders), len(batched[1]))  # Every order is filled
+                    self.assertEqual(1, len(batched[3]))
+                    if not merged_timeline:  # The merged timeline is replayed bar by bar
+                        self.assertGreater(batched[-1], 0)
+
+    def test_one_security(self):
+        # The bars come in blocks up to the order, then up to its fill on the next bar
+        self.assertSameAsPerBarDelivery(['VWO'], [(0, 59000, True)])
+
+    def test_several_securities(self):
+        # The trader without batch end keeps the bars of its security one by one, so it trades its own security
+        self.assertSameAsPerBarDelivery(['VWO', 'BND', 'LQD'], [(0, 59000, True), (1, 60000, True), (2, 61000, False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
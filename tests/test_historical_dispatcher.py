@@ -0,0 +1,86 @@
+import datetime
+import itertools
+import shutil
+import tempfile
+import unittest
+
+from cdefs.defines import ExecAlgoType_t, OrderType_t, TradeType_t
+from execution.simulation_context import SimulationContext
+from mds_messages.periodic_bar_catalog import PeriodicBarCatalog
+from periodic_bar_fixtures import SAMPLE_DATE, make_multi_day_bars
+
+SHORTCODES = ['VWO', 'BND', 'VWOB']
+
+
+## @brief Logs every notification of a market book, with the time of the watch and the bar of every market book
+class MarketBookRecorder(object):
+    def __init__(self, context, secids, log):
+        self.context = context
+        self.secids = secids
+        self.log = log
+
+    def on_market_update(self, sec_id, market_info):
+        bar_times = []
+        for secid in self.secids:
+            bar = self.context.get_market_book(secid).one_minute_bar
+            bar_times.append(bar.ts if bar is not None else None)
+        self.log.append((sec_id, self.context.watch.current_time, market_info.one_minute_bar.ts, tuple(bar_times)))
+
+
+class RunMergedTest(unittest.TestCase):
+    '''
+    run_merged should deliver the same bars as run, at the same times, with all the market books of a timestamp
+    updated before any listener is notified
+    '''
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.catalog = PeriodicBarCatalog(self.root)
+        for shortcode in SHORTCODES:
+            self.catalog.add_bars(shortcode, make_multi_day_bars(shortcode, [0, 1, 2, 5]))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def run_context(self, integer_clock, merged_timeline):
+        context = SimulationContext(SAMPLE_DATE, SAMPLE_DATE + datetime.timedelta(days=6), integer_clock)
+        log = []
+        secids = [context.add_file_source(shortcode, catalog=self.catalog).secid for shortcode in SHORTCODES]
+        for secid in secids:
+            context.get_market_book(secid).add_market_event_listener(MarketBookRecorder(context, secids, log))
+        execution_manager = context.add_execution_manager(ExecAlgoType_t.MeanRev, verbose=False)
+        for secid, start_midnight_seconds in zip(secids, [52000, 55000, 58000]):
+            execution_manager.execute(secid, TradeType_t.Buy, OrderType_t.Market, 12, start_midnight_seconds)
+        context.run(merged_timeline)
+        context.close()
+        return secids, log, execution_manager.results
+
+    def test_same_bars_and_executions(self):
+        for integer_clock in [False, True]:
+            secids, log, results = self.run_context(integer_clock, False)
+            merged_log, merged_results = self.run_context(integer_clock, True)[1:]
+            self.assertEqual(secids, [stats['secid'] for stats in results])  # Every execution completes
+            self.assertEqual(results, merged_results)
+            self.assertEqual(len(log), len(merged_log))
+
+            # Every notification is at the time of the bar it delivers, and the times never go back
+            for entries in [log, merged_log]:
+                self.assertTrue(all(current_time == bar_time for sec_id, current_time, bar_time, bar_times in entries))
+                self.assertEqual(sorted(entry[1] for entry in entries), [entry[1] for entry in entries])
+
+            # The same bars for each time, in the order the sources were added with run_merged
+            steps = [list(entries) for key, entries in itertools.groupby(log, key=lambda x: x[1])]
+            merged_steps = [list(entries) for key, entries in itertools.groupby(merged_log, key=lambda x: x[1])]
+            self.assertEqual(len(steps), len(merged_steps))
+            for entries, merged_entries in zip(steps, merged_steps):
+                self.assertEqual(entries[0][1], merged_entries[0][1])
+                self.assertEqual(sorted(entry[0] for entry in entries), [entry[0] for entry in merged_entries])
+
+                # All the books of the time are updated before the first listener is notified
+                for sec_id, current_time, bar_time, bar_times in merged_entries:
+                    for entry in merged_entries:
+                        self.assertEqual(current_time, bar_times[secids.index(entry[0])])
+
+
+if __name__ == '__main__':
+    unittest.main()
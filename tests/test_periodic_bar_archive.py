@@ -0,0 +1,95 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from mds_messages.periodic_bar_array import PERIODIC_BAR_DTYPE, is_memory_mapped
+from mds_messages.periodic_bar_archive import PeriodicBarArchive, PeriodicBarArchiveDirectory, write_archive
+from periodic_bar_fixtures import SAMPLE_DATE, get_bar_values, make_multi_day_bars, select_dates
+
+DAY_OFFSETS = [0, 1, 2, 5]
+
+
+class PeriodicBarArchiveTest(unittest.TestCase):
+    '''
+    The bars loaded from an archive, decoded or from the cache, should be the raw bars written to it
+    '''
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.root, 'cache')
+        self.archive_path = os.path.join(self.root, 'VWO.pba')
+        self.bars = make_multi_day_bars('VWO', DAY_OFFSETS)
+        self.dates = [SAMPLE_DATE + datetime.timedelta(days=offset) for offset in [-1] + DAY_OFFSETS + [6]]
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def assertRoundTrip(self, archive, bars):
+        for start_date in self.dates:
+            for end_date in self.dates[self.dates.index(start_date):]:
+                self.assertEqual(get_bar_values(select_dates(bars, start_date, end_date)),
+                                 get_bar_values(archive.load(start_date, end_date)))
+
+    def get_cache_entries(self):
+        return sorted(os.listdir(self.cache_dir)) if os.path.isdir(self.cache_dir) else []
+
+    def test_round_trip(self):
+        for codec in ['zlib', 'lzma']:
+            write_archive(self.archive_path, self.bars, codec)
+            self.assertLess(os.path.getsize(self.archive_path), self.bars.nbytes // 4)
+            self.assertRoundTrip(PeriodicBarArchive(self.archive_path, cache_dir=None), self.bars)
+            self.assertRoundTrip(PeriodicBarArchive(self.archive_path, cache_dir=self.cache_dir), self.bars)
+
+    def test_prices_off_the_tick_grid(self):
+        self.bars['open']['bid_price'][::3] += 1e-7
+        self.bars['high'][5] = 1.0 / 3
+        write_archive(self.archive_path, self.bars)
+        self.assertRoundTrip(PeriodicBarArchive(self.archive_path, cache_dir=None), self.bars)
+
+    def test_cached_chunks_are_memory_mapped(self):
+        write_archive(self.archive_path, self.bars)
+        archive = PeriodicBarArchive(self.archive_path, cache_dir=self.cache_dir)
+        decoded_bars = archive.load(self.dates[1], self.dates[1])
+        self.assertFalse(is_memory_mapped(decoded_bars))
+        self.assertEqual(1, len(self.get_cache_entries()))
+        cached_bars = PeriodicBarArchive(self.archive_path, cache_dir=self.cache_dir).load(self.dates[1], self.dates[1])
+        self.assertTrue(is_memory_mapped(cached_bars))
+        self.assertEqual(get_bar_values(decoded_bars), get_bar_values(cached_bars))
+
+    def test_rewritten_archive_invalidates_cache(self):
+        write_archive(self.archive_path, self.bars)
+        self.assertRoundTrip(PeriodicBarArchive(self.archive_path, cache_dir=self.cache_dir), self.bars)
+        old_entries = self.get_cache_entries()
+        self.assertEqual(len(DAY_OFFSETS), len(old_entries))
+
+        self.bars['volume'] += 1
+        write_archive(self.archive_path, self.bars)
+        stat = os.stat(self.archive_path)
+        os.utime(self.archive_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))  # Coarse mtime filesystems
+        self.assertRoundTrip(PeriodicBarArchive(self.archive_path, cache_dir=self.cache_dir), self.bars)
+        new_entries = self.get_cache_entries()
+        self.assertEqual(len(DAY_OFFSETS), len(new_entries))
+        self.assertFalse(set(old_entries) & set(new_entries))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        write_archive(self.archive_path, self.bars)
+        chunk_bytes = len(select_dates(self.bars, self.dates[1], self.dates[1])) * PERIODIC_BAR_DTYPE.itemsize
+        archive = PeriodicBarArchive(self.archive_path, cache_dir=self.cache_dir, max_cache_bytes=2 * chunk_bytes)
+        for date in self.dates[1:-1]:
+            self.assertEqual(get_bar_values(select_dates(self.bars, date, date)),
+                             get_bar_values(archive.load(date, date)))
+            entries = self.get_cache_entries()
+            self.assertLessEqual(len(entries), 2)
+            self.assertTrue(any(entry.endswith(date.isoformat()) for entry in entries))
+
+    def test_directory(self):
+        directory = PeriodicBarArchiveDirectory(self.root, cache_dir=self.cache_dir)
+        write_archive(directory.get_archive_path('VWO'), self.bars)
+        self.assertEqual(get_bar_values(self.bars), get_bar_values(directory.load('VWO', self.dates[0],
+                                                                                  self.dates[-1])))
+
+
+if __name__ == '__main__':
+    unittest.main()
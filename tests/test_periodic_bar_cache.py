@@ -0,0 +1,110 @@
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+from mds_messages.periodic_bar_array import load_periodic_bar_array
+from mds_messages.periodic_bar_cache import PeriodicBarCache
+from periodic_bar_fixtures import SAMPLE_DATE, get_bar_values, make_multi_day_bars, write_bars
+
+
+class PeriodicBarCacheTest(unittest.TestCase):
+    '''
+    The cache should load each entry once while it is cached, and evict the least recently used entries first
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filesources = []
+        for shortcode in ['VWO', 'VWOB', 'VT']:
+            self.filesources.append(os.path.join(self.directory, shortcode))
+            write_bars(self.filesources[-1], make_multi_day_bars('VWO', [0]))  # Entries of the same size
+        self.loads = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get(self, cache, filesource_index, memory_mapped=False):
+        filesource = self.filesources[filesource_index]
+
+        def loader():
+            self.loads.append(filesource_index)
+            bars = load_periodic_bar_array(filesource)
+            return bars if memory_mapped else numpy.array(bars)
+
+        return cache.get(filesource, SAMPLE_DATE, SAMPLE_DATE, loader)
+
+    def get_entry_bytes(self):
+        cache = PeriodicBarCache()
+        self.get(cache, 0)
+        self.loads = []
+        return cache.get_stats()['bytes']
+
+    def assertStats(self, cache, hits, misses, evictions, entries):
+        stats = cache.get_stats()
+        self.assertEqual((hits, misses, evictions, entries),
+                         (stats['hits'], stats['misses'], stats['evictions'], stats['entries']))
+        self.assertLessEqual(stats['bytes'], stats['max_bytes'])
+
+    def test_hits_return_the_cached_bars(self):
+        cache = PeriodicBarCache()
+        periodic_bar_columns = self.get(cache, 0)
+        self.assertIs(periodic_bar_columns, self.get(cache, 0))
+        self.assertEqual(get_bar_values(load_periodic_bar_array(self.filesources[0])),
+                         get_bar_values(periodic_bar_columns.bars))
+        self.assertFalse(periodic_bar_columns.bars.flags.writeable)
+        self.assertEqual([0], self.loads)
+        self.assertStats(cache, 1, 1, 0, 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = PeriodicBarCache(max_bytes=self.get_entry_bytes() * 5 // 2)  # Room for two entries
+        self.get(cache, 0)
+        self.get(cache, 1)
+        self.get(cache, 0)  # 1 is now the least recently used entry
+        self.assertStats(cache, 1, 2, 0, 2)
+        self.get(cache, 2)  # Evicts 1
+        self.assertStats(cache, 1, 3, 1, 2)
+        self.get(cache, 0)
+        self.get(cache, 2)
+        self.assertStats(cache, 3, 3, 1, 2)
+        self.get(cache, 1)  # Evicts 0
+        self.get(cache, 2)
+        self.get(cache, 0)  # Evicts 1
+        self.assertEqual([0, 1, 2, 1, 0], self.loads)
+        self.assertStats(cache, 4, 5, 3, 2)
+
+    def test_set_max_bytes_evicts(self):
+        entry_bytes = self.get_entry_bytes()
+        cache = PeriodicBarCache()
+        for filesource_index in [0, 1, 2, 0]:
+            self.get(cache, filesource_index)
+        cache.set_max_bytes(entry_bytes * 3 // 2)
+        self.assertStats(cache, 1, 3, 2, 1)
+        self.get(cache, 0)
+        self.assertEqual([0, 1, 2], self.loads)
+        cache.set_max_bytes(entry_bytes // 2)  # An entry larger than max_bytes is not kept
+        self.get(cache, 0)
+        self.assertStats(cache, 2, 4, 3, 0)
+
+    def test_modified_file_is_a_miss(self):
+        cache = PeriodicBarCache()
+        self.get(cache, 0)
+        write_bars(self.filesources[0], make_multi_day_bars('VWO', [1]))
+        stat = os.stat(self.filesources[0])
+        os.utime(self.filesources[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))  # Coarse mtime filesystems
+        periodic_bar_columns = self.get(cache, 0)
+        self.assertEqual([0, 0], self.loads)
+        self.assertEqual(get_bar_values(load_periodic_bar_array(self.filesources[0])),
+                         get_bar_values(periodic_bar_columns.bars))
+        self.assertStats(cache, 0, 2, 0, 2)
+
+    def test_memory_mapped_bars_are_not_counted(self):
+        entry_bytes = self.get_entry_bytes()
+        cache = PeriodicBarCache()
+        self.get(cache, 0, memory_mapped=True)
+        self.assertEqual(entry_bytes - os.path.getsize(self.filesources[0]), cache.get_stats()['bytes'])
+
+
+if __name__ == '__main__':
+    unittest.main()
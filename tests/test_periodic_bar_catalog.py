@@ -0,0 +1,73 @@
+import datetime
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+from mds_messages.periodic_bar_array import get_periodic_bar_timestamps
+from mds_messages.periodic_bar_catalog import PeriodicBarCatalog
+from periodic_bar_fixtures import SAMPLE_DATE, get_bar_values, make_multi_day_bars, select_dates, write_bars
+
+DAY_OFFSETS = [0, 6, 7, 8, 40]  # 2015-03-25, 2015-03-31, 2015-04-01, 2015-04-02, 2015-05-04
+
+
+class PeriodicBarCatalogTest(unittest.TestCase):
+    '''
+    The bars loaded or streamed from the catalog should be the raw bars imported into it
+    '''
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.bars = {shortcode: make_multi_day_bars(shortcode, DAY_OFFSETS) for shortcode in ['VWO', 'BND']}
+        self.catalog = PeriodicBarCatalog(os.path.join(self.root, 'catalog'))
+        for shortcode in sorted(self.bars):
+            filesource = os.path.join(self.root, shortcode)
+            write_bars(filesource, self.bars[shortcode])
+            self.catalog.import_file(shortcode, filesource)
+        self.dates = [SAMPLE_DATE + datetime.timedelta(days=offset) for offset in [-1] + DAY_OFFSETS + [41]]
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_partitions(self):
+        self.assertEqual(
+            [201503, 201504, 201505],
+            [partition.period for partition in self.catalog.get_partitions(['VWO'], self.dates[0], self.dates[-1])])
+        self.assertEqual(['BND', 'VWO'], self.catalog.get_shortcodes())
+
+    def test_load_round_trip(self):
+        for catalog in [self.catalog, PeriodicBarCatalog(self.catalog.root)]:  # Also through the saved manifest
+            for shortcode, bars in self.bars.items():
+                for start_date in self.dates:
+                    for end_date in self.dates[self.dates.index(start_date):]:
+                        self.assertEqual(get_bar_values(select_dates(bars, start_date, end_date)),
+                                         get_bar_values(catalog.load(shortcode, start_date, end_date)))
+
+    def test_add_bars_replaces_equal_timestamps(self):
+        new_bars = make_multi_day_bars('VWO', [7])
+        new_bars['volume'] = 7
+        self.catalog.add_bars('VWO', new_bars)
+        bars = self.catalog.load('VWO', self.dates[0], self.dates[-1])
+        self.assertEqual(len(self.bars['VWO']), len(bars))
+        self.assertEqual(get_bar_values(new_bars), get_bar_values(select_dates(bars, self.dates[3], self.dates[3])))
+        self.assertEqual(get_bar_values(select_dates(self.bars['VWO'], self.dates[4], self.dates[5])),
+                         get_bar_values(select_dates(bars, self.dates[4], self.dates[5])))
+
+    def test_stream_is_in_timestamp_order(self):
+        shortcodes = ['VWO', 'BND']
+        start_date, end_date = self.dates[2], self.dates[4]
+        streamed = [(index, bar) for shortcode_indices, bars in self.catalog.stream(shortcodes, start_date, end_date)
+                    for index, bar in zip(shortcode_indices.tolist(), get_bar_values(bars))]
+
+        expected = []
+        for index, shortcode in enumerate(shortcodes):
+            bars = select_dates(self.bars[shortcode], start_date, end_date)
+            expected.extend(zip(get_periodic_bar_timestamps(bars).tolist(), [index] * len(bars), get_bar_values(bars)))
+        expected.sort(key=lambda x: (x[0], x[1]))  # Equal timestamps in the order of the shortcodes
+        self.assertEqual([(index, bar) for timestamp, index, bar in expected], streamed)
+        self.assertTrue(numpy.all(numpy.diff([bar[5][1] for index, bar in streamed]) >= 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
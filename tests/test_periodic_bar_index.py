@@ -0,0 +1,71 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from mds_messages.periodic_bar_array import is_memory_mapped, load_periodic_bar_array
+from mds_messages.periodic_bar_index import PeriodicBarIndex, get_index_path, load_periodic_bar_array_range
+from periodic_bar_fixtures import SAMPLE_DATE, get_bar_values, make_multi_day_bars, select_dates, write_bars
+
+
+class PeriodicBarIndexTest(unittest.TestCase):
+    '''
+    Range loads through the sidecar index should give the same bars as a full load filtered on trading date
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filesource = os.path.join(self.directory, 'VWO')
+        self.bars = make_multi_day_bars('VWO', [0, 1, 2, 5, 6])
+        write_bars(self.filesource, self.bars)
+        self.dates = [SAMPLE_DATE + datetime.timedelta(days=offset) for offset in range(-1, 8)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertRangeMatchesFullLoad(self, start_date, end_date):
+        expected = select_dates(load_periodic_bar_array(self.filesource), start_date, end_date)
+        bars = load_periodic_bar_array_range(self.filesource, start_date, end_date)
+        self.assertEqual(len(expected), len(bars))
+        self.assertEqual(get_bar_values(expected), get_bar_values(bars))
+        return bars
+
+    def test_ranges_match_full_load(self):
+        for start_date in self.dates:
+            for end_date in self.dates:
+                self.assertRangeMatchesFullLoad(start_date, end_date)
+
+    def test_range_is_memory_mapped(self):
+        bars = self.assertRangeMatchesFullLoad(self.dates[2], self.dates[3])
+        self.assertEqual(2 * len(self.bars) // 5, len(bars))
+        self.assertTrue(is_memory_mapped(bars))
+        self.assertTrue(os.path.exists(get_index_path(self.filesource)))
+
+    def test_index_is_saved_and_reloaded(self):
+        index = PeriodicBarIndex.GetIndex(self.filesource)
+        loaded_index = PeriodicBarIndex.Load(self.filesource)
+        self.assertIsNotNone(loaded_index)
+        self.assertEqual(index.days, loaded_index.days)
+        self.assertEqual([self.dates[1], self.dates[2], self.dates[3], self.dates[6], self.dates[7]], index.dates)
+
+    def test_stale_index_is_rebuilt(self):
+        PeriodicBarIndex.GetIndex(self.filesource)
+        self.bars = make_multi_day_bars('VWO', [0, 3])
+        write_bars(self.filesource, self.bars)
+        stat = os.stat(self.filesource)
+        os.utime(self.filesource, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))  # Coarse mtime filesystems
+        self.assertIsNone(PeriodicBarIndex.Load(self.filesource))
+        for start_date in self.dates:
+            self.assertRangeMatchesFullLoad(start_date, self.dates[-1])
+
+    def test_unsorted_file_falls_back_to_full_load(self):
+        write_bars(self.filesource, make_multi_day_bars('VWO', [2, 0, 1]))
+        self.assertFalse(PeriodicBarIndex.GetIndex(self.filesource).is_sorted)
+        for start_date in self.dates:
+            bars = self.assertRangeMatchesFullLoad(start_date, self.dates[4])
+            self.assertFalse(is_memory_mapped(bars) and len(bars) > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import random
+import unittest
+
+from common_data_structures.rolling_window import RollingWindow
+
+
+class RollingWindowTest(unittest.TestCase):
+    '''
+    The rolling statistics of RollingWindow should match the statistics of the latest values computed by brute force
+    '''
+
+    def assertMatchesBruteForce(self, capacity, series):
+        window = RollingWindow(capacity)
+        values = []
+        for value in series:
+            dropped = window.push(value)
+            self.assertEqual(values[0] if len(values) == capacity else None, dropped)
+            values = (values + [value])[-capacity:]
+
+            self.assertEqual(len(values), len(window))
+            self.assertEqual(len(values) == capacity, window.is_full())
+            self.assertEqual(values, window.get_values())
+            self.assertEqual(values[-1], window[-1])
+            self.assertEqual(values[0], window[-len(values)])
+            self.assertEqual(min(values), window.min())
+            self.assertEqual(max(values), window.max())
+            self.assertEqual(len([x for x in values if x > 0]), window.num_positive)
+            self.assertEqual(len([x for x in values if x < 0]), window.num_negative)
+
+            mean = sum(values) / len(values)
+            variance = sum((x - mean)**2 for x in values) / len(values)
+            scale = max(abs(x) for x in values) + 1.0
+            self.assertAlmostEqual(sum(values), window.sum, delta=1e-9 * scale * len(values))
+            self.assertAlmostEqual(mean, window.mean, delta=1e-9 * scale)
+            self.assertAlmostEqual(variance, window.variance(), delta=1e-9 * scale * scale)
+        return window
+
+    def test_random_series(self):
+        generator = random.Random(11)
+        series = [round(generator.gauss(0, 1), 1) for i in range(2000)]  # With ties and zeros
+        for capacity in [1, 2, 3, 7, 64, 390]:
+            self.assertMatchesBruteForce(capacity, series)
+
+    def test_monotonic_series(self):
+        for capacity in [1, 5]:
+            self.assertMatchesBruteForce(capacity, [float(x) for x in range(50)])
+            self.assertMatchesBruteForce(capacity, [float(-x) for x in range(50)])
+            self.assertMatchesBruteForce(capacity, [3.0] * 20)
+
+    def test_prices(self):
+        # Small moves around a large level, where a naive sum of squares loses the variance
+        generator = random.Random(5)
+        prices = [40.0]
+        for i in range(5000):
+            prices.append(round(prices[-1] + generator.choice([-0.005, 0.0, 0.005]), 3))
+        window = self.assertMatchesBruteForce(30, prices)
+        self.assertGreater(window.variance(), 0.0)
+
+    def test_empty_and_clear(self):
+        window = RollingWindow(3)
+        self.assertEqual(0, len(window))
+        self.assertEqual(0.0, window.variance())
+        self.assertIsNone(window.min())
+        self.assertIsNone(window.max())
+        with self.assertRaises(IndexError):
+            window[0]
+        for value in [1.0, -2.0, 5.0, 4.0]:
+            window.push(value)
+        window.clear()
+        self.assertEqual([], window.get_values())
+        self.assertEqual((0.0, 0.0, 0, 0), (window.sum, window.variance(), window.num_positive, window.num_negative))
+        window.push(-1.0)
+        self.assertEqual((-1.0, -1.0, -1.0), (window.min(), window.max(), window.mean))
+        with self.assertRaises(ValueError):
+            RollingWindow(0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import datetime
+import unittest
+
+from cdefs.defines import ExecAlgoType_t, TradeType_t
+from execution.simulation_context import SimulationContext
+from execution.simulation_sweep import Scenario, make_scenario_grid, run_scenario, run_shadow_scenarios, run_sweep
+from periodic_bar_fixtures import SAMPLE_DATE
+
+
+class ShadowExecutionTest(unittest.TestCase):
+    '''
+    Executions sharing one replay as shadow executions should perform exactly as when each is simulated on its own,
+    including executions of the same security at the same time
+    '''
+
+    def setUp(self):
+        self.scenarios = make_scenario_grid(['20150325'], ['VWO'], ['B', 'S'], [12, 300],
+                                            ['MeanRev', 'Momentum', 'Direct'], [0, 143000, 150000, 173500])
+        self.scenarios.append(self.scenarios[5])  # The same execution twice
+
+    def drop_secids(self, executions):
+        return [dict((name, value) for name, value in stats.items() if name != 'secid') for stats in executions]
+
+    def assertSameAsIndependentRuns(self, scenarios, **kwargs):
+        expected_executions = [run_scenario(scenario, **kwargs) for scenario in scenarios]
+        self.assertTrue(all(expected_executions))
+        self.assertEqual(expected_executions, run_shadow_scenarios(scenarios, **kwargs))
+
+    def test_default_parameters(self):
+        self.assertSameAsIndependentRuns(self.scenarios)
+
+    def test_integer_clock_and_merged_timeline(self):
+        self.assertSameAsIndependentRuns(self.scenarios, integer_clock=True, merged_timeline=True)
+
+    def test_algo_params(self):
+        algo_params = {'execution_window': 3600, 'threshold': 0.002, 'lookback': 3}
+        self.assertSameAsIndependentRuns(self.scenarios, algo_params=algo_params)
+
+    def test_several_securities(self):
+        scenarios = [
+            Scenario('20150325', 'VWO', 'B', 12, 'MeanRev', 143000),
+            Scenario('20150325', 'BND', 'S', 12, 'Momentum', 150000),
+            Scenario('20150325', 'VWO', 'S', 12, 'Direct', 150000)
+        ]
+        with SimulationContext(SAMPLE_DATE, SAMPLE_DATE + datetime.timedelta(1)) as context:
+            secids = {'VWO': context.add_file_source('VWO').secid, 'BND': context.add_file_source('BND').secid}
+            execution_managers = [
+                context.add_shadow_execution(secids['VWO'], TradeType_t.Buy, 12, 52200, ExecAlgoType_t.MeanRev),
+                context.add_shadow_execution(secids['BND'], TradeType_t.Sell, 12, 54000, ExecAlgoType_t.Momentum),
+                context.add_shadow_execution(secids['VWO'], TradeType_t.Sell, 12, 54000, ExecAlgoType_t.Direct)
+            ]
+            self.assertEqual(3, len(set(id(context.get_order_manager(uid)) for uid in range(3))))
+            context.run()
+        # The secids of the securities are not the same as in a context of their own
+        self.assertEqual([self.drop_secids(run_scenario(scenario)) for scenario in scenarios],
+                         [self.drop_secids(execution_manager.results) for execution_manager in execution_managers])
+
+    def test_sweep(self):
+        results = list(run_sweep(self.scenarios, num_workers=0, shadow=False))
+        shadow_results = list(run_sweep(self.scenarios, num_workers=0, chunk_size=len(self.scenarios), shadow=True))
+        self.assertEqual(sorted((result['index'], result['executions']) for result in results),
+                         sorted((result['index'], result['executions']) for result in shadow_results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import datetime
+import threading
+import unittest
+
+from cdefs.defines import ExecAlgoType_t, OrderType_t, TradeType_t
+from cdefs.security_name_indexer import SecurityNameIndexer
+from cdefs.watch import Watch
+from event_processing.market_book import MarketBook
+from execution.simulation_context import SimulationContext
+from order_routing.backtester import BackTester
+from periodic_bar_fixtures import SAMPLE_DATE
+
+# ( shortcodes, algo type, ( shortcode, buysell, start secs from midnight ) of the executions, integer clock )
+SCENARIOS = [(['VWO', 'BND'], ExecAlgoType_t.MeanRev, [('VWO', TradeType_t.Buy, 52000),
+                                                       ('BND', TradeType_t.Sell, 55000)], False),
+             (['BND'], ExecAlgoType_t.Momentum, [('BND', TradeType_t.Buy, 50000)], True),
+             (['LQD', 'VWO', 'VTI'], ExecAlgoType_t.Direct, [('VTI', TradeType_t.Sell, 58000),
+                                                             ('VWO', TradeType_t.Buy, 45000)], False),
+             (['VWO'], ExecAlgoType_t.MeanRev, [('VWO', TradeType_t.Sell, 60000)], True)]
+
+
+## @brief Builds a context of the scenario, ready to run, and returns it with its execution manager
+def make_context(scenario):
+    shortcodes, algo_type, executions, integer_clock = scenario
+    context = SimulationContext(SAMPLE_DATE, SAMPLE_DATE + datetime.timedelta(days=1), integer_clock)
+    secids = dict((shortcode, context.add_file_source(shortcode).secid) for shortcode in shortcodes)
+    execution_manager = context.add_execution_manager(algo_type, verbose=False)
+    for shortcode, buysell, start_midnight_seconds in executions:
+        execution_manager.execute(secids[shortcode], buysell, OrderType_t.Market, 12, start_midnight_seconds)
+    return context, execution_manager
+
+
+def run_scenario(scenario):
+    context, execution_manager = make_context(scenario)
+    with context:
+        context.run()
+    return execution_manager.results
+
+
+class SimulationContextTest(unittest.TestCase):
+    '''
+    Simulations in different contexts should not see each other, whether they are built together, run one after the
+    other or run at the same time, and should leave the process wide unique instances alone
+    '''
+
+    def setUp(self):
+        self.unique_instances = self.get_unique_instances()
+        self.expected_results = [run_scenario(scenario) for scenario in SCENARIOS]
+        for scenario, results in zip(SCENARIOS, self.expected_results):
+            self.assertEqual(len(scenario[2]), len(results))  # Every execution completes
+
+    def tearDown(self):
+        self.assertEqual(self.unique_instances, self.get_unique_instances())
+
+    def get_unique_instances(self):
+        return (Watch.unique_instance, SecurityNameIndexer.unique_instance, BackTester.unique_instance,
+                list(MarketBook.unique_instances))
+
+    def test_contexts_built_together(self):
+        contexts = [make_context(scenario) for scenario in SCENARIOS]
+        self.assertEqual(0, contexts[1][0].security_name_indexer.get_id_from_shortcode('BND'))
+        for context, execution_manager in reversed(contexts):
+            context.run()
+            context.close()
+        self.assertEqual(self.expected_results, [execution_manager.results for context, execution_manager in contexts])
+
+    def test_contexts_run_in_threads(self):
+        results = [None] * len(SCENARIOS) * 3
+        barrier = threading.Barrier(len(results))
+
+        def run(index):
+            barrier.wait()
+            results[index] = run_scenario(SCENARIOS[index % len(SCENARIOS)])
+
+        threads = [threading.Thread(target=run, args=(index, )) for index in range(len(results))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.expected_results * 3, results)
+
+    def test_close(self):
+        context, execution_manager = make_context(SCENARIOS[0])
+        file_sources = context.file_sources
+        with context:
+            context.run()
+        self.assertTrue(all(file_source.file_reader is None for file_source in file_sources))
+        self.assertEqual([], [market_book for market_book in context.market_books if market_book is not None])
+        self.assertEqual(self.expected_results[0], execution_manager.results)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from execution import simulation_store
+from execution.simulation_store import SimulationStore, get_job_key
+from execution.simulation_sweep import _get_options, drain_store, make_scenario_grid, run_scenario, run_sweep
+
+
+class SimulationStoreTest(unittest.TestCase):
+    '''
+    Jobs of a SimulationStore should be claimed by one worker at a time, and a sweep run again on the same store should
+    only simulate the scenarios which are not done yet, with the same results as a sweep without a store
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store_path = os.path.join(self.directory, 'store.sqlite')
+        self.scenarios = make_scenario_grid(['20150325'], ['VWO', 'BND'], ['B', 'S'], [12], ['MeanRev', 'Direct'],
+                                            [143000, 150000])
+        self.options = _get_options(False, False, None)
+        self.jobs = [(get_job_key(scenario._asdict(), self.options), scenario._asdict(), self.options)
+                     for scenario in self.scenarios]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_expected_executions(self):
+        return [run_scenario(scenario) for scenario in self.scenarios]
+
+    def test_job_keys(self):
+        keys = [key for key, scenario, options in self.jobs]
+        self.assertEqual(len(self.scenarios), len(set(keys)))
+        self.assertEqual(keys[0], get_job_key(self.scenarios[0]._asdict(), _get_options(False, False, None)))
+        self.assertNotEqual(keys[0], get_job_key(self.scenarios[0]._asdict(), _get_options(True, False, None)))
+        self.assertNotEqual(keys[0],
+                            get_job_key(self.scenarios[0]._asdict(), _get_options(False, False, {'lookback': 3})))
+
+    def test_job_keys_change_with_the_engine(self):
+        backtester_path = os.path.join('order_routing', 'backtester.py')
+        get_file_digest = simulation_store.get_file_digest
+
+        def get_modified_file_digest(path):
+            digest = get_file_digest(path)
+            return 'modified' + digest if path.endswith(backtester_path) else digest
+
+        key = get_job_key(self.scenarios[0]._asdict(), self.options)
+        with mock.patch.dict(simulation_store._code_versions, clear=True):  # Code versions are computed once
+            with mock.patch.object(simulation_store, 'get_file_digest', get_modified_file_digest):
+                self.assertNotEqual(key, get_job_key(self.scenarios[0]._asdict(), self.options))
+        with mock.patch.dict(simulation_store._code_versions, clear=True):
+            self.assertEqual(key, get_job_key(self.scenarios[0]._asdict(), self.options))
+
+    def test_claim(self):
+        key = self.jobs[0][0]
+        with SimulationStore(self.store_path) as store, SimulationStore(self.store_path) as other_store:
+            store.add_jobs(self.jobs)
+            self.assertEqual({'pending': len(self.jobs)}, store.get_status_counts())
+            self.assertTrue(store.claim(key, 'worker 1'))
+            self.assertFalse(other_store.claim(key, 'worker 2'))  # Running
+            store.complete(key, {'executions': [], 'error': None})
+            self.assertFalse(other_store.claim(key, 'worker 2'))  # Done
+            self.assertEqual({key: {'executions': [], 'error': None}}, other_store.get_results([key]))
+
+            store.add_jobs(self.jobs)  # Done jobs are kept
+            self.assertEqual({'done': 1, 'pending': len(self.jobs) - 1}, store.get_status_counts())
+            store.fail(key, 'error')
+            store.add_jobs(self.jobs)  # Failed jobs are retried
+            self.assertEqual({'pending': len(self.jobs)}, store.get_status_counts())
+
+    def test_stale_claim(self):
+        key = self.jobs[0][0]
+        with SimulationStore(self.store_path, stale_seconds=0.2) as store:
+            store.add_jobs(self.jobs)
+            self.assertTrue(store.claim(key, 'worker 1'))
+            self.assertFalse(store.claim(key, 'worker 2'))
+            time.sleep(0.3)  # The claim of worker 1 is stale, as if it had died
+            self.assertTrue(store.claim(key, 'worker 2'))
+
+    def test_claim_next(self):
+        with SimulationStore(self.store_path) as store, SimulationStore(self.store_path) as other_store:
+            store.add_jobs(self.jobs)
+            claimed_keys = []
+            for index in range(len(self.jobs)):
+                job = (store if index % 2 else other_store).claim_next('worker {}'.format(index % 2))
+                claimed_keys.append(job[0])
+            self.assertIsNone(store.claim_next('worker 0'))
+            self.assertEqual(sorted(key for key, scenario, options in self.jobs), sorted(claimed_keys))
+
+    def test_resume(self):
+        expected_executions = self.get_expected_executions()
+        self.assertTrue(all(expected_executions))
+
+        # Interrupted once the first chunk is done
+        sweep = run_sweep(self.scenarios, num_workers=0, chunk_size=3, store_path=self.store_path)
+        results = [next(sweep) for index in range(3)]
+        sweep.close()
+        self.assertFalse(any(result['cached'] for result in results))
+
+        for num_cached in [3, len(self.scenarios)]:
+            results = list(run_sweep(self.scenarios, num_workers=0, chunk_size=3, store_path=self.store_path))
+            self.assertEqual(num_cached, len([result for result in results if result['cached']]))
+            results.sort(key=lambda x: x['index'])
+            self.assertEqual(expected_executions, [result['executions'] for result in results])
+        with SimulationStore(self.store_path) as store:
+            self.assertEqual({'done': len(self.scenarios)}, store.get_status_counts())
+
+    def test_drain(self):
+        with SimulationStore(self.store_path) as store:
+            store.add_jobs(self.jobs)
+        self.assertEqual(len(self.jobs), drain_store(self.store_path))
+        self.assertEqual(0, drain_store(self.store_path))
+        with SimulationStore(self.store_path) as store:
+            results = store.get_results(key for key, scenario, options in self.jobs)
+        self.assertEqual(self.get_expected_executions(),
+                         [results[key]['executions'] for key, scenario, options in self.jobs])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from execution.simulation_sweep import make_scenario_grid
+from execution.vectorised_backtest import check_equivalence, run_vectorised_scenarios
+
+
+class VectorisedBacktestEquivalenceTest(unittest.TestCase):
+    '''
+    The vectorised backtest should give the same executions as the event driven simulation, on the sample minute bars
+    '''
+
+    def setUp(self):
+        self.scenarios = make_scenario_grid(['20150325'], ['VWO', 'BND'], ['B', 'S'], [12],
+                                            ['MeanRev', 'Momentum', 'Direct'], [0, 143000, 150000, 173500])
+
+    def assertNoMismatch(self, mismatches):
+        self.assertEqual([], mismatches)  # ( scenario, vectorised executions, event driven executions )
+
+    def test_default_parameters(self):
+        self.assertTrue(all(run_vectorised_scenarios(self.scenarios)))  # Every scenario executes on these bars
+        self.assertNoMismatch(check_equivalence(self.scenarios))
+
+    def test_integer_clock(self):
+        self.assertNoMismatch(check_equivalence(self.scenarios, integer_clock=True))
+
+    def test_merged_timeline(self):
+        self.assertNoMismatch(check_equivalence(self.scenarios, merged_timeline=True))
+
+    def test_algo_params(self):
+        algo_params = {'execution_window': 3600, 'threshold': 0.002, 'lookback': 3}
+        self.assertNoMismatch(check_equivalence(self.scenarios, algo_params=algo_params))
+
+
+if __name__ == '__main__':
+    unittest.main()
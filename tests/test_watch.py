@@ -0,0 +1,228 @@
+import datetime
+import random
+import unittest
+
+from cdefs.timer_queue import INFINITE_TIME, Timer, TimerQueue
+from cdefs.watch import IntegerClockWatch, Watch
+from mds_messages.periodic_bar_array import get_periodic_bar_timestamps
+from periodic_bar_fixtures import SAMPLE_DATE, make_multi_day_bars
+from utils.datetime_convertor import (get_custom_est_ref_unix_seconds_from_unix_seconds,
+                                      get_utc_datetime_from_unix_seconds)
+
+
+## @brief Listener of every kind of notification of the watch, which logs them with the time of the watch
+class RecordingListener(object):
+    def __init__(self, watch, name, log):
+        self.watch = watch
+        self.name = name
+        self.log = log
+
+    def record(self, kind, *args):
+        self.log.append((kind, self.name, self.watch.current_time, self.watch.current_date,
+                         self.watch.secs_since_midnight) + args)
+
+    def on_date_change(self, new_date):
+        self.record('date', new_date)
+
+    def on_daily_time_update(self, current_time):
+        self.record('daily', current_time)
+
+    def on_time_period_update(self, current_time):
+        self.record('period', current_time)
+
+    def on_timer_update(self, timer, current_time):
+        self.record('timer', current_time)
+
+
+## @brief Builds a watch with listeners of every kind, whose notifications are logged into log
+def make_watch(integer_clock, log):
+    watch = Watch.Create(SAMPLE_DATE, SAMPLE_DATE + datetime.timedelta(days=7), integer_clock)
+    watch.add_date_change_watch_listener(RecordingListener(watch, 'date', log))
+    for hhmmss in [0, 93000, 143000, 143000, 160000, 173500, 235959]:
+        watch.add_daily_watch_listener(hhmmss, RecordingListener(watch, 'daily {}'.format(hhmmss), log))
+    watch.short_duration_watch_listeners.append(RecordingListener(watch, 'short', log))
+    watch.long_duration_watch_listeners.append(RecordingListener(watch, 'long', log))
+    watch.add_daily_timer(150000, RecordingListener(watch, 'daily timer', log))
+    return watch
+
+
+class IntegerClockWatchTest(unittest.TestCase):
+    '''
+    IntegerClockWatch should give the same times, dates and notifications as the datetime watch
+    '''
+
+    def setUp(self):
+        timestamps = get_periodic_bar_timestamps(make_multi_day_bars('VWO', [0, 1, 2, 5, 6])).tolist()
+        # Events on both sides of the end of a trading date ( 22:00 UTC ), and on a saturday
+        date_end = timestamps[0] - 8 * 3600 - 60 + 22 * 3600  # The first bar is at 08:01 UTC
+        extra_timestamps = [date_end - 1, date_end, date_end + 1, date_end + 2 * 86400 + 4000]
+        self.timestamps = sorted(timestamps + extra_timestamps)
+
+    def run_watches(self, timestamps, add_timers=None):
+        logs = [[], []]
+        watches = [make_watch(False, logs[0]), make_watch(True, logs[1])]
+        self.assertIsInstance(watches[1], IntegerClockWatch)
+        for watch, log in zip(watches, logs):
+            if add_timers is not None:
+                add_timers(watch, log)
+        for timestamp in timestamps:
+            for watch, log in zip(watches, logs):
+                watch.on_new_market_event(
+                    timestamp if watch.integer_clock else get_utc_datetime_from_unix_seconds(timestamp))
+                log.append(
+                    ('event', watch.current_time, watch.current_date, watch.secs_since_midnight, watch.last_ref_time))
+            self.assertEqual(get_utc_datetime_from_unix_seconds(timestamp), watches[1].current_time)
+        for watch in watches:
+            watch.clear_pending_daily_watch_listeners()
+        self.assertEqual(logs[0], logs[1])
+        return logs[1]
+
+    def test_same_notifications(self):
+        log = self.run_watches(self.timestamps)
+        expected = [('date', 'date'), ('daily', 'daily 143000'), ('period', 'short'), ('period', 'long'),
+                    ('timer', 'daily timer')]
+        self.assertTrue(set(expected) <= set(entry[:2] for entry in log))
+        dates = [entry[5] for entry in log if entry[0] == 'date']
+        self.assertEqual([SAMPLE_DATE + datetime.timedelta(days=offset) for offset in [0, 1, 2, 3, 5, 6]], dates)
+
+    def test_same_timers(self):
+        def add_timers(watch, log):
+            watch.add_timer(self.timestamps[10], RecordingListener(watch, 'one-shot', log))
+            watch.add_periodic_timer(5400,
+                                     RecordingListener(watch, 'periodic', log),
+                                     first_fire_time=self.timestamps[0])
+
+        log = self.run_watches(self.timestamps, add_timers)
+        self.assertTrue(set(['one-shot', 'periodic']) <= set(entry[1] for entry in log if entry[0] == 'timer'))
+
+
+## @brief Timer listener which cancels timers of the watch once it was notified num_updates times
+class CancellingListener(RecordingListener):
+    def __init__(self, watch, name, log, num_updates, timers_to_cancel):
+        RecordingListener.__init__(self, watch, name, log)
+        self.num_updates = num_updates
+        self.timers_to_cancel = timers_to_cancel
+
+    def on_timer_update(self, timer, current_time):
+        RecordingListener.on_timer_update(self, timer, current_time)
+        self.num_updates -= 1
+        if self.num_updates == 0:
+            for timer_to_cancel in self.timers_to_cancel:
+                self.watch.cancel_timer(timer_to_cancel)
+
+
+class WatchTimerTest(unittest.TestCase):
+    '''
+    Timers should fire in time order, before the market event which reaches them, with the time of the watch set to
+    their fire time. Daily listeners fire before the timers of the same time, and timers of the same time fire in the
+    order they were added
+    '''
+
+    def setUp(self):
+        first_timestamp = get_periodic_bar_timestamps(make_multi_day_bars('VWO', [0]))[0].item()
+        self.ref_timestamp = get_custom_est_ref_unix_seconds_from_unix_seconds(first_timestamp)
+
+    def make_watch(self, integer_clock):
+        watch = Watch.Create(SAMPLE_DATE, SAMPLE_DATE + datetime.timedelta(days=7), integer_clock)
+        self.on_new_market_event(watch, 36000)  # Sets the date
+        return watch
+
+    def on_new_market_event(self, watch, secs_since_midnight):
+        timestamp = self.ref_timestamp + secs_since_midnight
+        watch.on_new_market_event(timestamp if watch.integer_clock else get_utc_datetime_from_unix_seconds(timestamp))
+
+    def get_fired(self, log):
+        return [(name, secs_since_midnight, current_date)
+                for kind, name, current_time, current_date, secs_since_midnight, notified_time in log if kind != 'date']
+
+    def test_fire_order(self):
+        for integer_clock in [False, True]:
+            log = []
+            watch = self.make_watch(integer_clock)
+            watch.add_timer(self.ref_timestamp + 50400, RecordingListener(watch, 'A', log))
+            watch.add_daily_watch_listener(140000, RecordingListener(watch, 'daily', log))  # 50400 secs
+            watch.add_timer(self.ref_timestamp + 50400, RecordingListener(watch, 'B', log))
+            watch.add_timer(self.ref_timestamp + 40000, RecordingListener(watch, 'early', log))
+            watch.add_periodic_timer(3000,
+                                     RecordingListener(watch, 'periodic', log),
+                                     first_fire_time=self.ref_timestamp + 40000)
+            cancelled_timer = watch.add_timer(self.ref_timestamp + 45000, RecordingListener(watch, 'cancelled', log))
+            watch.cancel_timer(cancelled_timer)
+            self.on_new_market_event(watch, 40000)
+            log.append(
+                ('event', 'event 40000', watch.current_time, watch.current_date, watch.secs_since_midnight, None))
+            self.on_new_market_event(watch, 56000)
+
+            self.assertEqual([('early', 40000), ('periodic', 40000), ('event 40000', 40000), ('periodic', 43000),
+                              ('periodic', 46000), ('periodic', 49000), ('daily', 50400), ('A', 50400), ('B', 50400),
+                              ('periodic', 52000), ('periodic', 55000)],
+                             [(name, secs_since_midnight)
+                              for name, secs_since_midnight, current_date in self.get_fired(log)])
+            for kind, name, current_time, current_date, secs_since_midnight, notified_time in log:
+                self.assertEqual(get_utc_datetime_from_unix_seconds(self.ref_timestamp + secs_since_midnight),
+                                 current_time)
+            self.assertEqual(self.ref_timestamp + 58000, watch.next_timer_timestamp)
+
+    def test_cancel_from_listener(self):
+        for integer_clock in [False, True]:
+            log = []
+            watch = self.make_watch(integer_clock)
+            other_timer = watch.add_timer(self.ref_timestamp + 43000, RecordingListener(watch, 'other', log))
+            periodic_timer = watch.add_periodic_timer(1000, None, first_fire_time=self.ref_timestamp + 40000)
+            periodic_timer.listener = CancellingListener(watch, 'periodic', log, 3, [periodic_timer, other_timer])
+            self.on_new_market_event(watch, 50000)
+            self.assertEqual([('periodic', 40000), ('periodic', 41000), ('periodic', 42000)],
+                             [(name, secs_since_midnight)
+                              for name, secs_since_midnight, current_date in self.get_fired(log)])
+            self.assertEqual(INFINITE_TIME, watch.next_timer_timestamp)
+            self.assertEqual(0, len(watch.timer_queue))
+
+    def test_timers_around_date_change(self):
+        for integer_clock in [False, True]:
+            log = []
+            watch = self.make_watch(integer_clock)
+            watch.add_date_change_watch_listener(RecordingListener(watch, 'date', log))
+            watch.add_timer(self.ref_timestamp + 80000, RecordingListener(watch, 'old date', log))
+            watch.add_timer(self.ref_timestamp + 86400 + 100, RecordingListener(watch, 'new date', log))
+            watch.add_daily_timer(10000, RecordingListener(watch, 'daily timer', log))  # 3600 secs, past
+            self.on_new_market_event(watch, 86400 + 20000)
+            self.assertEqual([('old date', 80000, SAMPLE_DATE), ('date', 0, SAMPLE_DATE + datetime.timedelta(1)),
+                              ('new date', 100, SAMPLE_DATE + datetime.timedelta(1)),
+                              ('daily timer', 3600, SAMPLE_DATE + datetime.timedelta(1))],
+                             [(name, secs_since_midnight, current_date)
+                              for kind, name, current_time, current_date, secs_since_midnight, notified_time in log])
+
+
+class TimerQueueTest(unittest.TestCase):
+    '''
+    TimerQueue should pop the timers which are not cancelled in ( fire time, push order ), like a sorted list
+    '''
+
+    def test_against_sorted_list(self):
+        generator = random.Random(7)
+        queue = TimerQueue()
+        pushed = []  # ( fire time, push order, timer ) of the timers in the queue
+        for step in range(5000):
+            action = generator.random()
+            if action < 0.5:
+                timer = Timer(generator.randint(0, 100), None)
+                queue.push(timer)
+                pushed.append((timer.fire_time, step, timer))
+            elif action < 0.8 and pushed:
+                timer = generator.choice(pushed)[2]
+                queue.cancel(timer)
+                queue.cancel(timer)  # Cancelling twice is harmless
+                pushed = [entry for entry in pushed if entry[2] is not timer]
+            else:
+                pushed.sort(key=lambda x: x[:2])
+                self.assertEqual(pushed[0][0] if pushed else INFINITE_TIME, queue.top_time())
+                timer = queue.pop()
+                self.assertIs(pushed.pop(0)[2] if pushed else None, timer)
+                if timer is not None:
+                    queue.cancel(timer)  # Fired timers only get flagged
+            self.assertEqual(len(pushed), len(queue))
+            self.assertEqual(sum(entry[2].cancelled for entry in queue._data), queue.num_cancelled)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,19 @@
+import numpy
+import calendar
+import numbers
 import time
 import pytz
 import datetime
 
+EST_TZ = pytz.timezone( "EST" )  # tz objects are built once instead of on every conversion
+UTC_TZ = pytz.timezone( 'UTC' )
+
 ## @brief Get EST trading date from unix timestamp based on the custom definition
 #  Custom Trading date definition :  6PM EST YDAY to 4PM EST TODAY is TODAY
 #
 def get_custom_est_date_from_unix_timestamp( UTCTime ):
     UTC_date = UTCTime.date( )
-    custom_time = datetime.datetime.combine( UTC_date, datetime.time( 17, 0, tzinfo = pytz.timezone( "EST" ) ) ).astimezone( pytz.timezone( 'UTC' ) )
+    custom_time = datetime.datetime.combine( UTC_date, datetime.time( 17, 0, tzinfo = EST_TZ ) ).astimezone( UTC_TZ )
     if custom_time > UTCTime:
         return UTC_date
     else:
@@ -18,10 +24,10 @@ def get_custom_est_date_from_unix_timestamp( UTCTime ):
 #
 def get_custom_est_ref_time_from_unix_timestamp( UTCTime ):
     UTC_date = UTCTime.date( )
-    custom_time = datetime.datetime.combine( UTC_date, datetime.time( 17, 30, tzinfo = pytz.timezone( "EST" ) ) ).astimezone( pytz.timezone( 'UTC' ) )
+    custom_time = datetime.datetime.combine( UTC_date, datetime.time( 17, 30, tzinfo = EST_TZ ) ).astimezone( UTC_TZ )
     if custom_time > UTCTime:
         new_UTC_date = UTC_date - datetime.timedelta( days = 1 )
-        return datetime.datetime.combine( new_UTC_date, datetime.time( 17, 30, tzinfo = pytz.timezone( "EST" ) ) ).astimezone( pytz.timezone( 'UTC' ) )
+        return datetime.datetime.combine( new_UTC_date, datetime.time( 17, 30, tzinfo = EST_TZ ) ).astimezone( UTC_TZ )
     else:
         return custom_time
 
@@ -29,7 +35,8 @@ def get_custom_est_ref_time_from_unix_timestamp( UTCTime ):
 #  start of day unix timestamp corresponding to this trading date
 #
 def get_custom_est_midnight_time_from_date( this_date ):
-    attempt_1 = datetime.datetime.combine( this_date - datetime.timedelta( days = 1 ), datetime.time( 17, 30, tzinfo = pytz.timezone( "EST" ) ) ).astimezone( pytz.timezone( 'UTC' ) )
+    attempt_1 = datetime.datetime.combine( this_date - datetime.timedelta( days = 1 ),
+                                           datetime.time( 17, 30, tzinfo = EST_TZ ) ).astimezone( UTC_TZ )
     return attempt_1  # added to remove warning
 
 ## @brief Given a timezone and a hhmm in that timezone,
@@ -37,14 +44,119 @@ def get_custom_est_midnight_time_from_date( this_date ):
 #  on our definition of date 
 #
 def get_secs_from_midnight( this_date, hhmm, tz ):
-    utc_datetime = datetime.datetime.combine( this_date, datetime.time( 17, 0, tzinfo = pytz.timezone( "UTC" ) ) )
+    utc_datetime = datetime.datetime.combine( this_date, datetime.time( 17, 0, tzinfo = UTC_TZ ) )
     hhmmss_utc = utc_datetime.hour * 10000 + utc_datetime.minute * 100 + utc_datetime.second
-    return ( ( hhmmss_utc % 100 ) + 60 * ( ( hhmmss_utc / 100 ) % 100 ) + 3600 * ( ( hhmmss_utc / 10000 ) % 100 ) )
+    return ( ( hhmmss_utc % 100 ) + 60 * ( ( hhmmss_utc // 100 ) % 100 ) + 3600 * ( ( hhmmss_utc // 10000 ) % 100 ) )
 
 def get_custom_est_secs_from_midnight( this_date, hhmm, tz ):
-    this_time = datetime.datetime.combine( this_date , datetime.time( hhmm / 100, hhmm % 100, tzinfo = tz ) ).astimezone( pytz.timezone( 'UTC' ) )
+    this_time = datetime.datetime.combine( this_date , datetime.time( hhmm // 100, hhmm % 100, tzinfo = tz ) )
+    this_time = this_time.astimezone( UTC_TZ )
     custom_est_ref_time = get_custom_est_ref_time_from_unix_timestamp( this_time )
     return ( this_time - custom_est_ref_time ).total_seconds( )
 
 def get_unix_timestamp_from_hhmm_tz( this_date, hhmm, tz ):
-    return datetime.datetime.combine( this_date , datetime.time( hhmm / 100, hhmm % 100, tzinfo = tz ) ).astimezone( pytz.timezone( 'UTC' ) )
+    this_time = datetime.datetime.combine( this_date , datetime.time( hhmm // 100, hhmm % 100, tzinfo = tz ) )
+    return this_time.astimezone( UTC_TZ )
+
+## @brief Returns the tz aware UTC datetime for a unix timestamp in seconds
+def get_utc_datetime_from_unix_seconds( unix_seconds ):
+    return datetime.datetime.fromtimestamp( unix_seconds, pytz.UTC )
+
+## @brief Returns the unix timestamp in seconds of a tz aware datetime ( microseconds are dropped )
+def get_unix_seconds_from_datetime( this_datetime ):
+    return calendar.timegm( this_datetime.utctimetuple( ) )
+
+## @brief Array version of get_custom_est_date_from_unix_timestamp
+#  Custom Trading date definition :  6PM EST YDAY to 4PM EST TODAY is TODAY, i.e. the date rolls at 17:00 EST
+#  ( 22:00 UTC )
+#
+#  @param unix_seconds int64 array of seconds since epoch
+#  @return datetime64[D] array of trading dates
+#
+def get_custom_est_dates_from_unix_seconds( unix_seconds ):
+    return ( ( numpy.asarray( unix_seconds, dtype = numpy.int64 ) + 7200 ) // 86400 ).astype( 'datetime64[D]' )
+
+_custom_est_ref_seconds = { }  # UTC days since epoch -> unix seconds of 17:30 EST on that UTC date
+# ( trading date, hhmm, tz name ) -> secs from midnight, see get_custom_est_session_secs_from_midnight
+_custom_est_session_secs = { }
+
+## @brief Unix seconds of 17:30 EST on a UTC date given as days since epoch, i.e. the candidate reference time
+#  of get_custom_est_ref_time_from_unix_timestamp for all the timestamps of that UTC date. Computed once per date.
+#
+def get_custom_est_ref_unix_seconds_from_utc_day( utc_day ):
+    if utc_day not in _custom_est_ref_seconds:
+        utc_date = datetime.date( 1970, 1, 1 ) + datetime.timedelta( days = utc_day )
+        custom_time = datetime.datetime.combine( utc_date, datetime.time( 17, 30, tzinfo = EST_TZ ) )
+        _custom_est_ref_seconds[ utc_day ] = get_unix_seconds_from_datetime( custom_time )
+    return _custom_est_ref_seconds[ utc_day ]
+
+## @brief Array version of get_custom_est_ref_time_from_unix_timestamp
+#  Looks up a per UTC date table of reference times covering the range of the timestamps
+#
+#  @param unix_seconds int64 array of seconds since epoch
+#  @return int64 array of the unix seconds of the reference time ( "midnight" ) of each timestamp
+#
+def get_custom_est_ref_times_from_unix_seconds( unix_seconds ):
+    seconds = numpy.asarray( unix_seconds, dtype = numpy.int64 )
+    if seconds.size == 0:
+        return numpy.zeros( seconds.shape, dtype = numpy.int64 )
+    utc_days = seconds // 86400
+    first_day = int( utc_days.min( ) ) - 1  # The reference time can be on the previous UTC date
+    ref_seconds = numpy.array( [ get_custom_est_ref_unix_seconds_from_utc_day( day )
+                                 for day in range( first_day, int( utc_days.max( ) ) + 1 ) ], dtype = numpy.int64 )
+    same_day_ref_seconds = ref_seconds[ utc_days - first_day ]
+    return numpy.where( same_day_ref_seconds > seconds, ref_seconds[ utc_days - first_day - 1 ], same_day_ref_seconds )
+
+## @brief Array version of the seconds since the custom EST reference time ( as tracked by Watch.secs_since_midnight )
+def get_custom_est_secs_from_midnight_from_unix_seconds( unix_seconds ):
+    seconds = numpy.asarray( unix_seconds, dtype = numpy.int64 )
+    return seconds - get_custom_est_ref_times_from_unix_seconds( seconds )
+
+## @brief Annotates timestamps with the custom EST trading calendar in one pass
+#  @param unix_seconds int64 array of seconds since epoch
+#  @return ( trading dates as datetime64[D], reference times as int64 unix seconds, int64 secs from midnight )
+#
+def get_custom_est_trading_calendar_from_unix_seconds( unix_seconds ):
+    seconds = numpy.asarray( unix_seconds, dtype = numpy.int64 )
+    ref_times = get_custom_est_ref_times_from_unix_seconds( seconds )
+    return get_custom_est_dates_from_unix_seconds( seconds ), ref_times, seconds - ref_times
+
+## @brief Cached get_custom_est_secs_from_midnight, for session boundaries which are looked up every trading date
+def get_custom_est_session_secs_from_midnight( this_date, hhmm, tz ):
+    key = ( this_date, hhmm, tz.zone )
+    if key not in _custom_est_session_secs:
+        _custom_est_session_secs[ key ] = get_custom_est_secs_from_midnight( this_date, hhmm, tz )
+    return _custom_est_session_secs[ key ]
+
+_custom_est_date_ends = { }  # trading date -> unix seconds from which the custom trading date is the next date
+
+## @brief Unix seconds of 5PM EST on this_date, the first time whose custom trading date is after this_date
+def get_custom_est_date_end_unix_seconds( this_date ):
+    if this_date not in _custom_est_date_ends:
+        custom_time = datetime.datetime.combine( this_date, datetime.time( 17, 0, tzinfo = EST_TZ ) )
+        _custom_est_date_ends[ this_date ] = get_unix_seconds_from_datetime( custom_time )
+    return _custom_est_date_ends[ this_date ]
+
+## @brief get_custom_est_date_from_unix_timestamp for integer unix seconds, without building any datetime
+def get_custom_est_date_from_unix_seconds( unix_seconds ):
+    utc_date = datetime.date( 1970, 1, 1 ) + datetime.timedelta( days = unix_seconds // 86400 )
+    if unix_seconds < get_custom_est_date_end_unix_seconds( utc_date ):
+        return utc_date
+    else:
+        return ( utc_date + datetime.timedelta( days = 1 ) )
+
+## @brief get_custom_est_ref_time_from_unix_timestamp for integer unix seconds, returns the reference time as unix
+#  seconds
+def get_custom_est_ref_unix_seconds_from_unix_seconds( unix_seconds ):
+    utc_day = unix_seconds // 86400
+    ref_seconds = get_custom_est_ref_unix_seconds_from_utc_day( utc_day )
+    if ref_seconds > unix_seconds:
+        return get_custom_est_ref_unix_seconds_from_utc_day( utc_day - 1 )
+    else:
+        return ref_seconds
+
+## @brief Unix seconds of a time given either as unix seconds or as a tz aware datetime
+def get_unix_seconds( this_time ):
+    if isinstance( this_time, numbers.Integral ):
+        return this_time
+    return get_unix_seconds_from_datetime( this_time )